@@ -0,0 +1,119 @@
+# puts the weather tables on the hourly utc_timestamp grid of the power data
+# the report truncated both sides to days and intersected them with isin(), which only lines up if both frames happen
+# to be in the same order, here every station is resampled onto the power grid on its own (interpolated between the
+# term values or carried forward, as-of) and the stations are averaged per hour, nationally and per TSO zone
+#
+# all timestamps are converted to UTC first, the DWD timestamps are UTC (weather_timezone), the power grid is
+# utc_timestamp, cet_cest_timestamp is carried along for analyses in local time
+
+import numpy
+import pandas
+import sqlalchemy
+
+# How every weather column is put on the grid, "interpolate" (linear in time) or "asof" (last value before the hour),
+# directions, codes and daily sums can't be interpolated
+methods: dict[str, dict[str, str]] = {
+    "rain_data": {"rain": "asof", "rain_form": "asof", "snow_height": "asof", "new_snow_height": "asof"},
+    "cloud_data": {"cloud_cover": "interpolate", "cloud_cover_form": "asof"},
+    "temperature_data": {"temperature": "interpolate", "humidity": "interpolate"},
+    "wind_data": {"direction": "asof", "speed": "interpolate"},
+}
+
+weather_timezone: str = "UTC"
+
+# Longest gap between two term values that is interpolated and the oldest value used as-of, the subdaily sources
+# measure at 6, 13 and 20 UTC, a daily value covers its (UTC) day
+max_gap: dict[bool, pandas.Timedelta] = {True: pandas.Timedelta(hours=12), False: pandas.Timedelta(days=1)}
+
+
+def to_utc(timestamps, timezone: str) -> numpy.ndarray:
+    # Naive timestamps in the given time zone to UTC nanoseconds
+    index = pandas.DatetimeIndex(timestamps)
+    if index.tz is None:
+        index = index.tz_localize(timezone, ambiguous="NaT", nonexistent="NaT")
+    return index.tz_convert("UTC").tz_localize(None).asi8
+
+
+def asof(times: numpy.ndarray, values: numpy.ndarray, grid: numpy.ndarray, tolerance: int) -> numpy.ndarray:
+    # Last value at or before every grid point, NaN if there is none within the tolerance (times sorted ascending)
+    left = numpy.searchsorted(times, grid, side="right") - 1
+    valid = left >= 0
+    left = numpy.where(valid, left, 0)
+    valid &= grid - times[left] < tolerance
+    return numpy.where(valid, values[left], numpy.nan)
+
+
+def interpolate(times: numpy.ndarray, values: numpy.ndarray, grid: numpy.ndarray, gap: int) -> numpy.ndarray:
+    # Linear between the values around every grid point, NaN outside the data and across gaps longer than gap
+    if len(times) < 2:
+        return numpy.where(grid == times[0], values[0], numpy.nan) if len(times) else numpy.full(len(grid), numpy.nan)
+    right = numpy.clip(numpy.searchsorted(times, grid, side="right"), 1, len(times) - 1)
+    left = right - 1
+
+    span = times[right] - times[left]
+    with numpy.errstate(invalid="ignore", divide="ignore"):  # duplicate timestamps, masked below
+        interpolated = values[left] + (grid - times[left]) / span * (values[right] - values[left])
+
+    inside = (times[left] < grid) & (grid < times[right]) & (span <= gap)
+    return numpy.where(grid == times[left], values[left],
+                       numpy.where(grid == times[right], values[right], numpy.where(inside, interpolated, numpy.nan)))
+
+
+def align_station(data_frame: pandas.DataFrame, grid: numpy.ndarray, columns: dict[str, str],
+                  gap: pandas.Timedelta) -> dict[str, numpy.ndarray]:
+    # One station, sorted by date, every column on the grid
+    times: numpy.ndarray = to_utc(data_frame["date"], weather_timezone)
+    aligned: dict[str, numpy.ndarray] = {}
+    for column, method in columns.items():
+        values = data_frame[column].to_numpy(dtype="float64", na_value=numpy.nan)
+        present = ~numpy.isnan(values) & (times != pandas.NaT.value)
+        if method == "interpolate":
+            aligned[column] = interpolate(times[present], values[present], grid, gap.value)
+        else:
+            aligned[column] = asof(times[present], values[present], grid, gap.value)
+    return aligned
+
+
+def align_table(engine: sqlalchemy.Engine, table_name: str, grid: numpy.ndarray, hourly: bool,
+                zones: pandas.DataFrame | None = None) -> pandas.DataFrame:
+    # Mean over all stations per grid point and, with zones (station_id, zone, weight), the weighted mean per zone
+    columns: dict[str, str] = methods[table_name]
+    gap: pandas.Timedelta = max_gap[hourly]
+    start, end = pandas.Timestamp(grid[0]) - gap, pandas.Timestamp(grid[-1]) + gap
+
+    station_zones: dict[int, tuple[str, float]] = {}
+    if zones is not None:
+        station_zones = {int(row.station_id): (row.zone, float(row.weight)) for row in zones.itertuples()}
+    groups: list[str] = [""] + sorted({zone for zone, _ in station_zones.values()})
+    sums = {(group, column): numpy.zeros(len(grid)) for group in groups for column in columns}
+    weights = {(group, column): numpy.zeros(len(grid)) for group in groups for column in columns}
+
+    selected: str = ", ".join(f'"{column}"' for column in ["date", *columns])
+    query = sqlalchemy.text(f'SELECT {selected} FROM "{table_name}" WHERE station_id = :station_id '
+                            f'AND date BETWEEN :start AND :end ORDER BY date')
+    with engine.connect() as connection:
+        station_ids = [row[0] for row in connection.exec_driver_sql(f'SELECT DISTINCT station_id FROM "{table_name}"')]
+        # The (station_id, date) index answers one station at a time, only one station is in memory at once
+        for station_id in station_ids:
+            data_frame = pandas.read_sql_query(query, connection, params={
+                "station_id": station_id, "start": str(start), "end": str(end)
+            }, parse_dates=["date"])
+            if data_frame.empty:
+                continue
+
+            aligned: dict[str, numpy.ndarray] = align_station(data_frame, grid, columns, gap)
+            targets: list[tuple[str, float]] = [("", 1.0)]
+            if station_id in station_zones:
+                targets.append(station_zones[station_id])
+            for column, values in aligned.items():
+                present = ~numpy.isnan(values)
+                for group, weight in targets:
+                    sums[group, column][present] += weight * values[present]
+                    weights[group, column][present] += weight
+
+    result: dict[str, numpy.ndarray] = {}
+    for (group, column), total in sums.items():
+        name: str = f"DE_{group}_{column}" if group else column
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            result[name] = (total / weights[group, column]).astype("float32")
+    return pandas.DataFrame(result)
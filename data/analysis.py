@@ -0,0 +1,251 @@
+# correlation, lagged cross-correlation and polynomial fits between weather and generation columns
+# everything is computed from sums (counts, powers of x, x^k * y, y^2) per column pair, which are collected chunk by
+# chunk in one pass and can be added up, so tables of any length are scanned without loading them, and blocks of
+# columns are scanned by separate processes
+#
+# example:
+#   engine = database.create_engine("../data/processed_data/transformed_data.sqlite")
+#   moments, lagged = analysis.analyze(engine, lags=range(-24, 25))
+#   moments.correlation()                                        weather x generation
+#   moments.fit("speed", "DE_wind_generation_actual", degree=3)  coefficients like numpy.polyfit and R^2
+#   lagged.cross_correlation("speed", "DE_wind_generation_actual")
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy
+import pandas
+import sqlalchemy
+
+import align
+import database
+
+# Rows read at once per process
+chunk_size: int = 100_000
+
+# Processes scanning column blocks (None uses all cores)
+analysis_workers: int | None = None
+
+generation_pattern: str = r"^DE_.*_generation_actual$"
+
+
+@dataclass
+class PairMoments:
+    # Sums over the rows where both columns of a pair have a value, x and y are shifted by a constant (roughly their
+    # mean) first, that keeps the sums of powers small and the results exact enough
+    x_columns: list[str]
+    y_columns: list[str]
+    degree: int = 1
+    x_shift: numpy.ndarray | None = None
+    y_shift: numpy.ndarray | None = None
+    x_powers: numpy.ndarray = field(init=False)   # (2 * degree + 1, x, y) sums of x^k, k = 0 is the count
+    xy_powers: numpy.ndarray = field(init=False)  # (degree + 1, x, y) sums of x^k * y
+    y_squares: numpy.ndarray = field(init=False)  # (x, y) sums of y^2
+
+    def __post_init__(self):
+        shape: tuple[int, int] = (len(self.x_columns), len(self.y_columns))
+        self.x_shift = numpy.zeros(shape[0]) if self.x_shift is None else numpy.asarray(self.x_shift, dtype="float64")
+        self.y_shift = numpy.zeros(shape[1]) if self.y_shift is None else numpy.asarray(self.y_shift, dtype="float64")
+        self.x_powers = numpy.zeros((2 * self.degree + 1, *shape))
+        self.xy_powers = numpy.zeros((self.degree + 1, *shape))
+        self.y_squares = numpy.zeros(shape)
+
+    def update(self, x: numpy.ndarray, y: numpy.ndarray):
+        # x and y are (rows, columns) float arrays of the same rows, NaN is a missing value
+        x, y = x - self.x_shift, y - self.y_shift
+        x_present, y_present = ~numpy.isnan(x), ~numpy.isnan(y)
+        x, y = numpy.where(x_present, x, 0.0), numpy.where(y_present, y, 0.0)
+
+        y_mask: numpy.ndarray = y_present.astype("float64")
+        power: numpy.ndarray = x_present.astype("float64")
+        self.y_squares += power.T @ (y * y)
+        for k in range(2 * self.degree + 1):
+            self.x_powers[k] += power.T @ y_mask
+            if k <= self.degree:
+                self.xy_powers[k] += power.T @ y
+            power = power * x
+
+    def __add__(self, other: "PairMoments") -> "PairMoments":
+        # Moments of disjoint rows, e.g. two chunks or two time ranges
+        if (self.x_columns, self.y_columns, self.degree) != (other.x_columns, other.y_columns, other.degree) \
+                or not (numpy.array_equal(self.x_shift, other.x_shift) and numpy.array_equal(self.y_shift, other.y_shift)):
+            raise ValueError("Only moments of the same columns, degree and shifts can be added")
+        merged = PairMoments(self.x_columns, self.y_columns, self.degree, self.x_shift, self.y_shift)
+        merged.x_powers = self.x_powers + other.x_powers
+        merged.xy_powers = self.xy_powers + other.xy_powers
+        merged.y_squares = self.y_squares + other.y_squares
+        return merged
+
+    @classmethod
+    def concat(cls, blocks: list["PairMoments"]) -> "PairMoments":
+        # Moments of the same rows for different x columns (the blocks scanned by different processes)
+        merged = cls([column for block in blocks for column in block.x_columns], blocks[0].y_columns, blocks[0].degree,
+                     numpy.concatenate([block.x_shift for block in blocks]), blocks[0].y_shift)
+        merged.x_powers = numpy.concatenate([block.x_powers for block in blocks], axis=1)
+        merged.xy_powers = numpy.concatenate([block.xy_powers for block in blocks], axis=1)
+        merged.y_squares = numpy.concatenate([block.y_squares for block in blocks], axis=0)
+        return merged
+
+    def counts(self) -> pandas.DataFrame:
+        return pandas.DataFrame(self.x_powers[0].astype("int64"), index=self.x_columns, columns=self.y_columns)
+
+    def correlation(self) -> pandas.DataFrame:
+        # Pearson correlation of every pair, NaN where a column is constant or there are less than two rows
+        n, sx, sxx = self.x_powers[0], self.x_powers[1], self.x_powers[2]
+        sy, sxy, syy = self.xy_powers[0], self.xy_powers[1], self.y_squares
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            r = (n * sxy - sx * sy) / numpy.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+        return pandas.DataFrame(numpy.clip(r, -1, 1), index=self.x_columns, columns=self.y_columns)
+
+    def fit(self, x_column: str, y_column: str, degree: int | None = None) -> tuple[numpy.ndarray, float]:
+        # Least squares polynomial y = p(x) from the normal equations, coefficients highest power first (like
+        # numpy.polyfit) and the coefficient of determination
+        degree = self.degree if degree is None else degree
+        if degree > self.degree:
+            raise ValueError(f"Moments were collected for polynomials up to degree {self.degree}")
+        i, j = self.x_columns.index(x_column), self.y_columns.index(y_column)
+
+        powers: numpy.ndarray = self.x_powers[:2 * degree + 1, i, j]
+        normal = numpy.array([[powers[a + b] for b in range(degree + 1)] for a in range(degree + 1)])
+        right: numpy.ndarray = self.xy_powers[:degree + 1, i, j]
+        coefficients = numpy.linalg.lstsq(normal, right, rcond=None)[0]
+
+        n, sy, syy = powers[0], right[0], self.y_squares[i, j]
+        residual: float = syy - 2 * coefficients @ right + coefficients @ normal @ coefficients
+        total: float = syy - sy ** 2 / n if n > 0 else 0.0
+        r_squared: float = 1 - residual / total if total > 0 else numpy.nan
+
+        # Undo the shifts: p(x) = q(x - x_shift) + y_shift
+        shifted = numpy.polynomial.Polynomial(coefficients)(numpy.polynomial.Polynomial([-self.x_shift[i], 1.0]))
+        return (shifted + self.y_shift[j]).coef[::-1], r_squared
+
+    def fits(self, degree: int | None = None) -> pandas.DataFrame:
+        # R^2 of the fit of every pair
+        return pandas.DataFrame([[self.fit(x_column, y_column, degree)[1] for y_column in self.y_columns]
+                                 for x_column in self.x_columns], index=self.x_columns, columns=self.y_columns)
+
+
+@dataclass
+class LaggedMoments:
+    # PairMoments of x(t) and y(t + lag) for every lag (in rows, aligned_data has one row per hour), the last rows of
+    # a chunk are kept so pairs spanning two chunks are counted once
+    x_columns: list[str]
+    y_columns: list[str]
+    lags: list[int]
+    x_shift: numpy.ndarray | None = None
+    y_shift: numpy.ndarray | None = None
+    moments: dict[int, PairMoments] = field(init=False)
+    _history: tuple[numpy.ndarray, numpy.ndarray] | None = field(init=False, default=None)
+
+    def __post_init__(self):
+        self.lags = list(self.lags)
+        self.moments = {lag: PairMoments(self.x_columns, self.y_columns, 1, self.x_shift, self.y_shift)
+                        for lag in self.lags}
+
+    def update(self, x: numpy.ndarray, y: numpy.ndarray, history: bool = False):
+        # Rows in time order following the previous update, with history the rows only precede the next update
+        # (the overlap of a time range scanned by another process)
+        if self._history is not None:
+            x, y = numpy.concatenate([self._history[0], x]), numpy.concatenate([self._history[1], y])
+            start: int = len(self._history[0])
+        else:
+            start = 0
+        if history:
+            start = len(x)
+
+        # Every pair is counted when its later row comes in
+        end: int = len(x)
+        for lag, moments in self.moments.items():
+            first: int = max(start, abs(lag))
+            if first >= end:
+                continue
+            if lag >= 0:
+                moments.update(x[first - lag:end - lag], y[first:end])
+            else:
+                moments.update(x[first:end], y[first + lag:end + lag])
+
+        keep: int = max((abs(lag) for lag in self.lags), default=0)
+        self._history = (x[len(x) - keep:], y[len(y) - keep:]) if keep else None
+
+    def __add__(self, other: "LaggedMoments") -> "LaggedMoments":
+        merged = LaggedMoments(self.x_columns, self.y_columns, self.lags, self.x_shift, self.y_shift)
+        merged.moments = {lag: self.moments[lag] + other.moments[lag] for lag in self.lags}
+        return merged
+
+    @classmethod
+    def concat(cls, blocks: list["LaggedMoments"]) -> "LaggedMoments":
+        merged = cls([column for block in blocks for column in block.x_columns], blocks[0].y_columns, blocks[0].lags,
+                     numpy.concatenate([block.x_shift for block in blocks]), blocks[0].y_shift)
+        merged.moments = {lag: PairMoments.concat([block.moments[lag] for block in blocks]) for lag in merged.lags}
+        return merged
+
+    def correlation(self, lag: int = 0) -> pandas.DataFrame:
+        return self.moments[lag].correlation()
+
+    def cross_correlation(self, x_column: str, y_column: str) -> pandas.Series:
+        # Correlation per lag, a maximum at a positive lag means y follows x
+        return pandas.Series({lag: moments.correlation().loc[x_column, y_column] for lag, moments in self.moments.items()},
+                             name=f"{x_column} ~ {y_column}").rename_axis("lag")
+
+
+def default_columns(engine: sqlalchemy.Engine, table_name: str) -> tuple[list[str], list[str]]:
+    # The weather columns (national and per zone, see align.py) and the generation columns of the power data
+    weather: set[str] = {column for columns in align.methods.values() for column in columns}
+    names: list[str] = [column["name"] for column in sqlalchemy.inspect(engine).get_columns(table_name)]
+    x_columns: list[str] = [name for name in names
+                            if name in weather or (name.startswith("DE_") and name.split("_", 2)[-1] in weather)]
+    y_columns: list[str] = [name for name in names if re.match(generation_pattern, name)]
+    return x_columns, y_columns
+
+
+def _scan(url: str, table_name: str, order_column: str, x_columns: list[str], y_columns: list[str], lags: list[int],
+          degree: int, x_shift: numpy.ndarray, y_shift: numpy.ndarray) -> tuple[PairMoments, LaggedMoments]:
+    # One pass over the table for a block of x columns, runs in a worker process
+    engine = database.create_engine(url)
+    moments = PairMoments(x_columns, y_columns, degree, x_shift, y_shift)
+    lagged = LaggedMoments(x_columns, y_columns, lags, x_shift, y_shift)
+
+    selected: str = ", ".join(f'"{column}"' for column in x_columns + y_columns)
+    try:
+        with engine.connect() as connection:
+            query = f'SELECT {selected} FROM "{table_name}" ORDER BY "{order_column}"'
+            for chunk in pandas.read_sql_query(sqlalchemy.text(query), connection, chunksize=chunk_size):
+                x = chunk[x_columns].to_numpy(dtype="float64", na_value=numpy.nan)
+                y = chunk[y_columns].to_numpy(dtype="float64", na_value=numpy.nan)
+                moments.update(x, y)
+                lagged.update(x, y)
+    finally:
+        engine.dispose()
+    return moments, lagged
+
+
+def analyze(engine: sqlalchemy.Engine, x_columns: list[str] | None = None, y_columns: list[str] | None = None,
+            table_name: str = "aligned_data", order_column: str = "utc_timestamp", lags=(0,), degree: int = 3,
+            workers: int | None = analysis_workers) -> tuple[PairMoments, LaggedMoments]:
+    # Moments of every x column with every y column, the x columns are split into one block per process
+    default_x, default_y = default_columns(engine, table_name) if x_columns is None or y_columns is None else ([], [])
+    x_columns = x_columns if x_columns is not None else default_x
+    y_columns = y_columns if y_columns is not None else default_y
+
+    # The means as shifts, sqlite computes them without a pass in python
+    columns: list[str] = x_columns + y_columns
+    averages: str = ", ".join(f'AVG("{column}")' for column in columns)
+    with engine.connect() as connection:
+        means = connection.exec_driver_sql(f'SELECT {averages} FROM "{table_name}"').one() if columns else ()
+    shifts = numpy.array([mean if mean is not None else 0.0 for mean in means], dtype="float64")
+    x_shift, y_shift = shifts[:len(x_columns)], shifts[len(x_columns):]
+
+    blocks: int = max(min(workers or os.cpu_count() or 1, len(x_columns)), 1)
+    bounds: list[numpy.ndarray] = numpy.array_split(numpy.arange(len(x_columns)), blocks)
+    url: str = engine.url.render_as_string(hide_password=False)
+    arguments = [(url, table_name, order_column, [x_columns[i] for i in block], y_columns, list(lags), degree,
+                  x_shift[block], y_shift) for block in bounds]
+
+    if blocks == 1:
+        results = [_scan(*arguments[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=blocks) as executor:
+            results = list(executor.map(_scan, *zip(*arguments)))
+    return PairMoments.concat([moments for moments, _ in results]), LaggedMoments.concat([lagged for _, lagged in results])
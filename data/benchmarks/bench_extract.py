@@ -0,0 +1,57 @@
+# compares the original serial extraction (read_csv + to_sql per member) with the parallel bulk loader
+# usage: python benchmarks/bench_extract.py [stations] [days]
+
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+import pandas
+import sqlalchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from extract import extract_zips  # noqa: E402
+from logger import log  # noqa: E402
+from sources import weather_sources_by_name  # noqa: E402
+from synthetic import write_dwd_corpus  # noqa: E402
+
+columns: dict[str, str] = weather_sources_by_name["temperature_data"]["columns"]
+filter_items: list[str] = list(columns)
+
+
+def serial_extract(zip_paths: list[str], db_path: str, table_name: str):
+    engine = sqlalchemy.create_engine(f"sqlite:///{db_path}")
+    for zip_path in zip_paths:
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            member_files = [member for member in zip_ref.namelist() if not member.startswith("Metadaten_")]
+            for member in member_files:
+                with zip_ref.open(name=member, mode="r") as tmp_file:
+                    data_frame = pandas.read_csv(tmp_file, sep=";")
+                    data_frame = data_frame.filter(items=filter_items)
+                    data_frame.to_sql(table_name, engine, if_exists="append", index=False)
+    engine.dispose()
+
+
+def main():
+    stations: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    days: int = int(sys.argv[2]) if len(sys.argv) > 2 else 3650
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_paths = write_dwd_corpus(os.path.join(tmp_dir, "temperature_data"), "temperature_data", stations, days)
+        log(f"Generated {stations} archives with {days * 3} rows each", "info")
+
+        start: float = time.perf_counter()
+        serial_extract(zip_paths, os.path.join(tmp_dir, "serial.sqlite"), "temperature_data")
+        serial_seconds: float = time.perf_counter() - start
+        log(f"Serial extraction: {serial_seconds:.2f}s", "info")
+
+        start = time.perf_counter()
+        extract_zips(zip_paths, os.path.join(tmp_dir, "parallel.sqlite"), "temperature_data", columns)
+        parallel_seconds: float = time.perf_counter() - start
+        log(f"Parallel extraction: {parallel_seconds:.2f}s ({serial_seconds / parallel_seconds:.1f}x faster)", "success")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# compares parsing DWD archives with a plain pandas.read_csv per member (the original code) with the dwd reader,
+# with and without pyarrow, single process so only the parser is measured
+# usage: python benchmarks/bench_parse.py [stations] [days]
+
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import dwd  # noqa: E402
+from logger import log  # noqa: E402
+from sources import weather_sources_by_name  # noqa: E402
+from synthetic import write_dwd_corpus  # noqa: E402
+
+columns: dict[str, str] = weather_sources_by_name["rain_data"]["columns"]
+filter_items: list[str] = list(columns)
+
+
+def read_csv_archive(zip_path: str) -> pandas.DataFrame:
+    data_frames = []
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for member in dwd.product_members(zip_ref):
+            with zip_ref.open(name=member, mode="r") as tmp_file:
+                data_frames.append(pandas.read_csv(tmp_file, sep=";").filter(items=filter_items))
+    return pandas.concat(data_frames, ignore_index=True)
+
+
+def measure(name: str, parse, zip_paths: list[str]) -> float:
+    start: float = time.perf_counter()
+    rows: int = sum(len(parse(zip_path)) for zip_path in zip_paths)
+    seconds: float = time.perf_counter() - start
+    log(f"{name}: {seconds:.2f}s ({rows / seconds:,.0f} rows/s)", "info")
+    return seconds
+
+
+def main():
+    stations: int = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    days: int = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_paths = write_dwd_corpus(os.path.join(tmp_dir, "rain_data"), "rain_data", stations, days)
+        log(f"Generated {stations} archives with {days} rows each", "info")
+
+        baseline: float = measure("pandas.read_csv per member", read_csv_archive, zip_paths)
+
+        arrow = dwd.pyarrow
+        dwd.pyarrow = None
+        measure("dwd reader, pandas parser", lambda zip_path: dwd.read_archive(zip_path, columns), zip_paths)
+        dwd.pyarrow = arrow
+
+        if arrow is not None:
+            seconds: float = measure("dwd reader, pyarrow parser", lambda zip_path: dwd.read_archive(zip_path, columns), zip_paths)
+            log(f"pyarrow parser is {baseline / seconds:.1f}x faster than pandas.read_csv per member", "success")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# end-to-end benchmark of the extraction and transformation steps against synthetic DWD archives and OPSD data
+# every step runs in a fresh process so the peak memory is that of the step (and its workers), the results are stored
+# per commit in benchmarks/results/<commit>.json and can be compared with the results of an earlier commit
+#
+# usage (from the data directory):
+#   python benchmarks/bench_pipeline.py                                     default scale
+#   python benchmarks/bench_pipeline.py --stations 100 --days 3650 --power-days 1825
+#   python benchmarks/bench_pipeline.py --compare 23f35e1                  compare with the results of another commit
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable
+
+from rich.console import Console
+from rich.table import Table
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import profiling  # noqa: E402
+from logger import log  # noqa: E402
+from manifest import DOWNLOADED, Manifest  # noqa: E402
+from sources import weather_sources  # noqa: E402
+from synthetic import write_dwd_corpus, write_power_data, write_station_list  # noqa: E402
+
+results_dir: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# The DWD fixtures start inside the time window of every source, the power data where the OPSD data starts
+weather_start_year: int = 2010
+power_start: str = "2015-01-01"
+
+# Steps in the order they depend on each other, each one calls into pull-data.py or transform-data.py
+steps: dict[str, Callable] = {
+    "extract station_data": lambda pull_data, transform_data: pull_data.extract_station_data(),
+    **{f"extract {data_src['name']}": lambda pull_data, transform_data, data_src=data_src:
+       pull_data.extract_data_source(data_src) for data_src in weather_sources},
+    "extract power_data": lambda pull_data, transform_data: pull_data.extract_power_data(),
+    **{f"transform {data_src['name']}": lambda pull_data, transform_data, name=data_src["name"]:
+       getattr(transform_data, f"transform_{name}")() for data_src in weather_sources},
+    "transform power_data": lambda pull_data, transform_data: transform_data.insert_power_data(),
+    "transform station_data": lambda pull_data, transform_data: transform_data.transform_station_data(),
+    "transform aligned_data": lambda pull_data, transform_data: transform_data.align_data(),
+    "rollups": lambda pull_data, transform_data: transform_data.update_all_rollups(),
+}
+
+
+def write_fixtures(work_dir: str, stations: int, days: int, power_days: int, seed: int = 0) -> dict[str, int]:
+    # The raw_data directory as pull-data.py leaves it after downloading, without the network
+    raw_data_dir: str = os.path.join(work_dir, "raw_data")
+    os.makedirs(os.path.join(work_dir, "processed_data"), exist_ok=True)
+
+    files: dict[str, int] = {}
+    for data_src in weather_sources:
+        name: str = data_src["name"]
+        manifest = Manifest.for_source(raw_data_dir, name)
+        for path in write_dwd_corpus(os.path.join(raw_data_dir, name), name, stations, days, weather_start_year, seed):
+            manifest.update(os.path.basename(path), size=os.path.getsize(path), status=DOWNLOADED)
+        manifest.save()
+        write_station_list(os.path.join(raw_data_dir, name, f"{name}_Beschreibung_Stationen.txt"), stations, seed=seed)
+        files[name] = stations
+
+    files["power_data"] = write_power_data(os.path.join(raw_data_dir, "power_data.sqlite"), power_days, power_start, seed)
+    return files
+
+
+def run_step(work_dir: str, step: str) -> dict:
+    # The scripts resolve their paths relative to the working directory, like when they are run from data/
+    from pipeline import load_script
+
+    os.chdir(work_dir)
+    pull_data = load_script("pull-data.py")
+    transform_data = load_script("transform-data.py")
+    transform_data.prepare()
+
+    recorded: int = len(profiling.spans())
+    with profiling.span("benchmark", step=step) as outer:
+        steps[step](pull_data, transform_data)
+    # The spans of the step functions carry the rows, the outer one the time and memory of everything
+    rows: int = sum(span.rows for span in profiling.spans()[recorded:] if span.parent == "benchmark")
+    return {"step": step, "seconds": outer.seconds, "rows": rows,
+            "rows_per_second": rows / outer.seconds if outer.seconds > 0 else 0.0, "peak_rss_mb": outer.peak_rss_mb}
+
+
+def run_suite(work_dir: str, stations: int, days: int, power_days: int, isolated: bool = True) -> list[dict]:
+    # The fixtures are generated in a process of their own too, the memory they leave behind doesn't count for the steps
+    if isolated:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            files: dict[str, int] = executor.submit(write_fixtures, work_dir, stations, days, power_days).result()
+    else:
+        files = write_fixtures(work_dir, stations, days, power_days)
+    log(f"Generated {stations} archives per source ({days} days) and {files['power_data']} hours of power_data", "info")
+
+    results: list[dict] = []
+    cwd: str = os.getcwd()
+    try:
+        for step in steps:
+            if isolated:
+                # A new (spawned, not forked) process per step, the memory of the previous steps doesn't count
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    result: dict = executor.submit(run_step, work_dir, step).result()
+            else:
+                result = run_step(work_dir, step)
+            log(f"{step}: {result['seconds']:.2f}s ({result['rows_per_second']:,.0f} rows/s)", "info")
+            results.append(result)
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def current_commit() -> tuple[str, bool]:
+    # The commit the benchmark ran on and whether the working tree had changes on top of it
+    try:
+        cwd: str = os.path.dirname(os.path.abspath(__file__))
+        commit: str = subprocess.run(["git", "rev-parse", "--short=12", "HEAD"], cwd=cwd, capture_output=True,
+                                     text=True, check=True).stdout.strip()
+        dirty: bool = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                                     capture_output=True, text=True, check=True).stdout.strip() != ""
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def save_results(results: list[dict], scale: dict, directory: str = results_dir) -> str:
+    commit, dirty = current_commit()
+    record: dict = {
+        "commit": commit,
+        "dirty": dirty,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": scale,
+        "steps": results,
+    }
+    os.makedirs(directory, exist_ok=True)
+    path: str = os.path.join(directory, f"{commit}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(record, file, indent=2)
+    return path
+
+
+def load_results(commit: str, directory: str = results_dir) -> dict:
+    # Accepts any prefix of the commit the results were stored under
+    matches: list[str] = sorted(file for file in os.listdir(directory) if file.startswith(commit[:12]))
+    if not matches:
+        raise FileNotFoundError(f"No benchmark results for {commit} in {directory}")
+    with open(os.path.join(directory, matches[0]), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def results_table(results: list[dict], baseline: dict | None = None) -> Table:
+    table = Table(title="Benchmark" + (f" (compared with {baseline['commit']})" if baseline else ""))
+    columns: list[str] = ["Step", "Time", "Rows", "Rows/s", "Peak RSS"] + (["Before", "Change"] if baseline else [])
+    for column in columns:
+        table.add_column(column, justify="left" if column == "Step" else "right")
+
+    before: dict[str, dict] = {result["step"]: result for result in baseline["steps"]} if baseline else {}
+    for result in results:
+        row: list[str] = [
+            result["step"],
+            f"{result['seconds']:.2f}s",
+            f"{result['rows']:,}",
+            f"{result['rows_per_second']:,.0f}",
+            f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "",
+        ]
+        if baseline:
+            previous: dict | None = before.get(result["step"])
+            row += [f"{previous['seconds']:.2f}s", f"{result['seconds'] / previous['seconds'] - 1:+.0%}"] \
+                if previous and previous["seconds"] > 0 else ["", ""]
+        table.add_row(*row)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline steps against synthetic data")
+    parser.add_argument("--stations", type=int, default=50, help="archives per weather source")
+    parser.add_argument("--days", type=int, default=3650, help="days covered by every archive")
+    parser.add_argument("--power-days", type=int, default=2100, help="days of hourly power data")
+    parser.add_argument("--compare", metavar="COMMIT", help="compare with the stored results of this commit")
+    parser.add_argument("--no-save", action="store_true", help="don't store the results")
+    args = parser.parse_args()
+
+    scale: dict = {"stations": args.stations, "days": args.days, "power_days": args.power_days}
+    baseline: dict | None = load_results(args.compare) if args.compare else None
+    if baseline is not None and baseline["scale"] != scale:
+        log(f"Results of {baseline['commit']} were measured at a different scale ({baseline['scale']})", "failure")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results: list[dict] = run_suite(work_dir, args.stations, args.days, args.power_days)
+
+    Console().print(results_table(results, baseline))
+    if not args.no_save:
+        log(f"Stored results in {save_results(results, scale)}", "success")
+
+
+if __name__ == "__main__":
+    main()
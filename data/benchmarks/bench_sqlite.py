@@ -0,0 +1,94 @@
+# compares a transformed weather table written and read with sqlite's defaults (rowid table, secondary indexes) to the
+# engine profiles and the table clustered on (station_id, date) of database.py
+# usage: python benchmarks/bench_sqlite.py [stations] [years]
+
+import os
+import sys
+import tempfile
+
+import numpy
+import pandas
+import sqlalchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import database  # noqa: E402
+from bench_storage import chunk_size, temperature_table, timed  # noqa: E402
+from logger import log  # noqa: E402
+from query import weather_indexes, weather_key  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+# Single stations read one after another, like the station plots of the report
+station_reads: int = 50
+
+dtype: dict = {
+    "station_id":  sqlalchemy.types.INTEGER,
+    "date":        sqlalchemy.types.DATETIME,
+    "temperature": sqlalchemy.types.FLOAT,
+    "humidity":    sqlalchemy.types.FLOAT,
+}
+
+
+def run(db_path: str, data_frame: pandas.DataFrame, tuned: bool) -> dict[str, float]:
+    write_engine = database.create_engine(db_path, "bulk") if tuned else sqlalchemy.create_engine(f"sqlite:///{db_path}")
+    storage = SQLiteStorage(write_engine)
+
+    def write():
+        storage.begin("temperature_data", key=weather_key if tuned else ())
+        for offset in range(0, len(data_frame), chunk_size):
+            storage.write("temperature_data", data_frame.iloc[offset:offset + chunk_size], dtype=dtype)
+        storage.commit("temperature_data", indexes=weather_indexes)
+        if tuned:
+            database.optimize(write_engine)
+
+    seconds: dict[str, float] = {"write": timed(write)}
+    write_engine.dispose()
+
+    read_engine = database.create_engine(db_path, "read") if tuned else sqlalchemy.create_engine(f"sqlite:///{db_path}")
+    stations = numpy.random.default_rng(1).choice(data_frame["station_id"].unique(), station_reads)
+
+    def station_reads_():
+        with read_engine.connect() as connection:
+            for station_id in stations:
+                pandas.read_sql_query(sqlalchemy.text(
+                    'SELECT date, temperature FROM temperature_data WHERE station_id = :station_id '
+                    'AND date >= :start AND date < :end'
+                ), connection, params={"station_id": int(station_id), "start": "2012-01-01", "end": "2014-01-01"})
+
+    def daily_means():
+        with read_engine.connect() as connection:
+            connection.exec_driver_sql(
+                "SELECT station_id, substr(date, 1, 10), AVG(temperature) FROM temperature_data GROUP BY 1, 2"
+            ).fetchall()
+
+    seconds["station reads"] = timed(station_reads_)
+    seconds["daily means"] = timed(daily_means)
+    seconds["full read"] = timed(lambda: SQLiteStorage(read_engine).read("temperature_data"))
+    read_engine.dispose()
+    seconds["size"] = os.path.getsize(db_path) / 1024 / 1024
+    return seconds
+
+
+def main():
+    stations: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    years: int = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    data_frame = temperature_table(stations, years)
+    # The transform stage writes the rows in the order of the raw table, not sorted by date
+    data_frame = data_frame.sample(frac=1, random_state=0).sort_values("station_id", kind="stable", ignore_index=True)
+    log(f"Generated temperature_data with {len(data_frame)} rows", "info")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results: dict[str, dict[str, float]] = {
+            name: run(os.path.join(tmp_dir, f"{name}.sqlite"), data_frame, tuned)
+            for name, tuned in (("default", False), ("tuned", True))
+        }
+
+    for measurement in results["default"]:
+        default, tuned = results["default"][measurement], results["tuned"][measurement]
+        unit: str = "MiB" if measurement == "size" else "s"
+        log(f"{measurement:>14}: default {default:8.2f}{unit}, tuned {tuned:8.2f}{unit} ({default / tuned:4.1f}x)", "info")
+
+
+if __name__ == "__main__":
+    main()
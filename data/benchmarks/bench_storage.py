@@ -0,0 +1,70 @@
+# compares writing and querying a transformed weather table with the sqlite and parquet storage backends
+# usage: python benchmarks/bench_storage.py [stations] [years]
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+import pandas
+import sqlalchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from logger import log  # noqa: E402
+from storage import ParquetStorage, SQLiteStorage  # noqa: E402
+
+chunk_size: int = 250_000
+
+
+def temperature_table(stations: int, years: int) -> pandas.DataFrame:
+    rng = numpy.random.default_rng(0)
+    dates = pandas.date_range("2010-01-01 06:00", periods=years * 365 * 3, freq="8H")
+    return pandas.DataFrame({
+        "station_id": numpy.repeat(numpy.arange(1, stations + 1), len(dates)),
+        "date": numpy.tile(dates.values, stations),
+        "temperature": rng.normal(9, 8, stations * len(dates)).round(1),
+        "humidity": rng.uniform(20, 100, stations * len(dates)).round(),
+    })
+
+
+def timed(function) -> float:
+    start: float = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    stations: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    years: int = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    data_frame = temperature_table(stations, years)
+    log(f"Generated temperature_data with {len(data_frame)} rows", "info")
+
+    dtype = {
+        "station_id":  sqlalchemy.types.INTEGER,
+        "date":        sqlalchemy.types.DATETIME,
+        "temperature": sqlalchemy.types.FLOAT,
+        "humidity":    sqlalchemy.types.FLOAT,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(tmp_dir, 'transformed_data.sqlite')}")
+        storages = [SQLiteStorage(engine), ParquetStorage(os.path.join(tmp_dir, "parquet"))]
+
+        for storage in storages:
+            def write():
+                storage.begin("temperature_data")
+                for offset in range(0, len(data_frame), chunk_size):
+                    storage.write("temperature_data", data_frame.iloc[offset:offset + chunk_size], dtype=dtype)
+                storage.commit("temperature_data")
+
+            write_seconds: float = timed(write)
+            full_seconds: float = timed(lambda: storage.read("temperature_data"))
+            query_seconds: float = timed(lambda: storage.read("temperature_data", ["date", "temperature"], "2015-01-01", "2016-01-01"))
+            log(f"{storage.name:>8}: write {write_seconds:6.2f}s, full read {full_seconds:6.2f}s, "
+                f"one year of two columns {query_seconds:6.2f}s", "info")
+
+
+if __name__ == "__main__":
+    main()
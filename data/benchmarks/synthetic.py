@@ -0,0 +1,145 @@
+# synthetic DWD archives in the layout of opendata.dwd.de and an OPSD time_series.sqlite, used to benchmark the
+# pipeline without network access
+
+import io
+import os
+import sqlite3
+import zipfile
+
+import numpy
+import pandas
+
+# Header and value generator per product, column names are padded exactly like in the DWD files
+products: dict[str, dict] = {
+    "rain_data": {
+        "prefix": "tageswerte_RR",
+        "hourly": False,
+        "header": ["STATIONS_ID", "MESS_DATUM", "QN_6", "  RS", " RSF", "SH_TAG", "NSH_TAG"],
+        "values": lambda rng, n: [rng.integers(1, 10, n), rng.gamma(0.5, 4, n).round(1), rng.integers(0, 9, n),
+                                  rng.integers(0, 50, n), rng.integers(0, 20, n)],
+    },
+    "cloud_data": {
+        "prefix": "terminwerte_N",
+        "hourly": True,
+        "header": ["STATIONS_ID", "MESS_DATUM", "QN_4", "N_TER", "CD_TER"],
+        "values": lambda rng, n: [rng.integers(1, 10, n), rng.integers(0, 9, n), rng.integers(0, 2, n)],
+    },
+    "temperature_data": {
+        "prefix": "terminwerte_TU",
+        "hourly": True,
+        "header": ["STATIONS_ID", "MESS_DATUM", "QN_4", "TT_TER", "RF_TER"],
+        "values": lambda rng, n: [rng.integers(1, 10, n), rng.normal(9, 8, n).round(1), rng.uniform(20, 100, n).round()],
+    },
+    "wind_data": {
+        "prefix": "terminwerte_FK",
+        "hourly": True,
+        "header": ["STATIONS_ID", "MESS_DATUM", "QN_4", "DK_TER", "FK_TER"],
+        "values": lambda rng, n: [rng.integers(1, 10, n), rng.integers(0, 37, n) * 10, rng.integers(0, 13, n)],
+    },
+}
+
+
+def product_file(data_src_name: str, station_id: int, days: int, start_year: int = 1990, seed: int = 0) -> bytes:
+    product = products[data_src_name]
+    rng = numpy.random.default_rng(seed + station_id)
+
+    dates = numpy.arange(f"{start_year}-01-01", numpy.datetime64(f"{start_year}-01-01") + days, dtype="datetime64[D]")
+    if product["hourly"]:
+        # subdaily term values at 6, 13 and 20 UTC
+        timestamps = (dates[:, None] + numpy.array([6, 13, 20], dtype="timedelta64[h]")).ravel()
+        mess_datum = numpy.char.replace(numpy.char.replace(numpy.char.replace(
+            timestamps.astype("datetime64[h]").astype(str), "-", ""), "T", ""), ":", "")
+    else:
+        mess_datum = numpy.char.replace(dates.astype(str), "-", "")
+
+    n: int = len(mess_datum)
+    columns = [numpy.full(n, station_id), mess_datum] + product["values"](rng, n)
+
+    # Sprinkle in the -999 sentinel for missing values like the real files have
+    for column in columns[3:]:
+        column[rng.random(n) < 0.02] = -999
+
+    lines = [";".join(product["header"] + ["eor"])]
+    for row in zip(*columns):
+        lines.append(";".join(str(value) for value in row) + ";eor")
+    return ("\n".join(lines) + "\n").encode("latin-1")
+
+
+def dwd_archive(data_src_name: str, station_id: int, days: int, start_year: int = 1990, seed: int = 0) -> tuple[str, bytes]:
+    product = products[data_src_name]
+    start: str = f"{start_year}0101"
+    end: str = str(numpy.datetime64(f"{start_year}-01-01") + days - 1).replace("-", "")
+    file_name: str = f"{product['prefix']}_{station_id:05d}_{start}_{end}_hist.zip"
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(f"Metadaten_Geographie_{station_id:05d}.txt", "Stations_id;Stationshoehe;Geogr.Breite;Geogr.Laenge;von_datum;bis_datum;Stationsname\n")
+        zip_ref.writestr(f"produkt_{product['prefix'].split('_')[1].lower()}_termin_{start}_{end}_{station_id:05d}.txt",
+                         product_file(data_src_name, station_id, days, start_year, seed))
+    return file_name, buffer.getvalue()
+
+
+def write_dwd_corpus(target_dir: str, data_src_name: str, stations: int, days: int, start_year: int = 1990, seed: int = 0) -> list[str]:
+    os.makedirs(target_dir, exist_ok=True)
+    paths: list[str] = []
+    for station_id in range(1, stations + 1):
+        file_name, content = dwd_archive(data_src_name, station_id, days, start_year, seed)
+        path: str = os.path.join(target_dir, file_name)
+        with open(path, "wb") as file:
+            file.write(content)
+        paths.append(path)
+    return paths
+
+
+def write_station_list(path: str, stations: int, start_year: int = 1990, seed: int = 0) -> str:
+    # Fixed-width station list like FK_Terminwerte_Beschreibung_Stationen.txt, the stations are spread over Germany
+    rng = numpy.random.default_rng(seed)
+    lines: list[str] = [
+        "Stations_id von_datum bis_datum Stationshoehe geoBreite geoLaenge Stationsname Bundesland",
+        "----------- --------- --------- ------------- --------- --------- ----------------------------------------- ----------",
+    ]
+    for station_id in range(1, stations + 1):
+        latitude, longitude = rng.uniform(47.5, 54.8), rng.uniform(6.0, 14.8)
+        lines.append(f"{station_id:05d} {start_year}0101 20221231 {rng.integers(0, 1500):>14} {latitude:>11.4f} "
+                     f"{longitude:>9.4f} {f'Station {station_id}':<40} Niedersachsen")
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="latin-1") as file:
+        file.write("\n".join(lines) + "\n")
+    return path
+
+
+# Zones and measurements of the OPSD hourly table, a superset of the columns pull-data.py keeps (like the real file)
+power_zones: list[str] = ["DE", "DE_50hertz", "DE_LU", "DE_amprion", "DE_tennet", "DE_transnetbw"]
+power_measurements: list[str] = [
+    "load_actual_entsoe_transparency", "load_forecast_entsoe_transparency", "price_day_ahead",
+    "solar_capacity", "solar_generation_actual", "solar_profile",
+    "wind_capacity", "wind_generation_actual", "wind_profile",
+    "wind_offshore_capacity", "wind_offshore_generation_actual", "wind_offshore_profile",
+    "wind_onshore_capacity", "wind_onshore_generation_actual", "wind_onshore_profile",
+]
+
+
+def write_power_data(path: str, days: int, start: str = "2015-01-01", seed: int = 0) -> int:
+    # time_series_60min_singleindex with the timestamps as text ("2015-01-01T00:00:00Z", "2015-01-01T01:00:00+0100")
+    rng = numpy.random.default_rng(seed)
+    timestamps = pandas.date_range(start, periods=days * 24, freq="H", tz="UTC")
+    data_frame = pandas.DataFrame({
+        "utc_timestamp": timestamps.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "cet_cest_timestamp": timestamps.tz_convert("Europe/Berlin").strftime("%Y-%m-%dT%H:%M:%S%z"),
+    })
+    for zone in power_zones:
+        for measurement in power_measurements:
+            values = rng.gamma(2, 5000, len(timestamps)).round(1)
+            # Not every zone reports every hour, the real table has plenty of gaps
+            values[rng.random(len(timestamps)) < 0.02] = numpy.nan
+            data_frame[f"{zone}_{measurement}"] = values
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with sqlite3.connect(path) as connection:
+        connection.execute("DROP TABLE IF EXISTS time_series_60min_singleindex")
+        data_frame.to_sql("time_series_60min_singleindex", connection, index=False)
+    connection.close()
+    return len(data_frame)
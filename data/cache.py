@@ -0,0 +1,181 @@
+# on-disk memoization of frames derived from the transformed database (report queries, analyses)
+# an entry is keyed by the function (and the source of its module), its arguments and a fingerprint of the tables it
+# reads. The fingerprint comes from table_stats, where the transform stage records the rows, the date range and a new
+# version whenever it rewrites a table, so a rewritten table is never answered from the cache (its entries are also
+# deleted right away). Entries are pickles in a cache directory next to the database, the least recently used ones are
+# evicted once the directory grows beyond max_bytes
+#
+# example:
+#   @memoize(["power_data"])
+#   def daily_power(engine): ...
+#
+#   @memoize(lambda engine, table_name: [table_name])
+#   def daily_weather(engine, table_name): ...
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import uuid
+from typing import Callable
+
+import sqlalchemy
+
+stats_table: str = "table_stats"
+
+# Directory next to the database (processed_data/cache) and its size limit (e.g. CACHE_MAX_MB=4096)
+cache_dir_name: str = "cache"
+max_bytes: int = int(os.environ.get("CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+entry_suffix: str = ".pickle"
+
+
+def cache_dir(engine: sqlalchemy.Engine) -> str | None:
+    # In-memory databases have no place for a cache
+    database: str | None = engine.url.database
+    if not database or database == ":memory:":
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(database)), cache_dir_name)
+
+
+def record_stats(connection: sqlalchemy.Connection, table_name: str, date_column: str | None = "date"):
+    # Called in the transaction that writes the table, the new version is part of every fingerprint of the table
+    connection.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {stats_table} (table_name TEXT PRIMARY KEY, row_count INTEGER, first_date TEXT, "
+        f"last_date TEXT, version TEXT, updated TEXT)"
+    )
+    bounds: str = f'MIN("{date_column}"), MAX("{date_column}")' if date_column else "NULL, NULL"
+    connection.exec_driver_sql(
+        f"INSERT OR REPLACE INTO {stats_table} SELECT ?, COUNT(*), {bounds}, ?, datetime('now') FROM \"{table_name}\"",
+        (table_name, uuid.uuid4().hex),
+    )
+
+    directory: str | None = cache_dir(connection.engine)
+    if directory is not None:
+        Cache(directory).invalidate([table_name])
+
+
+def fingerprint(engine: sqlalchemy.Engine, tables: list[str]) -> str:
+    # Tables that were not written by the transform stage are counted, missing tables count as missing
+    checksum = hashlib.sha256()
+    with engine.connect() as connection:
+        has_stats: bool = sqlalchemy.inspect(connection).has_table(stats_table)
+        for table_name in sorted(tables):
+            row = None
+            if has_stats:
+                row = connection.exec_driver_sql(
+                    f"SELECT row_count, first_date, last_date, version FROM {stats_table} WHERE table_name = ?",
+                    (table_name,)
+                ).fetchone()
+            if row is None and sqlalchemy.inspect(connection).has_table(table_name):
+                row = connection.exec_driver_sql(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()
+            checksum.update(repr((table_name, tuple(row) if row is not None else None)).encode())
+    return checksum.hexdigest()
+
+
+def make_key(*parts) -> str:
+    # Everything that decides the result, the parts have to be picklable
+    return hashlib.sha256(pickle.dumps(parts)).hexdigest()[:32]
+
+
+class Cache:
+    def __init__(self, directory: str, max_bytes: int = max_bytes):
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+
+    def _path(self, key: str, tables: list[str]) -> str:
+        # The tables are part of the file name so their entries can be found without opening them
+        return os.path.join(self.directory, f"{'+'.join(sorted(tables))}.{key}{entry_suffix}")
+
+    def _entries(self) -> list[os.DirEntry]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(entry_suffix)]
+
+    def get(self, key: str, tables: list[str]) -> tuple[bool, object]:
+        path: str = self._path(key, tables)
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            return False, None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Written by an incompatible version (or truncated), computed again
+            os.remove(path)
+            return False, None
+
+        # The modification time orders the entries for the eviction
+        os.utime(path)
+        return True, value
+
+    def put(self, key: str, tables: list[str], value: object):
+        os.makedirs(self.directory, exist_ok=True)
+        path: str = self._path(key, tables)
+        tmp_path: str = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        # Least recently used first, until the entries fit into max_bytes again
+        entries: list[tuple[float, int, str]] = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total: int = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def invalidate(self, tables: list[str]):
+        # Removes every entry that depends on one of the tables
+        for entry in self._entries():
+            if set(entry.name.split(".")[0].split("+")) & set(tables):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def memoize(tables: list[str] | Callable[..., list[str]]):
+    # Decorator for functions taking the engine first, tables are the tables the function reads (or a function of the
+    # call's arguments returning them), the results have to be picklable
+    def decorator(function):
+        # The whole module, the function reads module level data and helpers (and calls other memoized functions)
+        try:
+            source: str = inspect.getsource(sys.modules[function.__module__])
+        except (OSError, TypeError, KeyError):
+            source = function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(engine: sqlalchemy.Engine, *args, **kwargs):
+            directory: str | None = cache_dir(engine)
+            if directory is None:
+                return function(engine, *args, **kwargs)
+
+            names: list[str] = tables(engine, *args, **kwargs) if callable(tables) else list(tables)
+            key: str = make_key(function.__module__, function.__qualname__, source, str(engine.url), args,
+                                sorted(kwargs.items()), fingerprint(engine, names))
+
+            cache = Cache(directory)
+            hit, value = cache.get(key, names)
+            if not hit:
+                value = function(engine, *args, **kwargs)
+                cache.put(key, names, value)
+            return value
+
+        wrapper.uncached = function
+        return wrapper
+    return decorator
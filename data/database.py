@@ -0,0 +1,90 @@
+# sqlite engines and connections for the pipeline databases, with the pragmas of the way they are used
+# "bulk" is used by the stages writing a database: WAL, no fsync per transaction (a failed load is simply repeated), a
+# large page cache and temporary b-trees in memory. "read" is used by everything only querying the tables: the database
+# file is memory mapped so scans don't copy pages into the page cache first, and the file is opened read-only (a wrong
+# path fails instead of creating an empty database). The file format (page_size, journal_mode) is left to the writers,
+# page_size only applies to databases that don't exist yet (or after a VACUUM outside of WAL mode), larger pages mean
+# fewer, longer reads for the table scans
+#
+# the loads end with optimize(): ANALYZE gives the query planner statistics of the indexes and clustered keys, VACUUM
+# (SQLITE_VACUUM=1) rebuilds the file without the free pages of replaced tables
+#
+# example:
+#   engine = database.create_engine("../data/processed_data/transformed_data.sqlite")            read profile
+#   engine = database.create_engine("processed_data/data.sqlite", "bulk")
+#   connection = database.connect("processed_data/data.sqlite", "bulk", isolation_level=None)   plain sqlite3
+
+import os
+import sqlite3
+import urllib.parse
+
+import sqlalchemy
+
+profiles: dict[str, dict[str, str]] = {
+    "bulk": {
+        "page_size": "8192",
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "temp_store": "MEMORY",
+        "cache_size": "-262144",   # 256 MiB
+        "mmap_size": "0",
+    },
+    "read": {
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "cache_size": "-65536",    # 64 MiB, the mapped file is read without it
+        "mmap_size": str(1 << 30),
+    },
+}
+
+# Rebuild the databases at the end of a load (e.g. SQLITE_VACUUM=1), takes about as long as writing them once more
+vacuum_after_load: bool = os.environ.get("SQLITE_VACUUM", "0") == "1"
+
+
+def apply_pragmas(connection, profile: str = "read"):
+    # connection is a sqlite3 connection (also what sqlalchemy hands to its connect event)
+    if profile not in profiles:
+        raise ValueError(f"Unknown sqlite profile {profile}, expected one of {', '.join(profiles)}")
+    for pragma, value in profiles[profile].items():
+        connection.execute(f"PRAGMA {pragma} = {value}")
+
+
+def url(path_or_url: str) -> str:
+    return path_or_url if "://" in path_or_url else f"sqlite:///{path_or_url}"
+
+
+def read_only_uri(db_path: str) -> str:
+    return f"file:{urllib.parse.quote(os.path.abspath(db_path))}?mode=ro"
+
+
+def create_engine(path_or_url: str, profile: str = "read", **kwargs) -> sqlalchemy.Engine:
+    # Every pooled connection gets the pragmas when it is opened, kwargs go to sqlalchemy.create_engine
+    engine_url = sqlalchemy.make_url(url(path_or_url))
+    if profile == "read" and engine_url.get_backend_name() == "sqlite" and engine_url.database not in (None, "", ":memory:"):
+        # engine.url stays the path (the cache directory is next to it), the connections are opened read-only
+        connect_args: dict = {"check_same_thread": False, **kwargs.pop("connect_args", {})}
+        uri: str = read_only_uri(engine_url.database)
+        kwargs["creator"] = lambda: sqlite3.connect(uri, uri=True, **connect_args)
+    engine = sqlalchemy.create_engine(engine_url, **kwargs)
+    if engine.dialect.name == "sqlite":
+        sqlalchemy.event.listen(engine, "connect", lambda connection, _: apply_pragmas(connection, profile))
+    return engine
+
+
+def connect(db_path: str, profile: str = "bulk", **kwargs) -> sqlite3.Connection:
+    if profile == "read":
+        connection = sqlite3.connect(read_only_uri(db_path), uri=True, **kwargs)
+    else:
+        connection = sqlite3.connect(db_path, **kwargs)
+    apply_pragmas(connection, profile)
+    return connection
+
+
+def optimize(engine: sqlalchemy.Engine, vacuum: bool = vacuum_after_load):
+    # Statistics for the planner after a load, VACUUM also truncates the WAL file
+    with engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+        connection.commit()
+        if vacuum:
+            connection.exec_driver_sql("VACUUM")
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
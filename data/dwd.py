@@ -0,0 +1,130 @@
+# reader for the product files (produkt_*.txt) in the DWD station archives
+# the layout is always the same: ";" separated, padded column names ("  RS", " RSF"), a trailing "eor" column and
+# -999 for missing values, so only the requested columns are parsed, with explicit types and matched by stripped name
+#
+# with pyarrow the members are parsed by its csv reader straight from the zip stream and filtered before they are
+# converted to pandas, without pyarrow the pandas C parser is used
+
+import zipfile
+from typing import IO
+
+import pandas
+
+import schema
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+except ImportError:  # the pyarrow parser is optional
+    pyarrow = None
+
+# Nullable dtypes of the schema and the arrow types they are converted from
+nullable_types: dict = {
+    "Int8": (pyarrow.int8(), pandas.Int8Dtype()),
+    "Int16": (pyarrow.int16(), pandas.Int16Dtype()),
+    "Float32": (pyarrow.float32(), pandas.Float32Dtype()),
+} if pyarrow is not None else {}
+
+# Members of an archive that are not measurements
+metadata_prefix: str = "Metadaten_"
+
+
+def product_members(zip_ref: zipfile.ZipFile) -> list[str]:
+    return [member for member in zip_ref.namelist() if not member.startswith(metadata_prefix)]
+
+
+def read_header(stream: IO[bytes]) -> list[str]:
+    # Consumes the header line, the rest of the stream is data
+    return [column.strip() for column in stream.readline().decode("latin-1").rstrip("\r\n").split(";")]
+
+
+def _read_arrow(stream: IO[bytes], header: list[str], parse_types: dict[str, str]) -> "pyarrow.Table":
+    # Every worker process parses its own archive, more threads per file would only compete with the other workers
+    return pyarrow.csv.read_csv(
+        stream,
+        read_options=pyarrow.csv.ReadOptions(column_names=header, use_threads=False),
+        parse_options=pyarrow.csv.ParseOptions(delimiter=";"),
+        convert_options=pyarrow.csv.ConvertOptions(
+            include_columns=list(parse_types),
+            include_missing_columns=True,  # like reindex(), absent columns become nulls
+            column_types={column: pyarrow.from_numpy_dtype(dtype.lower()) for column, dtype in parse_types.items()},
+            check_utf8=False,
+        ),
+    )
+
+
+def _filter_arrow(table: "pyarrow.Table", date_range: tuple[int | None, int | None]) -> "pyarrow.Table":
+    min_date, max_date = date_range
+    mess_datum = table.column("MESS_DATUM")
+    mask = None
+    if min_date is not None:
+        mask = pyarrow.compute.greater_equal(mess_datum, min_date)
+    if max_date is not None:
+        upper = pyarrow.compute.less_equal(mess_datum, max_date)
+        mask = upper if mask is None else pyarrow.compute.and_(mask, upper)
+    return table if mask is None else table.filter(mask)
+
+
+def _to_pandas(table: "pyarrow.Table", parse_types: dict[str, str], columns: dict[str, str]) -> pandas.DataFrame:
+    # Replace the missing value marker and narrow the columns in arrow, casting into masked pandas arrays element by
+    # element is a lot slower. Arrow's casts are checked, values that don't fit raise ArrowInvalid (a ValueError)
+    arrays: list = []
+    for (column, _), dtype in zip(parse_types.items(), columns.values()):
+        array = table.column(column)
+        if dtype in nullable_types:
+            array = pyarrow.compute.if_else(pyarrow.compute.equal(array, schema.missing_value), None, array)
+            array = array.cast(nullable_types[dtype][0])
+        arrays.append(array)
+
+    table = pyarrow.table(arrays, names=list(parse_types))
+    types: dict = {arrow_type: pandas_type for arrow_type, pandas_type in nullable_types.values()}
+    return table.to_pandas(types_mapper=types.get)
+
+
+def _read_pandas(stream: IO[bytes], header: list[str], parse_types: dict[str, str]) -> pandas.DataFrame:
+    # The C parser is a lot slower parsing into nullable integers than into floats, schema.apply narrows them afterwards
+    dtypes: dict[str, str] = {column: "float64" if dtype == "Int32" else dtype for column, dtype in parse_types.items()}
+    data_frame = pandas.read_csv(stream, sep=";", header=None, names=header, usecols=lambda column: column in dtypes,
+                                 dtype=dtypes)
+    return data_frame.reindex(columns=list(parse_types))
+
+
+def _filter_pandas(data_frame: pandas.DataFrame, date_range: tuple[int | None, int | None]) -> pandas.DataFrame:
+    min_date, max_date = date_range
+    if min_date is not None:
+        data_frame = data_frame[data_frame["MESS_DATUM"] >= min_date]
+    if max_date is not None:
+        data_frame = data_frame[data_frame["MESS_DATUM"] <= max_date]
+    return data_frame
+
+
+def read_archive(zip_path: str, columns: dict[str, str],
+                 date_range: tuple[int | None, int | None] = (None, None)) -> pandas.DataFrame:
+    # columns maps the (padded) column names of the schema to their dtype, the result uses these names
+    names: dict[str, str] = {column.strip(): column for column in columns}
+    parse_types: dict[str, str] = {column.strip(): dtype for column, dtype in schema.parse_dtypes(columns).items()}
+
+    tables: list = []
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for member in product_members(zip_ref):
+            with zip_ref.open(name=member, mode="r") as stream:
+                header: list[str] = read_header(stream)
+                if pyarrow is not None:
+                    tables.append(_filter_arrow(_read_arrow(stream, header, parse_types), date_range))
+                else:
+                    tables.append(_filter_pandas(_read_pandas(stream, header, parse_types), date_range))
+
+    if not tables:
+        return pandas.DataFrame({column: pandas.Series(dtype=dtype) for column, dtype in columns.items()})
+
+    # All members of the archive are converted at once
+    if pyarrow is not None:
+        data_frame = _to_pandas(pyarrow.concat_tables(tables), parse_types, columns)
+    else:
+        data_frame = pandas.concat(tables, ignore_index=True)
+    data_frame = data_frame.rename(columns=names)
+
+    # Whatever the arrow conversion didn't cover yet (and everything without pyarrow) goes through the schema
+    return schema.apply(data_frame, {column: dtype for column, dtype in columns.items()
+                                     if str(data_frame[column].dtype) != dtype})
@@ -0,0 +1,295 @@
+# parallel extraction of DWD zip archives into sqlite
+# zips are parsed in a process pool, a single writer in the main process inserts the rows in large transactions
+#
+# every transaction also records the zips it contains in extract_checkpoints, an interrupted extraction resumes after
+# the last committed zip, and the rows are upserted on (STATIONS_ID, MESS_DATUM), so extracting a zip twice is harmless
+
+import os
+import re
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterator
+
+import pandas
+from rich.progress import track
+
+import database
+import dwd
+import schema
+import validation
+
+# DWD file names contain the station id, e.g. terminwerte_N_00044_19710101_20221231_hist.zip
+station_id_pattern: str = r"_(\d{5})_\d{8}_\d{8}_"
+
+# Rows buffered by the writer before they are committed in one transaction
+batch_rows: int = 500_000
+
+# A station measures once per MESS_DATUM, the key makes inserts upserts
+key_columns: tuple[str, ...] = ("STATIONS_ID", "MESS_DATUM")
+
+# Zips whose rows are committed, written in the same transactions as the rows
+checkpoint_table: str = "extract_checkpoints"
+checkpoint_columns: str = ("table_name TEXT NOT NULL, zip_name TEXT NOT NULL, size INTEGER, modified INTEGER, "
+                           "rows INTEGER, committed TEXT, PRIMARY KEY (table_name, zip_name)")
+
+
+def parse_zip(zip_path: str, columns: dict[str, str], date_range: tuple[int | None, int | None] = (None, None)) -> pandas.DataFrame:
+    return dwd.read_archive(zip_path, columns, date_range)
+
+
+def parse_zips(zip_paths: list[str], columns: dict[str, str], date_range: tuple[int | None, int | None] = (None, None),
+               workers: int | None = None) -> Iterator[tuple[str, pandas.DataFrame]]:
+    # Keep only a few zips per worker in flight so parsed frames don't pile up faster than they are written
+    max_in_flight: int = (workers or os.cpu_count() or 1) * 2
+    pending_paths = iter(zip_paths)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        for zip_path in pending_paths:
+            in_flight[executor.submit(parse_zip, zip_path, columns, date_range)] = zip_path
+            if len(in_flight) >= max_in_flight:
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                zip_path = in_flight.pop(future)
+                yield zip_path, future.result()
+
+                next_path = next(pending_paths, None)
+                if next_path is not None:
+                    in_flight[executor.submit(parse_zip, next_path, columns, date_range)] = next_path
+
+
+def sqlite_type(dtype) -> str:
+    if pandas.api.types.is_integer_dtype(dtype) or pandas.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    if pandas.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def upsert_clause(columns: list[str], key: tuple[str, ...]) -> str:
+    # Rows that are already there (same key) are overwritten, so extracting a zip twice never duplicates rows
+    if not key:
+        return ""
+    updates: list[str] = [f"{quote(column)} = excluded.{quote(column)}" for column in columns if column not in key]
+    conflict: str = f"ON CONFLICT ({', '.join(quote(column) for column in key)})"
+    return f"{conflict} DO UPDATE SET {', '.join(updates)}" if updates else f"{conflict} DO NOTHING"
+
+
+def checkpoints(db_path: str, table_name: str) -> dict[str, dict]:
+    # The zips of a table whose rows are committed, with the (size, modified) version of the file that was extracted
+    if not os.path.exists(db_path):
+        return {}
+    connection = sqlite3.connect(db_path)
+    try:
+        if not connection.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (checkpoint_table,)).fetchone():
+            return {}
+        cursor = connection.execute(f"SELECT zip_name, size, modified, rows FROM {checkpoint_table} WHERE table_name = ?",
+                                    (table_name,))
+        return {zip_name: {"size": size, "modified": modified, "rows": rows} for zip_name, size, modified, rows in cursor}
+    finally:
+        connection.close()
+
+
+def record_checkpoints(db_path: str, table_name: str, versions: dict[str, tuple[int, int]]):
+    # Checkpoints for zips whose rows are already in the table, e.g. of databases from before the checkpoints
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {checkpoint_table} ({checkpoint_columns})")
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(f"INSERT OR REPLACE INTO {checkpoint_table} VALUES (?, ?, ?, ?, NULL, datetime('now'))",
+                                   [(table_name, zip_name, size, modified) for zip_name, (size, modified) in versions.items()])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    finally:
+        connection.close()
+
+
+def file_version(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def is_extracted(path: str, checkpoint: dict | None) -> bool:
+    # A zip that was downloaded again after its checkpoint (changed on the server) has to be extracted again
+    return checkpoint is not None and (checkpoint["size"], checkpoint["modified"]) == file_version(path)
+
+
+class BulkWriter:
+    def __init__(self, db_path: str, table_name: str, key: tuple[str, ...] = key_columns):
+        self.table_name: str = table_name
+        self.key: tuple[str, ...] = key
+        # Durability doesn't matter during bulk loads since a failed load is simply repeated
+        self.connection = database.connect(db_path, "bulk", isolation_level=None)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {checkpoint_table} ({checkpoint_columns})")
+
+        self._columns: list[str] | None = self._table_columns(table_name)
+        self._frames: list[pandas.DataFrame] = []
+        # Rows rejected by the validation go to <table>_quarantine in the same transactions
+        self.quarantine_name: str = validation.quarantine_table(table_name)
+        self._quarantine_columns: list[str] | None = self._table_columns(self.quarantine_name)
+        self._rejected: list[pandas.DataFrame] = []
+        self._rows: int = 0
+        self._deletes: list[int] = []
+        self._zips: list[str] = []
+        self._checkpoints: list[tuple] = []
+
+        for name, columns in ((table_name, self._columns), (self.quarantine_name, self._quarantine_columns)):
+            if columns is not None:
+                self._ensure_key(name)
+
+    def add(self, zip_name: str, data_frame: pandas.DataFrame, replace_station: int | None = None,
+            rejected: pandas.DataFrame | None = None, version: tuple[int, int] | None = None) -> list[str]:
+        # version is the (size, modification time) of the zip, recorded in its checkpoint
+        if replace_station is not None:
+            self._deletes.append(replace_station)
+        if len(data_frame) > 0:
+            self._frames.append(data_frame)
+            self._rows += len(data_frame)
+        if rejected is not None and len(rejected) > 0:
+            self._rejected.append(rejected)
+            self._rows += len(rejected)
+        self._zips.append(zip_name)
+
+        size, modified = version or (None, None)
+        rows: int = len(data_frame) + (len(rejected) if rejected is not None else 0)
+        self._checkpoints.append((self.table_name, zip_name, size, modified, rows))
+
+        if self._rows >= batch_rows:
+            return self.flush()
+        return []
+
+    def _table_columns(self, table_name: str) -> list[str] | None:
+        # Pick up the column layout of an existing table so appended rows line up with it
+        existing = self.connection.execute(f"PRAGMA table_info({quote(table_name)})").fetchall()
+        return [column[1] for column in existing] or None
+
+    def _ensure_key(self, table_name: str):
+        # Tables of older runs have no key and may hold rows twice (an interrupted run was extracted again), the last
+        # copy of every row is kept before the unique index is built
+        if not self.key or self._primary_key(table_name) == list(self.key):
+            return
+        index: str = quote(f"{table_name}_key")
+        key: str = ", ".join(quote(column) for column in self.key)
+        try:
+            self.connection.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {quote(table_name)} ({key})")
+        except sqlite3.IntegrityError:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.execute(f"DELETE FROM {quote(table_name)} WHERE rowid NOT IN "
+                                        f"(SELECT MAX(rowid) FROM {quote(table_name)} GROUP BY {key})")
+                self.connection.execute(f"CREATE UNIQUE INDEX {index} ON {quote(table_name)} ({key})")
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def _primary_key(self, table_name: str) -> list[str]:
+        columns = self.connection.execute(f"PRAGMA table_info({quote(table_name)})").fetchall()
+        return [column[1] for column in sorted(columns, key=lambda column: column[5]) if column[5] > 0]
+
+    def _insert(self, table_name: str, columns: list[str] | None, data_frame: pandas.DataFrame,
+                clustered: bool = False) -> list[str]:
+        # Creates the table with the layout of the first rows, returns the columns of the table
+        # Clustered tables are stored in key order (WITHOUT ROWID), the rows of a station are on neighbouring pages
+        if columns is None:
+            columns = list(data_frame.columns)
+            column_defs: str = ", ".join(f"{quote(column)} {sqlite_type(dtype)}" for column, dtype in data_frame.dtypes.items())
+            if clustered and self.key:
+                key: str = ", ".join(quote(column) for column in self.key)
+                self.connection.execute(f"CREATE TABLE IF NOT EXISTS {quote(table_name)} "
+                                        f"({column_defs}, PRIMARY KEY ({key})) WITHOUT ROWID")
+            else:
+                self.connection.execute(f"CREATE TABLE IF NOT EXISTS {quote(table_name)} ({column_defs})")
+            self._ensure_key(table_name)
+
+        data_frame = schema.for_sqlite(data_frame.reindex(columns=columns))
+        rows = data_frame.astype(object).where(data_frame.notna(), None).itertuples(index=False, name=None)
+        placeholders: str = ", ".join("?" for _ in columns)
+        column_list: str = ", ".join(quote(column) for column in columns)
+        self.connection.executemany(f"INSERT INTO {quote(table_name)} ({column_list}) VALUES ({placeholders}) "
+                                    f"{upsert_clause(columns, self.key)}", rows)
+        return columns
+
+    def flush(self) -> list[str]:
+        # Write everything buffered so far in a single transaction and return the zips that are now committed
+        committed, self._zips = self._zips, []
+        if not committed:
+            return committed
+
+        data_frame = pandas.concat(self._frames, ignore_index=True) if self._frames else None
+        rejected = pandas.concat(self._rejected, ignore_index=True) if self._rejected else None
+        self.connection.execute("BEGIN")
+        try:
+            for station_id in self._deletes:
+                for table_name, columns in ((self.table_name, self._columns), (self.quarantine_name, self._quarantine_columns)):
+                    if columns is not None:
+                        self.connection.execute(f"DELETE FROM {quote(table_name)} WHERE STATIONS_ID = ?", (station_id,))
+
+            if data_frame is not None:
+                self._columns = self._insert(self.table_name, self._columns, data_frame, clustered=True)
+            if rejected is not None:
+                self._quarantine_columns = self._insert(self.quarantine_name, self._quarantine_columns, rejected)
+
+            # The checkpoints commit together with the rows, a crash loses either both or neither
+            self.connection.executemany(f"INSERT OR REPLACE INTO {checkpoint_table} VALUES (?, ?, ?, ?, ?, datetime('now'))",
+                                        self._checkpoints)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            # Tables created in the rolled back transaction don't exist anymore
+            self._columns = self._table_columns(self.table_name)
+            self._quarantine_columns = self._table_columns(self.quarantine_name)
+            raise
+
+        self._frames, self._rejected, self._rows, self._deletes, self._checkpoints = [], [], 0, [], []
+        return committed
+
+    def close(self):
+        self.connection.close()
+
+
+def extract_zips(zip_paths: list[str], db_path: str, table_name: str, columns: dict[str, str],
+                 date_range: tuple[int | None, int | None] = (None, None), replaces_rows: set[str] = frozenset(), workers: int | None = None,
+                 on_committed: Callable[[list[str]], None] | None = None, description: str = "",
+                 validator: validation.Validator | None = None) -> int:
+    # Returns the rows read from the zips, rows rejected by the validator are counted in validator as well
+    writer = BulkWriter(db_path, table_name)
+    rows: int = 0
+    try:
+        results = parse_zips(zip_paths, columns, date_range, workers)
+        for zip_path, data_frame in track(results, total=len(zip_paths), description=description, transient=True):
+            zip_name: str = os.path.basename(zip_path)
+            rows += len(data_frame)
+
+            # Rows of a previous version of this zip are removed in the same transaction that adds the new ones
+            replace_station: int | None = None
+            match = re.search(station_id_pattern, zip_name)
+            if zip_name in replaces_rows and match:
+                replace_station = int(match.group(1))
+
+            # The masks are cheap next to parsing, the parsed frames are checked as they come in
+            rejected: pandas.DataFrame | None = None
+            if validator is not None:
+                data_frame, rejected = validator.check(data_frame)
+
+            committed = writer.add(zip_name, data_frame, replace_station, rejected, file_version(zip_path))
+            if committed and on_committed is not None:
+                on_committed(committed)
+
+        committed = writer.flush()
+        if committed and on_committed is not None:
+            on_committed(committed)
+    finally:
+        writer.close()
+
+    return rows
@@ -0,0 +1,194 @@
+# concurrent ftp download engine
+# keeps a bounded pool of logged-in connections per server directory and fetches files in parallel
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from ftplib import FTP, all_errors, error_perm
+from typing import Callable
+
+from rich.progress import Progress
+
+part_suffix: str = ".part"
+
+
+@dataclass
+class RemoteFile:
+    name: str
+    size: int | None = None
+    modified: str | None = None  # YYYYMMDDHHMMSS as reported by MLSD/MDTM
+
+
+@dataclass
+class DownloadStats:
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    failed: list[str] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        # bytes per second
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def merge(self, other: "DownloadStats"):
+        self.files += other.files
+        self.bytes += other.bytes
+        self.failed.extend(other.failed)
+
+
+class FTPPool:
+    def __init__(self, host: str, directory: str, size: int = 4, port: int = 21, timeout: float = 60):
+        self.host: str = host
+        self.port: int = port
+        self.directory: str = directory
+        self.timeout: float = timeout
+        self.size: int = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> FTP:
+        ftp = FTP()
+        ftp.connect(self.host, self.port, timeout=self.timeout)
+        ftp.login()
+        ftp.cwd(self.directory)
+        return ftp
+
+    @contextmanager
+    def connection(self):
+        # Blocks until one of the pool slots is free, so we never open more than `size` sessions
+        self._slots.acquire()
+        try:
+            try:
+                ftp = self._idle.get_nowait()
+            except queue.Empty:
+                ftp = self._connect()
+
+            try:
+                yield ftp
+            except BaseException:
+                # The session may be in an undefined state (half-read transfer), don't reuse it
+                _close_quietly(ftp)
+                raise
+            else:
+                self._idle.put(ftp)
+        finally:
+            self._slots.release()
+
+    def nlst(self) -> list[str]:
+        with self.connection() as ftp:
+            return ftp.nlst()
+
+    def listing(self) -> dict[str, RemoteFile]:
+        # MLSD returns size and modification time of every file in a single request
+        try:
+            with self.connection() as ftp:
+                return {
+                    name: RemoteFile(name, int(facts["size"]) if "size" in facts else None, facts.get("modify"))
+                    for name, facts in ftp.mlsd(facts=["type", "size", "modify"])
+                    if facts.get("type", "file") == "file"
+                }
+        except error_perm:
+            pass
+
+        # Server does not support MLSD, ask for SIZE and MDTM of every file using all pooled connections
+        def stat(name: str) -> RemoteFile:
+            with self.connection() as ftp:
+                try:
+                    ftp.voidcmd("TYPE I")
+                    return RemoteFile(name, ftp.size(name), ftp.voidcmd("MDTM " + name).split()[-1])
+                except error_perm:
+                    return RemoteFile(name)
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return {remote_file.name: remote_file for remote_file in executor.map(stat, self.nlst())}
+
+    def close(self):
+        while True:
+            try:
+                ftp = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                ftp.quit()
+            except all_errors:
+                ftp.close()
+
+
+def _close_quietly(ftp: FTP):
+    try:
+        ftp.close()
+    except all_errors:
+        pass
+
+
+def fetch_file(pool: FTPPool, file: str, target_dir: str) -> tuple[int, str]:
+    local_filename: str = os.path.join(target_dir, file)
+    part_filename: str = local_filename + part_suffix
+    size: int = 0
+    checksum = hashlib.sha256()
+
+    # Write into a temporary file first and only move it into place once the transfer is complete,
+    # so a zip that is still on disk is always a full copy
+    try:
+        with pool.connection() as ftp, open(part_filename, "wb") as f:
+            def callback(chunk):
+                nonlocal size
+                f.write(chunk)
+                checksum.update(chunk)
+                size += len(chunk)
+
+            ftp.retrbinary("RETR " + file, callback)
+        os.replace(part_filename, local_filename)
+    except BaseException:
+        if os.path.exists(part_filename):
+            os.remove(part_filename)
+        raise
+
+    return size, checksum.hexdigest()
+
+
+def download_files(pool: FTPPool, files: list[str], target_dir: str, retries: int = 3, backoff: float = 0.5,
+                   progress: Progress | None = None, description: str = "",
+                   on_complete: Callable[[str, int, str], None] | None = None) -> DownloadStats:
+    stats = DownloadStats()
+    os.makedirs(target_dir, exist_ok=True)
+
+    task = progress.add_task(description, total=len(files)) if progress is not None else None
+
+    def fetch_with_retries(file: str) -> tuple[int, str]:
+        for attempt in range(retries + 1):
+            try:
+                return fetch_file(pool, file, target_dir)
+            except all_errors:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+
+    start: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures = {executor.submit(fetch_with_retries, file): file for file in files}
+        for future in as_completed(futures):
+            file: str = futures[future]
+            try:
+                size, checksum = future.result()
+                stats.bytes += size
+                stats.files += 1
+                if on_complete is not None:
+                    on_complete(file, size, checksum)
+            except all_errors:
+                stats.failed.append(file)
+
+            if task is not None:
+                progress.advance(task)
+    stats.seconds = time.perf_counter() - start
+
+    if task is not None:
+        progress.remove_task(task)
+
+    return stats
@@ -0,0 +1,128 @@
+# streaming http downloads with resume and verification
+# responses are written to disk chunk by chunk instead of being held in memory, an interrupted download continues
+# where it stopped with a Range request and the file is only moved into place once its size (and checksum) match
+
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+
+import requests
+from rich.progress import Progress, TaskID
+
+from ftp_download import part_suffix
+
+chunk_size: int = 1024 * 1024
+
+# Seconds to wait for the connection and between two chunks, a stalled transfer fails instead of hanging forever
+timeout: tuple[float, float] = (10, 60)
+
+
+class IntegrityError(Exception):
+    pass
+
+
+@dataclass
+class RemoteResource:
+    url: str
+    size: int | None = None
+    modified: str | None = None  # Last-Modified header
+    etag: str | None = None
+    accept_ranges: bool = False
+
+
+def head(url: str, session: requests.Session | None = None) -> RemoteResource:
+    # Ask the server what the current file looks like without downloading it
+    response = (session or requests).head(url, allow_redirects=True, timeout=timeout)
+    response.raise_for_status()
+    content_length = response.headers.get("Content-Length")
+    return RemoteResource(
+        url=url,
+        size=int(content_length) if content_length is not None else None,
+        modified=response.headers.get("Last-Modified"),
+        etag=response.headers.get("ETag"),
+        accept_ranges=response.headers.get("Accept-Ranges", "").lower() == "bytes",
+    )
+
+
+def _hash_file(path: str, checksum) -> int:
+    size: int = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            checksum.update(chunk)
+            size += len(chunk)
+    return size
+
+
+def fetch(url: str, target_path: str, remote: RemoteResource | None = None, sha256: str | None = None,
+          session: requests.Session | None = None, progress: Progress | None = None,
+          task: TaskID | None = None) -> tuple[int, str]:
+    part_path: str = target_path + part_suffix
+    checksum = hashlib.sha256()
+
+    # Continue a previous attempt, If-Range makes the server send the whole file instead if it changed in between
+    headers: dict[str, str] = {}
+    offset: int = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        validator: str | None = (remote.etag or remote.modified) if remote is not None else None
+        if validator is not None:
+            headers["If-Range"] = validator
+
+    with (session or requests).get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416:
+            # The partial file is not a prefix of what the server has (anymore), start over
+            os.remove(part_path)
+            return fetch(url, target_path, remote, sha256, session, progress, task)
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            _hash_file(part_path, checksum)
+            mode: str = "ab"
+        else:
+            offset, mode = 0, "wb"
+
+        content_length = response.headers.get("Content-Length")
+        total: int | None = offset + int(content_length) if content_length is not None else None
+        if progress is not None and task is not None:
+            progress.update(task, total=total, completed=offset)
+
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                checksum.update(chunk)
+                if progress is not None and task is not None:
+                    progress.advance(task, len(chunk))
+
+    # Verify before the file is moved into place, a broken file is removed so the next attempt starts over
+    size: int = os.path.getsize(part_path)
+    expected_size: int | None = total if total is not None else (remote.size if remote is not None else None)
+    digest: str = checksum.hexdigest()
+    if expected_size is not None and size != expected_size:
+        os.remove(part_path)
+        raise IntegrityError(f"{url}: received {size} bytes, expected {expected_size}")
+    if sha256 is not None and digest != sha256:
+        os.remove(part_path)
+        raise IntegrityError(f"{url}: checksum {digest} does not match {sha256}")
+
+    os.replace(part_path, target_path)
+    return size, digest
+
+
+def download(url: str, target_path: str, remote: RemoteResource | None = None, sha256: str | None = None,
+             retries: int = 3, backoff: float = 0.5, progress: Progress | None = None,
+             description: str = "") -> tuple[int, str]:
+    # Every retry resumes from what is already on disk, raises the last error if all attempts fail
+    task: TaskID | None = progress.add_task(description, total=remote.size if remote else None) if progress else None
+    try:
+        with requests.Session() as session:
+            for attempt in range(retries + 1):
+                try:
+                    return fetch(url, target_path, remote, sha256, session, progress, task)
+                except (requests.RequestException, IntegrityError):
+                    if attempt == retries:
+                        raise
+                    time.sleep(backoff * 2 ** attempt)
+    finally:
+        if task is not None:
+            progress.remove_task(task)
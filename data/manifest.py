@@ -0,0 +1,63 @@
+# per-source manifest of downloaded files
+# remembers what the remote side looked like when a file was fetched and whether it made it into the database
+
+import json
+import os
+import threading
+
+manifest_dir: str = "manifests"
+
+# status of a manifest entry
+DOWNLOADED: str = "downloaded"
+INGESTED: str = "ingested"
+
+
+class Manifest:
+    def __init__(self, path: str):
+        self.path: str = path
+        self._lock = threading.Lock()
+        self.entries: dict[str, dict] = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    @classmethod
+    def for_source(cls, raw_data_dir: str, data_src_name: str) -> "Manifest":
+        return cls(os.path.join(raw_data_dir, manifest_dir, f"{data_src_name}.json"))
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def get(self, name: str) -> dict | None:
+        return self.entries.get(name)
+
+    def update(self, name: str, **fields):
+        with self._lock:
+            self.entries.setdefault(name, {}).update(fields)
+
+    def remove(self, name: str):
+        with self._lock:
+            self.entries.pop(name, None)
+
+    def is_current(self, name: str, size: int | None = None, modified: str | None = None, etag: str | None = None) -> bool:
+        # A file is current if we have it and the remote side did not report anything different since
+        entry = self.get(name)
+        if entry is None:
+            return False
+        return all(
+            value is None or entry.get(key) == value
+            for key, value in (("size", size), ("modified", modified), ("etag", etag))
+        )
+
+    def with_status(self, status: str) -> list[str]:
+        return [name for name, entry in self.entries.items() if entry.get("status") == status]
+
+    def save(self):
+        # Write atomically so an interrupted run never leaves a truncated manifest behind
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path: str = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(self.entries, file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,279 @@
+# dependency graph of the pipeline stages (download, extract and transform per source)
+# independent branches run at the same time, e.g. cloud_data is extracted while wind_data is still downloading
+# a stage is skipped when the fingerprint of its code, inputs and upstream stages is the same as after its last run
+#
+# usage (from the data directory):
+#   python pipeline.py                                run everything that is out of date
+#   python pipeline.py wind_data:transform            run a stage and whatever it depends on
+#   python pipeline.py --force wind_data:extract      ignore the cache of a stage
+#   python pipeline.py --list                         show the stages and their dependencies
+
+import argparse
+import hashlib
+import importlib.util
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+from logger import log
+from manifest import Manifest, manifest_dir
+from profiling import finish_run, span
+
+cache_path: str = "processed_data/pipeline_cache.json"
+
+# Stages running at the same time
+pipeline_workers: int = 4
+
+# Files named as inputs (manifests, station lists) and code are fingerprinted by content if they are small, the files
+# in input directories (the raw archives) and larger files by size and modification time
+content_hash_limit: int = 16 * 1024 * 1024
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], None]
+    deps: list[str] = field(default_factory=list)
+    code: list[str] = field(default_factory=list)  # source files whose changes invalidate the stage
+    inputs: Callable[[], list[str]] | None = None  # files and directories read by the stage, None runs it every time
+    resources: set[str] = field(default_factory=set)  # stages sharing a resource never run at the same time
+
+
+def _fingerprint_path(path: str, checksum, content: bool = True):
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file in sorted(files):
+                _fingerprint_path(os.path.join(root, file), checksum, content=False)
+    elif os.path.exists(path):
+        stat = os.stat(path)
+        if content and stat.st_size <= content_hash_limit:
+            with open(path, "rb") as f:
+                checksum.update(f"{path}:".encode() + hashlib.sha256(f.read()).digest())
+        else:
+            checksum.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    else:
+        checksum.update(f"{path}:missing".encode())
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage], cache_path: str = cache_path):
+        self.stages: dict[str, Stage] = {stage.name: stage for stage in stages}
+        self.cache_path: str = cache_path
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+
+    def closure(self, targets: list[str]) -> set[str]:
+        # The targets and everything they depend on
+        selected: set[str] = set()
+        todo: list[str] = list(targets)
+        while todo:
+            name: str = todo.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name}")
+            if name not in selected:
+                selected.add(name)
+                todo.extend(self.stages[name].deps)
+        return selected
+
+    def fingerprint(self, stage: Stage, keys: dict[str, str | None]) -> str:
+        checksum = hashlib.sha256(stage.name.encode())
+        for path in stage.code:
+            _fingerprint_path(path, checksum)
+        for path in stage.inputs():
+            _fingerprint_path(path, checksum)
+        # Stages that always run don't change the fingerprint of what follows them, their outputs (files) do
+        for dep in sorted(stage.deps):
+            checksum.update(f"{dep}:{keys.get(dep)}".encode())
+        return checksum.hexdigest()
+
+    def _run_stage(self, stage: Stage, force: bool, cache: Manifest, keys: dict, locks: dict[str, threading.Lock]):
+        if stage.inputs is not None and not force:
+            entry: dict = cache.get(stage.name) or {}
+            if entry.get("fingerprint") == self.fingerprint(stage, keys):
+                keys[stage.name] = entry["fingerprint"]
+                log(f"Stage {stage.name} is up to date (skipping)", "success")
+                return
+
+        # Acquired in a fixed order so two stages never wait for each other
+        resource_locks = [locks[resource] for resource in sorted(stage.resources)]
+        for lock in resource_locks:
+            lock.acquire()
+        try:
+            with span("stage", stage=stage.name) as current:
+                stage.run()
+            seconds: float = current.seconds
+        finally:
+            for lock in reversed(resource_locks):
+                lock.release()
+
+        # Remember what the inputs look like after the run, that's what the next run compares against
+        if stage.inputs is not None:
+            keys[stage.name] = self.fingerprint(stage, keys)
+            cache.update(stage.name, fingerprint=keys[stage.name], seconds=round(seconds, 3))
+            cache.save()
+        log(f"Stage {stage.name} finished in {seconds:.1f}s", "info")
+
+    def run(self, targets: list[str] | None = None, force: set[str] = frozenset(), workers: int = pipeline_workers) -> set[str]:
+        # Returns the stages that failed or were not run because something they depend on failed
+        selected: set[str] = self.closure(targets or list(self.stages))
+        unknown: set[str] = set(force) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stage {', '.join(sorted(unknown))}")
+
+        cache = Manifest(self.cache_path)
+        locks = {resource: threading.Lock() for stage in self.stages.values() for resource in stage.resources}
+        keys: dict[str, str | None] = {}
+        pending: set[str] = set(selected)
+        done: set[str] = set()
+        failed: set[str] = set()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running: dict = {}
+            while pending or running:
+                # Start everything whose dependencies are done
+                skipped: bool = False
+                for name in sorted(pending):
+                    deps: list[str] = self.stages[name].deps
+                    if any(dep in failed for dep in deps):
+                        pending.remove(name)
+                        failed.add(name)
+                        skipped = True
+                        log(f"Stage {name} skipped (a dependency failed)", "failure")
+                    elif all(dep in done for dep in deps):
+                        pending.remove(name)
+                        running[executor.submit(self._run_stage, self.stages[name], name in force, cache, keys, locks)] = name
+
+                if not running:
+                    if pending and not skipped:
+                        raise ValueError(f"Dependency cycle between {', '.join(sorted(pending))}")
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name: str = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(name)
+                    except Exception as error:
+                        failed.add(name)
+                        log(f"Stage {name} failed ({error!r})", "error")
+        return failed
+
+
+def load_script(file_name: str):
+    # pull-data.py and transform-data.py aren't importable by name
+    module_name: str = file_name.removesuffix(".py").replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_stages() -> list[Stage]:
+    pull_data = load_script("pull-data.py")
+    transform_data = load_script("transform-data.py")
+    import stations
+    from sources import ftp_uri, weather_sources
+
+    raw_data_dir: str = pull_data.raw_data_dir
+
+    def manifest_path(name: str) -> str:
+        return os.path.join(raw_data_dir, manifest_dir, f"{name}.json")
+
+    pull_code: list[str] = ["pull-data.py", "sources.py", "manifest.py", "database.py"]
+    extract_code: list[str] = pull_code + ["extract.py", "dwd.py", "schema.py", "validation.py"]
+    transform_code: list[str] = ["transform-data.py", "sources.py", "schema.py", "storage.py", "validation.py", "cache.py",
+                                 "database.py"]
+
+    stages: list[Stage] = [
+        Stage("prepare", pull_data.prepare),
+        Stage("power_data:download", pull_data.download_power_data, deps=["prepare"], resources={"console"}),
+        Stage("power_data:extract", pull_data.extract_power_data, deps=["power_data:download"], code=pull_code + ["schema.py"],
+              inputs=lambda: [manifest_path("power_data")], resources={"data.sqlite"}),
+        Stage("transform:prepare", transform_data.prepare, deps=["prepare"]),
+        Stage("power_data:transform", transform_data.insert_power_data, deps=["power_data:extract", "transform:prepare"],
+              code=transform_code, inputs=lambda: [manifest_path("power_data")]),
+    ]
+
+    for data_src in weather_sources:
+        name: str = data_src["name"]
+
+        def download(data_src=data_src):
+            pull_data.report_download(data_src, pull_data.download(ftp_uri, data_src))
+
+        stages += [
+            Stage(f"{name}:download", download, deps=["prepare"]),
+            # Extraction shows a progress bar and writes data.sqlite, one source at a time, the station ids are checked
+            # against the station lists downloaded in this run
+            Stage(f"{name}:extract", lambda data_src=data_src: pull_data.extract_data_source(data_src),
+                  deps=[f"{name}:download", "station_data:extract"], code=extract_code,
+                  inputs=lambda name=name: [manifest_path(name), os.path.join(raw_data_dir, name)],
+                  resources={"console", "data.sqlite"}),
+            # The station ids of the station lists are checked while transforming
+            Stage(f"{name}:transform", getattr(transform_data, f"transform_{name}"),
+                  deps=[f"{name}:extract", "station_data:extract", "transform:prepare"], code=transform_code,
+                  inputs=lambda name=name: [manifest_path(name)]),
+        ]
+
+    def station_lists() -> list[str]:
+        return [os.path.join(raw_data_dir, data_src["name"], file) for data_src in weather_sources
+                if os.path.exists(os.path.join(raw_data_dir, data_src["name"]))
+                for file in sorted(os.listdir(os.path.join(raw_data_dir, data_src["name"])))
+                if stations.station_list_pattern in file]
+
+    stages += [
+        Stage("station_data:extract", pull_data.extract_station_data,
+              deps=[f"{data_src['name']}:download" for data_src in weather_sources], code=pull_code + ["stations.py", "validation.py"],
+              inputs=station_lists, resources={"data.sqlite"}),
+        Stage("station_data:transform", transform_data.transform_station_data,
+              deps=["station_data:extract", "transform:prepare"], code=["transform-data.py", "stations.py"],
+              inputs=station_lists),
+    ]
+
+    stages.append(Stage("aligned_data:transform", transform_data.align_data,
+                        deps=["power_data:transform", "station_data:transform"]
+                        + [f"{data_src['name']}:transform" for data_src in weather_sources],
+                        code=["align.py", "transform-data.py"], inputs=lambda: []))
+    stages.append(Stage("rollups", transform_data.update_all_rollups,
+                        deps=["power_data:transform", "station_data:transform"]
+                        + [f"{data_src['name']}:transform" for data_src in weather_sources],
+                        code=["rollups.py", "transform-data.py", "cache.py"], inputs=lambda: []))
+    # ANALYZE once everything is written, runs whenever one of the tables was rewritten
+    stages.append(Stage("optimize", transform_data.optimize, deps=["aligned_data:transform", "rollups"],
+                        code=["database.py"], inputs=lambda: []))
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the data pipeline stages that are out of date")
+    parser.add_argument("stages", nargs="*", help="stages to run (with their dependencies), default all")
+    parser.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="run these stages even if they are up to date")
+    parser.add_argument("--force-all", action="store_true", help="ignore the cache completely")
+    parser.add_argument("--workers", type=int, default=pipeline_workers, help="stages running at the same time")
+    parser.add_argument("--list", action="store_true", help="list the stages and exit")
+    args = parser.parse_args()
+
+    pipeline = Pipeline(create_stages())
+    if args.list:
+        for stage in pipeline.stages.values():
+            log(f"{stage.name}" + (f" <- {', '.join(stage.deps)}" if stage.deps else ""), "info")
+        return
+
+    force: set[str] = set(pipeline.stages) if args.force_all else set(args.force)
+    log("Starting pipeline", "info")
+    failed: set[str] = pipeline.run(args.stages or None, force=force, workers=args.workers)
+    finish_run("Pipeline")
+    if failed:
+        log(f"Pipeline failed ({', '.join(sorted(failed))})", "error", timestamp=True)
+        sys.exit(1)
+    log("Completed pipeline", "success", timestamp=True)
+
+
+if __name__ == "__main__":
+    main()
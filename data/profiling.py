@@ -0,0 +1,228 @@
+# timing instrumentation next to logger.log
+# spans measure wall time, rows, bytes and the peak memory of a step (sampled while it runs), at the end of a run they
+# are appended to a json-lines report (one line per span, so runs can be compared) and printed as a summary table
+#
+# example:
+#   with span("extract", source="wind_data") as current:
+#       current.add(rows=extract(...))
+#
+#   @timed("transform")
+#   def transform_table(table_name):
+#       current_span().add(rows=..., source=table_name)
+#
+#   finish_run()  # at the end of main()
+
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from rich.console import Console
+from rich.table import Table
+
+from logger import log
+
+report_path: str = "processed_data/run_report.jsonl"
+
+run_id: str = uuid.uuid4().hex[:12]
+
+# Memory is sampled from /proc while spans are open, spans are recorded without memory usage where it doesn't exist
+sample_interval: float = 0.05  # seconds
+proc_available: bool = os.path.exists("/proc/self/statm")
+
+
+@dataclass
+class Span:
+    name: str
+    started: str  # ISO timestamp
+    seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    peak_rss_mb: float | None = None
+    parent: str | None = None
+    fields: dict = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)  # named counters, e.g. the rows rejected per validation rule
+
+    def add(self, rows: int = 0, bytes: int = 0, **fields):
+        self.rows += rows
+        self.bytes += bytes
+        self.fields.update(fields)
+
+    def count(self, counts: dict[str, int]):
+        for name, count in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+_spans: list[Span] = []
+_lock = threading.Lock()
+_current: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+_active: dict[int, Span] = {}
+_sampler_lock = threading.Lock()
+_sampler: threading.Thread | None = None
+
+
+def _descendants(pid: int) -> list[int]:
+    # Child processes of every thread, and theirs
+    found: list[int] = []
+    todo: list[int] = [pid]
+    while todo:
+        parent: int = todo.pop()
+        try:
+            tasks: list[str] = os.listdir(f"/proc/{parent}/task")
+        except OSError:  # exited
+            continue
+        for task in tasks:
+            try:
+                with open(f"/proc/{parent}/task/{task}/children") as file:
+                    children: list[int] = [int(child) for child in file.read().split()]
+            except OSError:
+                continue
+            found += children
+            todo += children
+    return found
+
+
+def rss_mb() -> float | None:
+    # Resident memory right now of this process and its child processes, e.g. the zip parsing workers
+    if not proc_available:
+        return None
+    pages: int = 0
+    for pid in [os.getpid(), *_descendants(os.getpid())]:
+        try:
+            with open(f"/proc/{pid}/statm") as file:
+                pages += int(file.read().split()[1])
+        except OSError:  # exited in between
+            continue
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _sample():
+    # One thread samples for all open spans, it stops once the last one closed
+    global _sampler
+    while True:
+        with _sampler_lock:
+            if not _active:
+                _sampler = None
+                return
+            active: list[Span] = list(_active.values())
+        rss: float | None = rss_mb()
+        for recorded in active:
+            recorded.peak_rss_mb = max(recorded.peak_rss_mb or 0.0, rss)
+        time.sleep(sample_interval)
+
+
+def _track(recorded: Span):
+    global _sampler
+    with _sampler_lock:
+        _active[id(recorded)] = recorded
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample, name="rss-sampler", daemon=True)
+            _sampler.start()
+
+
+def _untrack(recorded: Span):
+    with _sampler_lock:
+        _active.pop(id(recorded), None)
+
+
+def current_span() -> Span:
+    # Outside of a span the numbers go nowhere, so instrumented functions also work when called directly
+    current: Span | None = _current.get()
+    return current if current is not None else Span("untracked", "")
+
+
+@contextmanager
+def span(name: str, **fields):
+    parent: Span | None = _current.get()
+    current = Span(name, datetime.now().isoformat(timespec="milliseconds"), parent=parent.name if parent else None, fields=fields)
+    token = _current.set(current)
+
+    # The peak resident memory while the span is open, sampled at the start, the end and every sample_interval
+    current.peak_rss_mb = rss_mb()
+    if current.peak_rss_mb is not None:
+        _track(current)
+    start: float = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        if current.peak_rss_mb is not None:
+            _untrack(current)
+            current.peak_rss_mb = max(current.peak_rss_mb, rss_mb())
+        _current.reset(token)
+        with _lock:
+            _spans.append(current)
+
+
+def timed(name: str | None = None, **fields):
+    # Decorator recording every call as a span, the function adds rows, bytes and fields through current_span()
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name or function.__name__, **fields):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def spans() -> list[Span]:
+    with _lock:
+        return list(_spans)
+
+
+def write_report(path: str = report_path):
+    records: list[dict] = [
+        {"run": run_id, **asdict(recorded), "rows_per_second": recorded.rows_per_second,
+         "bytes_per_second": recorded.bytes_per_second}
+        for recorded in spans()
+    ]
+    directory: str = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+
+
+def summary_table(title: str = "Run summary") -> Table:
+    table = Table(title=title)
+    for column in ("Step", "Time", "Rows", "Rows/s", "MB", "MB/s", "Peak RSS"):
+        table.add_column(column, justify="left" if column == "Step" else "right")
+
+    for recorded in sorted(spans(), key=lambda recorded: recorded.started):
+        label: str = recorded.name + "".join(f" {value}" for value in recorded.fields.values())
+        table.add_row(
+            ("  " if recorded.parent else "") + label,
+            f"{recorded.seconds:.2f}s",
+            f"{recorded.rows:,}" if recorded.rows else "",
+            f"{recorded.rows_per_second:,.0f}" if recorded.rows else "",
+            f"{recorded.bytes / 1e6:.1f}" if recorded.bytes else "",
+            f"{recorded.bytes_per_second / 1e6:.2f}" if recorded.bytes else "",
+            f"{recorded.peak_rss_mb:.0f} MB" if recorded.peak_rss_mb is not None else "",
+        )
+    return table
+
+
+def finish_run(title: str = "Run summary", path: str = report_path):
+    # Append the spans of this run to the report and print them, called once at the end of main()
+    if not spans():
+        return
+    write_report(path)
+    Console().print(summary_table(title))
+    log(f"Wrote run report {run_id} to {path}", "info")
@@ -1,27 +1,52 @@
 import os
 import re
-import sqlite3
-import zipfile
-from ftplib import FTP
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import pandas
 import requests
 import sqlalchemy
-from rich.progress import track
-
+from rich.progress import DownloadColumn, Progress, TransferSpeedColumn
+
+from ftp_download import DownloadStats, FTPPool, download_files
+import database
+import http_download
+import schema
+import stations
+import validation
+from extract import checkpoints, extract_zips, file_version, is_extracted, record_checkpoints
 from logger import log
+from manifest import DOWNLOADED, INGESTED, Manifest
+from profiling import current_span, finish_run, timed
+from sources import ftp_uri, in_window, mess_datum_range, weather_sources
 
 raw_data_dir: str = "raw_data"
 processed_data_dir: str = "processed_data"
 
+# Parallel ftp sessions per data source and retries per file
+ftp_connections: int = 4
+ftp_retries: int = 3
+
+# Processes parsing zip files during extraction (None uses all cores)
+extract_workers: int | None = None
+
+power_data_src: str = "https://data.open-power-system-data.org/time_series/2020-10-06/time_series.sqlite"
+
 db_connection_uri: str = "sqlite:///processed_data/data.sqlite"
 # db_connection_uri: str = "sqlite:///../data.sqlite"
-engine = sqlalchemy.create_engine(db_connection_uri)
+engine = database.create_engine(db_connection_uri, "bulk")
 
 
 def main():
     log("Starting data collector", "info")
+    prepare()
+    pull_power_data()
+    pull_weather_data()
+    database.optimize(engine)
+    log("Completed data collection", timestamp=True)
+    finish_run("Data collection")
+
 
+def prepare():
     # Create a raw_data folder if it doesn't exist
     if not os.path.exists(raw_data_dir):
         os.makedirs(raw_data_dir)
@@ -30,27 +55,71 @@ def main():
     if not os.path.exists(processed_data_dir):
         os.makedirs(processed_data_dir)
 
-    pull_power_data()
-    # pull_station_date()
-    pull_weather_data()
-    log("Completed data collection", timestamp=True)
-
 
 def pull_power_data():
-    power_data_src: str = "https://data.open-power-system-data.org/time_series/2020-10-06/time_series.sqlite"
+    download_power_data()
+    extract_power_data()
+
 
-    # Only download the power_data if it doesn't exist
+@timed("download", source="power_data")
+def download_power_data():
     data_src_path: str = os.path.join(raw_data_dir, "power_data.sqlite")
-    if not os.path.exists(data_src_path):
-        response = requests.get(power_data_src)
-        if response.status_code == 200:
-            with open(data_src_path, "wb") as file:
-                file.write(response.content)
-                log("Downloaded power_data", "success")
-        else:
-            log("Could not download power_data", "error")
-    else:
+    file_name: str = os.path.basename(data_src_path)
+    manifest = Manifest.for_source(raw_data_dir, "power_data")
+
+    # Ask the server what the current file looks like without downloading it
+    resource: http_download.RemoteResource | None = None
+    remote: dict = {}
+    try:
+        resource = http_download.head(power_data_src)
+        remote = {"size": resource.size, "modified": resource.modified, "etag": resource.etag}
+    except requests.RequestException:
+        log("Could not reach power_data server (using local files)", "failure")
+
+    # Adopt files downloaded before manifests existed
+    if os.path.exists(data_src_path) and manifest.get(file_name) is None:
+        manifest.update(file_name, size=os.path.getsize(data_src_path), modified=remote.get("modified"),
+                        etag=remote.get("etag"), status=DOWNLOADED)
+        if sqlalchemy.inspect(engine).has_table("power_data"):
+            manifest.update(file_name, status=INGESTED)
+
+    # Only download the power_data if it doesn't exist or changed on the server
+    if os.path.exists(data_src_path) and manifest.is_current(file_name, **remote):
         log("Found power_data files (skipping download)", "success")
+    else:
+        # Streamed to disk in chunks, an interrupted download is resumed on the next attempt (or run)
+        columns = [*Progress.get_default_columns(), DownloadColumn(), TransferSpeedColumn()]
+        desc: str = log("Downloading power_data from server", "status", ret_str=True)
+        try:
+            with Progress(*columns, transient=True) as progress:
+                start: float = time.perf_counter()
+                size, checksum = http_download.download(power_data_src, data_src_path, remote=resource,
+                                                        progress=progress, description=desc)
+                seconds: float = time.perf_counter() - start
+            current_span().add(bytes=size)
+            manifest.update(file_name, size=size, sha256=checksum, modified=remote.get("modified"),
+                            etag=remote.get("etag"), status=DOWNLOADED)
+            log(f"Downloaded power_data ({size / 1e6:.1f} MB in {seconds:.1f}s, {size / 1e6 / max(seconds, 1e-9):.2f} MB/s)", "success")
+        except (requests.RequestException, http_download.IntegrityError) as error:
+            log(f"Could not download power_data ({error})", "error")
+    manifest.save()
+
+
+@timed("extract", source="power_data")
+def extract_power_data():
+    data_src_path: str = os.path.join(raw_data_dir, "power_data.sqlite")
+    file_name: str = os.path.basename(data_src_path)
+    manifest = Manifest.for_source(raw_data_dir, "power_data")
+
+    # ATTACH would create an empty database instead of failing
+    if not os.path.exists(data_src_path):
+        raise FileNotFoundError(f"{data_src_path} does not exist, download power_data first")
+
+    # Nothing to do if this exact file was already extracted, checked before anything is read
+    entry = manifest.get(file_name) or {}
+    if entry.get("status") == INGESTED and sqlalchemy.inspect(engine).has_table("power_data"):
+        log(f"Found power_data table (skipping extraction)", "success")
+        return
 
     # Filter the original dataset to only include the columns we need
     columns: list[str] = [
@@ -98,168 +167,193 @@ def pull_power_data():
         "DE_transnetbw_wind_onshore_generation_actual",
     ]
 
-    query: str = 'SELECT {} FROM time_series_60min_singleindex'.format(", ".join(columns))
-
-    # Query our data and save it to a dataframe
-    connection = sqlite3.connect(data_src_path)
-    data_frame = pandas.read_sql_query(query, connection)
-    connection.close()
-
-    # Debug print
-    # print(data_frame)
-
-    # Save the data to a sqlite database if the table doesn't already exist
-    if sqlalchemy.inspect(engine).has_table("power_data"):
-        log(f"Found power_data table (skipping extraction)", "success")
-    else:
-        data_frame.to_sql("power_data", engine, if_exists="replace", index=False)
-        log("Extracted power_data", "success")
-
-
-# def pull_station_date():
-#     station_data_src: str = "https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/subdaily/wind/historical/FK_Terminwerte_Beschreibung_Stationen.txt"
-#
-#     # Only download the station_data if it doesn't exist
-#     data_src_path: str = os.path.join(raw_data_dir, "station_data.txt")
-#     if not os.path.exists(data_src_path):
-#         response = requests.get(station_data_src)
-#         if response.status_code == 200:
-#             with open(data_src_path, "wb") as file:
-#                 file.write(response.content.decode("ISO-8859-1").encode("UTF-8"))  # Convert to UTF-8 encoding
-#                 log("Downloaded station_data", "success")
-#         else:
-#             log("Could not download station_data", "error")
-#     else:
-#         log("Found station_data files (skipping download)", "success")
-#
-#     # Insert the data into the database only if the table doesn't already exist
-#     if sqlalchemy.inspect(engine).has_table("station_data"):
-#         log("Found station_data table (skipping extraction)", "success")
-#         return
-#
-#     # Extract the data from the file
-#     column_widths = [(0, 5), (6, 14), (15, 23), (24, 38), (39, 50), (51, 60), (61, 101), (102, None)]
-#     column_names = ["station_id", "von_datum", "bis_datum", "station_height", "latitude", "longitude", "station_name", "state"]
-#
-#     # Read the fixed-width file into a DataFrame
-#     data_frame = pandas.read_fwf(data_src_path, colspecs=column_widths, names=column_names, skiprows=2)
-#     data_frame.to_sql("station_data", engine, if_exists="replace", index=False)
-#
-#     log("Extracted station_data", "success")
-
-
-def pull_weather_data():
-    data_sources = [
-        {
-            "name": "rain_data",
-            "path": "climate_environment/CDC/observations_germany/climate/daily/more_precip/historical/",
-            "columns": ["STATIONS_ID", "MESS_DATUM", "  RS", " RSF", "SH_TAG", "NSH_TAG"]
-        },
-        {
-            "name": "cloud_data",
-            "path": "climate_environment/CDC/observations_germany/climate/subdaily/cloudiness/historical/",
-            "columns": ["STATIONS_ID", "MESS_DATUM", "N_TER", "CD_TER"]
-        },
-        {
-            "name": "temperature_data",
-            "path": "climate_environment/CDC/observations_germany/climate/subdaily/air_temperature/historical/",
-            "columns": ["STATIONS_ID", "MESS_DATUM", "TT_TER", "RF_TER"]
-        },
-        {
-            "name": "wind_data",
-            "path": "climate_environment/CDC/observations_germany/climate/subdaily/wind/historical/",
-            "columns": ["STATIONS_ID", "MESS_DATUM", "DK_TER", "FK_TER"]
-        }
+    # Copy the columns inside sqlite, the rows never pass through pandas
+    selected: list[str] = [schema.power_timestamp_sql.get(column, f'CAST("{column}" AS REAL)') for column in columns]
+    column_defs: list[str] = [f'"{column}" {"DATETIME" if column in schema.power_timestamp_columns else "REAL"}'
+                              for column in columns]
+
+    # Explicit transaction so the old table is only replaced once all rows are in (the driver would commit the DDL)
+    connection = database.connect(engine.url.database, "bulk", isolation_level=None)
+    try:
+        connection.execute("ATTACH DATABASE ? AS source", (data_src_path,))
+        connection.execute("BEGIN")
+        try:
+            connection.execute("DROP TABLE IF EXISTS power_data")
+            connection.execute(f"CREATE TABLE power_data ({', '.join(column_defs)})")
+            cursor = connection.execute(
+                f"INSERT INTO power_data SELECT {', '.join(selected)} FROM source.time_series_60min_singleindex"
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        current_span().add(rows=cursor.rowcount)
+    finally:
+        connection.close()
+
+    manifest.update(file_name, status=INGESTED)
+    manifest.save()
+    log("Extracted power_data", "success")
+
+
+@timed("extract", source="station_data")
+def extract_station_data():
+    # The station lists come with the archives of every source (files without a time span are always downloaded)
+    paths: list[str] = [
+        os.path.join(raw_data_dir, data_src["name"], file)
+        for data_src in weather_sources if os.path.exists(os.path.join(raw_data_dir, data_src["name"]))
+        for file in sorted(os.listdir(os.path.join(raw_data_dir, data_src["name"])))
+        if stations.station_list_pattern in file and file.endswith(".txt")
     ]
-    ftp_uri: str = "opendata.dwd.de"
+    if not paths:
+        log("Found no station lists (skipping station_data)", "failure")
+        return
 
-    for data_src in data_sources:
-        if os.path.exists(os.path.join(raw_data_dir, data_src['name'])):
-            log(f"Found {data_src['name']} files (skipping download)", "success")
-        else:
-            download(ftp_uri, data_src['name'], data_src['path'])
-            log(f"Downloaded {data_src['name']}", "success")
+    data_frame = stations.merge_station_lists([stations.read_station_list(path) for path in paths])
+    validator = validation.Validator("station_data")
+    data_frame, rejected = validator.check(data_frame)
+    data_frame.to_sql("station_data", engine, if_exists="replace", index=False)
+    validation.drop_quarantine(engine, "station_data")
+    validation.write_quarantine(engine, "station_data", rejected)
+    current_span().add(rows=len(data_frame), files=len(paths))
+    current_span().count(validator.counts)
+    log(f"Extracted station_data ({len(data_frame)} stations, {validator.summary()})", "success")
 
-        if sqlalchemy.inspect(engine).has_table(data_src["name"]):
-            log(f"Found {data_src['name']} table (skipping extraction)", "success")
-        else:
-            extract_data_source(data_src['name'], data_src["columns"])
-            log(f"Extracted {data_src['name']}", "success")
 
+def pull_weather_data():
+    # Sync all sources at the same time, each one with its own pool of ftp connections
+    stats = DownloadStats()
+    start: float = time.perf_counter()
+    with Progress(transient=True) as progress, ThreadPoolExecutor(max_workers=len(weather_sources)) as executor:
+        futures = {executor.submit(download, ftp_uri, data_src, progress): data_src for data_src in weather_sources}
+        for future in as_completed(futures):
+            source_stats = future.result()
+            stats.merge(source_stats)
+            report_download(futures[future], source_stats)
+    stats.seconds = time.perf_counter() - start
+    if stats.files > 0:
+        log(f"Downloaded {stats.files} files ({stats.bytes / 1e6:.1f} MB) in {stats.seconds:.1f}s ({stats.throughput / 1e6:.2f} MB/s)", "info")
+
+    # The station lists arrive with the archives, the rows of stations added on the server are checked against them
+    extract_station_data()
+    for data_src in weather_sources:
+        extract_data_source(data_src)
+
+
+def report_download(data_src: dict, stats: DownloadStats):
+    if stats.failed:
+        log(f"Could not download {len(stats.failed)} {data_src['name']} files", "error")
+    elif stats.files == 0:
+        log(f"Found {data_src['name']} files (nothing changed on server)", "success")
+    else:
+        log(f"Downloaded {stats.files} new or changed {data_src['name']} files", "success")
 
-def download(ftp_uri: str, data_src_name: str, path: str):
-    ftp = FTP(ftp_uri)
-    ftp.login()
 
-    folder_path, file_name = os.path.split(path)
-    ftp.cwd(folder_path)
+@timed("download")
+def download(ftp_uri: str, data_src: dict, progress: Progress | None = None) -> DownloadStats:
+    data_src_name: str = data_src["name"]
+    folder_path, file_name = os.path.split(data_src["path"])
+    current_span().add(source=data_src_name)
 
     # Get a list of all files
-    if file_name is None or file_name == "":
-        files = ftp.nlst()
-    else:
+    if file_name is not None and file_name != "":
         log(f"Can not download single file: {file_name}", "error")
-        ftp.quit()
-        return
+        return DownloadStats()
 
-    # Create a folder named after the data source if it doesn't already exist
     data_src_dir: str = os.path.join(raw_data_dir, data_src_name)
-    print(data_src_dir)
-    if not os.path.exists(data_src_dir):
-        os.mkdir(data_src_dir)
-
-    # # Filter files by timeframe (2000-2024)
-    # filtered_files: list[str] = []
-    # for file in files:
-    #     match = re.search(r"(\d{8})_(\d{8})", file)
-    #     if match:
-    #         start_date, end_date = match.group(1), match.group(2)
-    #         if start_date >= "20000101" and end_date <= "20240101":  # (2000-2024)
-    #             filtered_files.append(file)
-
-    # Download each file
-    desc: str = log(f"Downloading {data_src_name} from server", "status", ret_str=True)
-    progress = track(files, description=desc, transient=True)
-    for file in progress:
-        local_filename: str = os.path.join(data_src_dir, file)
-        with open(local_filename, "wb") as f:
-            def callback(chunk):
-                f.write(chunk)
-
-            ftp.retrbinary("RETR " + file, callback)
-
-    # Close FTP connection
-    ftp.quit()
-
-
-def extract_data_source(data_src_name: str, filter_items: list[str]):
+    manifest = Manifest.for_source(raw_data_dir, data_src_name)
+    pool = FTPPool(ftp_uri, folder_path, size=ftp_connections)
+    try:
+        remote_files = pool.listing()
+
+        # Adopt files downloaded before manifests existed, the old pipeline extracted a source completely or not at all
+        if not manifest.exists() and os.path.exists(data_src_dir):
+            ingested: bool = sqlalchemy.inspect(engine).has_table(data_src_name)
+            for file in os.listdir(data_src_dir):
+                remote_file = remote_files.get(file)
+                if remote_file is not None and remote_file.size == os.path.getsize(os.path.join(data_src_dir, file)):
+                    manifest.update(file, size=remote_file.size, modified=remote_file.modified,
+                                    status=INGESTED if ingested else DOWNLOADED)
+
+        # Only fetch files that cover the time window of the source and are new or changed since the last run
+        files: list[str] = [
+            file for file, remote_file in remote_files.items()
+            if in_window(data_src, file)
+            and not (manifest.is_current(file, remote_file.size, remote_file.modified)
+                     and os.path.exists(os.path.join(data_src_dir, file)))
+        ]
+
+        def on_complete(file: str, size: int, checksum: str):
+            # A changed file that was extracted before has to replace its old rows
+            previous = manifest.get(file) or {}
+            manifest.update(file, size=size, modified=remote_files[file].modified, sha256=checksum, status=DOWNLOADED,
+                            replaces_rows=previous.get("status") == INGESTED or previous.get("replaces_rows", False))
+
+        # Download each file into a folder named after the data source
+        desc: str = log(f"Downloading {data_src_name} from server", "status", ret_str=True)
+        stats: DownloadStats = download_files(pool, files, data_src_dir, retries=ftp_retries, progress=progress,
+                                              description=desc, on_complete=on_complete)
+        current_span().add(bytes=stats.bytes, files=stats.files)
+        return stats
+    finally:
+        manifest.save()
+        # Close FTP connections
+        pool.close()
+
+
+@timed("extract")
+def extract_data_source(data_src: dict):
+    data_src_name: str = data_src["name"]
+    current_span().add(source=data_src_name)
     path: str = os.path.join(raw_data_dir, data_src_name)
+    manifest = Manifest.for_source(raw_data_dir, data_src_name)
+
+    # The checkpoints in the database decide what is extracted, they are committed with the rows (the manifest is only
+    # saved afterwards). Zips that a database from before the checkpoints has according to the manifest are adopted
+    available: dict[str, str] = {file: os.path.join(path, file) for file in manifest.entries
+                                 if file.endswith(".zip") and in_window(data_src, file) and os.path.exists(os.path.join(path, file))}
+    extracted: dict[str, dict] = checkpoints(engine.url.database, data_src_name)
+    if not extracted and sqlalchemy.inspect(engine).has_table(data_src_name):
+        adopted: list[str] = [file for file in manifest.with_status(INGESTED) if file in available]
+        record_checkpoints(engine.url.database, data_src_name, {file: file_version(available[file]) for file in adopted})
+        extracted = checkpoints(engine.url.database, data_src_name)
+
+    # Get a list of all zip files in the time window that were downloaded but are not in the database yet
+    zip_files: list[str] = []
+    for file, zip_path in available.items():
+        if not is_extracted(zip_path, extracted.get(file)):
+            zip_files.append(file)
+        elif manifest.get(file).get("status") != INGESTED:
+            # Committed by a run that was interrupted before it saved the manifest
+            manifest.update(file, status=INGESTED, replaces_rows=False)
+    manifest.save()
+
+    if not zip_files:
+        log(f"Found {data_src_name} table (skipping extraction)", "success")
+        return
 
-    # Get a list of all zip files in the folder
-    zip_files = [file for file in os.listdir(path) if file.endswith(".zip")]
-
-    # Iterate over the zips with a progress bar
-    desc = log(f"Extracting {data_src_name} into database", "status", ret_str=True)
-
-    for zip_file in track(zip_files, description=desc, transient=True):
-        zip_path: str = os.path.join(path, zip_file)
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-
-            # Get a list of member files contained in the zip file (excluding metadata files)
-            member_files = [member for member in zip_ref.namelist() if not member.startswith("Metadaten_")]
+    # Files that replace an already extracted version of themselves
+    replaces_rows: set[str] = {file for file in zip_files if manifest.get(file).get("replaces_rows")}
 
-            # Read each member file into a pandas DataFrame
-            for member in member_files:
-                with zip_ref.open(name=member, mode="r") as tmp_file:
-                    data_frame = pandas.read_csv(tmp_file, sep=";")
+    def on_committed(committed_files: list[str]):
+        for file in committed_files:
+            manifest.update(file, status=INGESTED, replaces_rows=False)
+        manifest.save()
 
-                    # Remove unnecessary columns from the DataFrame
-                    data_frame = data_frame.filter(items=filter_items)
+    # Checked against station_data, which extract_station_data() refreshed from the station lists downloaded with the
+    # archives, rows of stations missing there would stay in the quarantine once their zip is checkpointed
+    validator = validation.Validator(data_src_name, references=validation.station_references(engine),
+                                     columns=validation.raw_columns(data_src_name))
 
-                    # print(data_frame)
+    # Parse the zips in parallel while the rows are written in large batches
+    desc = log(f"Extracting {data_src_name} into database", "status", ret_str=True)
+    rows: int = extract_zips([os.path.join(path, file) for file in zip_files], engine.url.database, data_src_name,
+                             data_src["columns"], mess_datum_range(data_src), replaces_rows=replaces_rows,
+                             workers=extract_workers, on_committed=on_committed, description=desc, validator=validator)
 
-                    # Store the data into the SQLiteDB
-                    data_frame.to_sql(data_src_name, engine, if_exists="append", index=False)
+    current_span().add(rows=rows, files=len(zip_files))
+    current_span().count(validator.counts)
+    log(f"Extracted {len(zip_files)} {data_src_name} files ({rows} rows, {validator.summary()})", "success")
 
 
 if __name__ == "__main__":
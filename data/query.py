@@ -0,0 +1,181 @@
+# analytical queries over transformed_data.sqlite
+# aggregation and joins happen inside sqlite on the indexed tables, pandas only receives the (small) result
+#
+# example:
+#   engine = database.create_engine("../data/processed_data/transformed_data.sqlite")
+#   df = query.power_weather(engine, ["DE_wind_generation_actual"], {"wind_data": ["speed"]}, freq="daily")
+
+import pandas
+import sqlalchemy
+
+import rollups
+
+# Expressions truncating a timestamp column to the aggregation period, the timestamps are stored as ISO 8601 text
+# ("2015-01-01 06:00:00.000000" or "2015-01-01T01:00:00+0100"), so cutting the string works for both
+periods: dict[str, str] = {
+    "hourly": "substr({column}, 1, 10) || ' ' || substr({column}, 12, 2) || ':00:00'",
+    "daily": "substr({column}, 1, 10)",
+    "monthly": "substr({column}, 1, 7) || '-01'",
+}
+
+aggregations: set[str] = {"avg", "min", "max", "sum", "count"}
+
+# Key the transformed weather tables are clustered on, and indexes created by the transform stage for the queries below
+# (the ones on the leading columns of the key are left out for clustered tables)
+weather_key: tuple[str, ...] = ("station_id", "date")
+weather_indexes: list[tuple[str, ...]] = [("station_id", "date"), ("date",)]
+power_indexes: list[tuple[str, ...]] = [("utc_timestamp",), ("cet_cest_timestamp",)]
+
+
+def _period(column: str, freq: str) -> str:
+    if freq not in periods:
+        raise ValueError(f"Unknown frequency {freq}, expected one of {', '.join(periods)}")
+    return periods[freq].format(column=f'"{column}"')
+
+
+def _aggregates(columns: list[str] | dict[str, str]) -> str:
+    # A list averages every column, a dict maps columns to one of the supported aggregations
+    if not isinstance(columns, dict):
+        columns = {column: "avg" for column in columns}
+
+    expressions: list[str] = []
+    for column, aggregation in columns.items():
+        if aggregation not in aggregations:
+            raise ValueError(f"Unknown aggregation {aggregation}, expected one of {', '.join(sorted(aggregations))}")
+        expressions.append(f'{aggregation.upper()}("{column}") AS "{column}"')
+    return ", ".join(expressions)
+
+
+def _range(column: str, start, end, params: dict, name: str) -> list[str]:
+    # Plain comparisons on the stored text, so sqlite can answer them from the index
+    conditions: list[str] = []
+    if start is not None:
+        conditions.append(f'"{column}" >= :{name}_start')
+        params[f"{name}_start"] = str(pandas.Timestamp(start))
+    if end is not None:
+        conditions.append(f'"{column}" < :{name}_end')
+        params[f"{name}_end"] = str(pandas.Timestamp(end))
+    return conditions
+
+
+def _weather_query(table_name: str, columns, freq: str, start, end, stations: list[int] | None, params: dict) -> str:
+    conditions: list[str] = _range("date", start, end, params, table_name)
+    if stations:
+        conditions.append(f"station_id IN ({', '.join(str(int(station)) for station in stations)})")
+    where: str = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    period: str = _period("date", freq)
+    return f'SELECT {period} AS period, {_aggregates(columns)} FROM "{table_name}"{where} GROUP BY period'
+
+
+def _power_query(columns, freq: str, start, end, timestamp_column: str, params: dict) -> str:
+    conditions: list[str] = _range(timestamp_column, start, end, params, "power_data")
+    where: str = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    period: str = _period(timestamp_column, freq)
+    return f'SELECT {period} AS period, {_aggregates(columns)} FROM "power_data"{where} GROUP BY period'
+
+
+def _read(engine: sqlalchemy.Engine, query: str, params: dict) -> pandas.DataFrame:
+    with engine.connect() as connection:
+        data_frame = pandas.read_sql_query(sqlalchemy.text(query), connection, params=params, parse_dates=["period"])
+    return data_frame.rename(columns={"period": "date"})
+
+
+def weather(engine: sqlalchemy.Engine, table_name: str, columns: list[str] | dict[str, str], freq: str = "daily",
+            start=None, end=None, stations: list[int] | None = None) -> pandas.DataFrame:
+    params: dict = {}
+    query: str = _weather_query(table_name, columns, freq, start, end, stations, params)
+    return _read(engine, query + " ORDER BY period", params)
+
+
+def power(engine: sqlalchemy.Engine, columns: list[str] | dict[str, str], freq: str = "daily", start=None, end=None,
+          timestamp_column: str = "cet_cest_timestamp") -> pandas.DataFrame:
+    params: dict = {}
+    query: str = _power_query(columns, freq, start, end, timestamp_column, params)
+    return _read(engine, query + " ORDER BY period", params)
+
+
+def power_weather(engine: sqlalchemy.Engine, power_columns: list[str] | dict[str, str],
+                  weather_columns: dict[str, list[str] | dict[str, str]], freq: str = "daily", start=None, end=None,
+                  stations: list[int] | None = None, timestamp_column: str = "cet_cest_timestamp") -> pandas.DataFrame:
+    # One row per period that has power data and data for every requested weather table (like the isin() in the report)
+    params: dict = {}
+    parts: list[str] = [f"power AS ({_power_query(power_columns, freq, start, end, timestamp_column, params)})"]
+    joins: list[str] = []
+    selected: list[str] = ["power.*"]
+    for table_name, columns in weather_columns.items():
+        alias: str = f"{table_name}_{freq}"
+        parts.append(f'"{alias}" AS ({_weather_query(table_name, columns, freq, start, end, stations, params)})')
+        joins.append(f'JOIN "{alias}" USING (period)')
+        names = columns.keys() if isinstance(columns, dict) else columns
+        selected += [f'"{alias}"."{column}"' for column in names]
+
+    query: str = f"WITH {', '.join(parts)} SELECT {', '.join(selected)} FROM power {' '.join(joins)} ORDER BY period"
+    return _read(engine, query, params)
+
+
+def rollup(engine: sqlalchemy.Engine, table_name: str, columns: list[str] | None = None, freq: str = "daily",
+           start=None, end=None) -> pandas.DataFrame:
+    # Read the materialized rollups of a table (see rollups.py), freq is "daily", "monthly" or "station_daily"
+    if freq not in ("daily", "monthly", "station_daily"):
+        raise ValueError(f"Unknown rollup {freq}, expected daily, monthly or station_daily")
+
+    selected: str = "*"
+    if columns is not None:
+        keys: list[str] = ["station_id", "date"] if freq == "station_daily" else ["date"]
+        selected = ", ".join(keys + [f'"{column}_{statistic}"' for column in columns for statistic in rollups.statistics])
+
+    params: dict = {}
+    conditions: list[str] = []
+    if start is not None:
+        conditions.append("date >= :start")
+        params["start"] = str(pandas.Timestamp(start).date())
+    if end is not None:
+        conditions.append("date < :end")
+        params["end"] = str(pandas.Timestamp(end).date())
+    where: str = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    query: str = f'SELECT {selected} FROM "{table_name}_{freq}"{where} ORDER BY date'
+    with engine.connect() as connection:
+        return pandas.read_sql_query(sqlalchemy.text(query), connection, params=params, parse_dates=["date"])
+
+
+def zones(engine: sqlalchemy.Engine, table_name: str, columns: list[str], statistic: str = "mean", start=None,
+          end=None) -> pandas.DataFrame:
+    # Daily weather per TSO zone (see rollups.update_zone_rollups), one column per zone and weather column named like
+    # the power columns, e.g. DE_tennet_speed next to DE_tennet_wind_generation_actual
+    if statistic not in rollups.statistics:
+        raise ValueError(f"Unknown statistic {statistic}, expected one of {', '.join(rollups.statistics)}")
+
+    params: dict = {}
+    conditions: list[str] = []
+    if start is not None:
+        conditions.append("date >= :start")
+        params["start"] = str(pandas.Timestamp(start).date())
+    if end is not None:
+        conditions.append("date < :end")
+        params["end"] = str(pandas.Timestamp(end).date())
+    where: str = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    selected: str = ", ".join(f'"{column}_{statistic}" AS "{column}"' for column in columns)
+    query: str = f'SELECT zone, date, {selected} FROM "{table_name}_zone_daily"{where} ORDER BY date'
+    with engine.connect() as connection:
+        data_frame = pandas.read_sql_query(sqlalchemy.text(query), connection, params=params, parse_dates=["date"])
+
+    data_frame = data_frame.pivot(index="date", columns="zone", values=columns)
+    data_frame.columns = [f"DE_{zone}_{column}" for column, zone in data_frame.columns]
+    return data_frame.reset_index()
+
+
+def aligned(engine: sqlalchemy.Engine, columns: list[str] | None = None, start=None, end=None) -> pandas.DataFrame:
+    # The power data with the weather on its utc_timestamp grid (see align.py), one row per hour, no joins needed
+    params: dict = {}
+    conditions: list[str] = _range("utc_timestamp", start, end, params, "aligned_data")
+    where: str = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    selected: str = ", ".join(f'"{column}"' for column in ["utc_timestamp", "cet_cest_timestamp", *columns]) if columns else "*"
+
+    query: str = f'SELECT {selected} FROM "aligned_data"{where} ORDER BY utc_timestamp'
+    with engine.connect() as connection:
+        return pandas.read_sql_query(sqlalchemy.text(query), connection, params=params,
+                                     parse_dates=["utc_timestamp", "cet_cest_timestamp"])
@@ -0,0 +1,79 @@
+# the frames project/report.ipynb works with, memoized on disk (see cache.py) so a kernel restart doesn't query the
+# database again, they are recomputed once transform-data.py rewrote one of the tables
+# the daily and monthly means come from the rollups (see rollups.py), only the hours of power_data and the rain_form
+# mode, which have no rollup, are read from the tables themselves
+#
+# example (from project/):
+#   engine = database.create_engine("../data/processed_data/transformed_data.sqlite")
+#   power_df = report_data.daily_power(engine)
+#   temperature_df = report_data.daily_weather(engine, "temperature_data")
+
+import pandas
+import sqlalchemy
+
+import query
+import schema
+from cache import memoize
+
+# Columns averaged per day for every weather table, the transform stage already removed the -999 marker and the
+# unknown precipitation forms (4, 9)
+weather_columns: dict[str, list[str]] = {
+    "temperature_data": ["temperature", "humidity"],
+    "rain_data": ["rain", "rain_form", "snow_height", "new_snow_height"],
+    "cloud_data": ["cloud_cover"],
+    "wind_data": ["speed"],
+}
+
+
+def _means(engine: sqlalchemy.Engine, table_name: str, columns: list[str], freq: str = "daily") -> pandas.DataFrame:
+    # The means of the rollups (see rollups.py) under the names of the columns
+    data_frame = query.rollup(engine, table_name, columns, freq=freq)
+    return data_frame[["date"] + [f"{column}_mean" for column in columns]].rename(
+        columns={f"{column}_mean": column for column in columns})
+
+
+def _power_columns(engine: sqlalchemy.Engine) -> list[str]:
+    return list(schema.power_dtypes([column["name"] for column in sqlalchemy.inspect(engine).get_columns("power_data")]))
+
+
+def daily_rain_form(engine: sqlalchemy.Engine) -> pandas.DataFrame:
+    # Most frequent precipitation form per day, 0 (no precipitation) doesn't count, ties go to the smaller form like
+    # Series.mode(). There is no rollup for a mode, sqlite counts the forms per day
+    data_frame = pandas.read_sql_query(
+        'SELECT substr(date, 1, 10) AS date, rain_form, COUNT(*) AS hours FROM rain_data '
+        'WHERE rain_form IS NOT NULL AND rain_form != 0 GROUP BY 1, 2', engine, parse_dates=["date"]
+    )
+    data_frame = data_frame.sort_values(["date", "hours", "rain_form"], ascending=[True, False, True])
+    return data_frame.drop_duplicates("date")[["date", "rain_form"]]
+
+
+@memoize(["power_data"])
+def hourly_power(engine: sqlalchemy.Engine, columns: list[str] | None = None) -> pandas.DataFrame:
+    # The hours themselves, e.g. for the variance within a day, which no rollup has
+    selected: list[str] | None = ["utc_timestamp", "cet_cest_timestamp", *columns] if columns else None
+    return pandas.read_sql_table("power_data", engine, columns=selected, parse_dates=["utc_timestamp", "cet_cest_timestamp"])
+
+
+@memoize(["power_data_daily"])
+def daily_power(engine: sqlalchemy.Engine) -> pandas.DataFrame:
+    # Mean per local day, the days are dates in cet_cest_timestamp like the weather dates
+    data_frame = _means(engine, "power_data", _power_columns(engine))
+    data_frame["date"] = data_frame["date"].dt.date
+    return data_frame.rename(columns={"date": "cet_cest_timestamp"})
+
+
+@memoize(["power_data_monthly"])
+def monthly_power(engine: sqlalchemy.Engine) -> pandas.DataFrame:
+    # Mean per local month, cet_cest_timestamp is the first day of the month
+    return _means(engine, "power_data", _power_columns(engine), freq="monthly").rename(columns={"date": "cet_cest_timestamp"})
+
+
+@memoize(lambda engine, table_name: [f"{table_name}_daily", *([table_name] if table_name == "rain_data" else [])])
+def daily_weather(engine: sqlalchemy.Engine, table_name: str) -> pandas.DataFrame:
+    # Mean over all stations per day (the most frequent form for rain_form)
+    columns: list[str] = weather_columns[table_name]
+    data_frame = _means(engine, table_name, [column for column in columns if column != "rain_form"])
+    if "rain_form" in columns:
+        data_frame = data_frame.merge(daily_rain_form(engine), on="date", how="left")[["date", *columns]]
+    data_frame["date"] = data_frame["date"].dt.date
+    return data_frame
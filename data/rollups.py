@@ -0,0 +1,253 @@
+# materialized rollups of the transformed tables (per station and day, per day, per month)
+# each rollup column comes as <column>_count, _mean, _min and _max, reports read these instead of the raw tables
+#
+# rollups are updated incrementally: a signature per station (rows, first and last timestamp and a checksum of the
+# values) is remembered in rollup_state, only stations whose signature changed are recomputed, starting at their
+# previous last day when new data was only appended (the rows up to that day still have the old checksum)
+#
+# with a stations table (see stations.py) the per station rollups are also combined per TSO zone and day, weighted by
+# the weight of every station within its zone, these are rebuilt whenever the station rollups or the zones changed
+
+import hashlib
+
+import sqlalchemy
+
+import cache
+
+statistics: list[str] = ["count", "mean", "min", "max"]
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _stat_columns(value_columns: list[str]) -> list[str]:
+    return [f"{column}_{statistic}" for column in value_columns for statistic in statistics]
+
+
+def _aggregate_raw(value_columns: list[str]) -> str:
+    return ", ".join(
+        f"COUNT({_quote(column)}), AVG({_quote(column)}), MIN({_quote(column)}), MAX({_quote(column)})"
+        for column in value_columns
+    )
+
+
+def _aggregate_rollup(value_columns: list[str]) -> str:
+    # Combine finer rollups, means are weighted by the number of values behind them
+    expressions: list[str] = []
+    for column in value_columns:
+        count, mean = _quote(f"{column}_count"), _quote(f"{column}_mean")
+        expressions.append(
+            f"SUM({count}), SUM({mean} * {count}) / NULLIF(SUM({count}), 0), "
+            f"MIN({_quote(f'{column}_min')}), MAX({_quote(f'{column}_max')})"
+        )
+    return ", ".join(expressions)
+
+
+def _checksum(value_columns: list[str]) -> str:
+    # Changes with the values of a station, corrected values keep the row count and the date range
+    return " || ',' || ".join(
+        f"COUNT({_quote(column)}) || ':' || TOTAL({_quote(column)}) || ':' || TOTAL({_quote(column)} * {_quote(column)})"
+        for column in value_columns
+    )
+
+
+def _create_tables(connection, table_name: str, value_columns: list[str], station_column: str | None):
+    stat_defs: str = ", ".join(f"{_quote(column)} {'INTEGER' if column.endswith('_count') else 'REAL'}"
+                               for column in _stat_columns(value_columns))
+
+    connection.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS rollup_state ("
+        "table_name TEXT, station_id INTEGER, row_count INTEGER, first_date TEXT, last_date TEXT, checksum TEXT, "
+        "PRIMARY KEY (table_name, station_id))"
+    )
+    # State of older runs has no checksums, every station is recomputed once
+    if "checksum" not in [column[1] for column in connection.exec_driver_sql("PRAGMA table_info(rollup_state)")]:
+        connection.exec_driver_sql("ALTER TABLE rollup_state ADD COLUMN checksum TEXT")
+    if station_column is not None:
+        connection.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {_quote(table_name + '_station_daily')} "
+            f"(station_id INTEGER, date TEXT, {stat_defs}, PRIMARY KEY (station_id, date)) WITHOUT ROWID"
+        )
+    for period in ("daily", "monthly"):
+        connection.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {_quote(f'{table_name}_{period}')} (date TEXT PRIMARY KEY, {stat_defs}) WITHOUT ROWID"
+        )
+
+
+def update_rollups(engine: sqlalchemy.Engine, table_name: str, value_columns: list[str], date_column: str = "date",
+                   station_column: str | None = "station_id") -> int:
+    day: str = f"substr({_quote(date_column)}, 1, 10)"
+    station: str = _quote(station_column) if station_column is not None else "0"
+    # The same within the queries joining the table as t, tables without stations are all station 0
+    table_station: str = f"t.{station}" if station_column is not None else "0"
+    stat_list: str = ", ".join(_quote(column) for column in _stat_columns(value_columns))
+
+    with engine.begin() as connection:
+        _create_tables(connection, table_name, value_columns, station_column)
+
+        # One scan of the (station_id, date) clustered table, the checksum reads every value
+        checksum: str = _checksum(value_columns)
+        current = {
+            row[0]: row[1:] for row in connection.exec_driver_sql(
+                f"SELECT {station}, COUNT(*), MIN({_quote(date_column)}), MAX({_quote(date_column)}), {checksum} "
+                f"FROM {_quote(table_name)} GROUP BY 1"
+            )
+        }
+        previous = {
+            row[0]: row[1:] for row in connection.exec_driver_sql(
+                "SELECT station_id, row_count, first_date, last_date, checksum FROM rollup_state WHERE table_name = ?",
+                (table_name,)
+            )
+        }
+
+        # Stations that look appended to, their rows up to the last known date have to be the ones seen before
+        appended: dict[int, str] = {
+            station_id: old[2] for station_id, old in previous.items()
+            if (new := current.get(station_id)) is not None and new != old
+            and new[0] >= old[0] and new[1] == old[1] and new[2] >= old[2]
+        }
+        unchanged_prefix: set[int] = set()
+        if appended:
+            connection.exec_driver_sql("DROP TABLE IF EXISTS temp.rollup_appended")
+            connection.exec_driver_sql("CREATE TEMP TABLE rollup_appended (station_id INTEGER PRIMARY KEY, last_date TEXT)")
+            connection.exec_driver_sql("INSERT INTO temp.rollup_appended VALUES (?, ?)", list(appended.items()))
+            prefixes = connection.exec_driver_sql(
+                f"SELECT {table_station}, {checksum} FROM {_quote(table_name)} AS t "
+                f"JOIN temp.rollup_appended AS a ON a.station_id = {table_station} "
+                f"WHERE t.{_quote(date_column)} <= a.last_date GROUP BY 1"
+            )
+            unchanged_prefix = {station_id for station_id, prefix in prefixes if prefix == previous[station_id][3]}
+            connection.exec_driver_sql("DROP TABLE temp.rollup_appended")
+
+        # Find the stations to recompute and the first day that changed for each of them
+        changed: dict[int, str] = {}
+        affected_days: list[str] = []
+        for station_id in current.keys() | previous.keys():
+            new, old = current.get(station_id), previous.get(station_id)
+            if new == old:
+                continue
+
+            if station_id in unchanged_prefix:
+                from_day: str = old[2][:10]  # only appended, recompute from the last known day on
+            else:
+                from_day = ""
+                if old is not None:
+                    affected_days += [old[1][:10], old[2][:10]]
+            changed[station_id] = from_day
+            if new is not None:
+                affected_days += [from_day or new[1][:10], new[2][:10]]
+
+        if not changed:
+            return 0
+
+        connection.exec_driver_sql("DROP TABLE IF EXISTS temp.rollup_changed")
+        connection.exec_driver_sql("CREATE TEMP TABLE rollup_changed (station_id INTEGER PRIMARY KEY, from_day TEXT)")
+        connection.exec_driver_sql("INSERT INTO temp.rollup_changed VALUES (?, ?)", list(changed.items()))
+
+        first_day, last_day = min(affected_days), max(affected_days)
+        if station_column is not None:
+            # Per station and day, straight from the table
+            station_daily: str = _quote(table_name + "_station_daily")
+            connection.exec_driver_sql(
+                f"DELETE FROM {station_daily} WHERE EXISTS (SELECT 1 FROM temp.rollup_changed AS c "
+                f"WHERE c.station_id = {station_daily}.station_id AND {station_daily}.date >= c.from_day)"
+            )
+            connection.exec_driver_sql(
+                f"INSERT INTO {station_daily} (station_id, date, {stat_list}) "
+                f"SELECT {table_station}, {day}, {_aggregate_raw(value_columns)} "
+                f"FROM {_quote(table_name)} AS t JOIN temp.rollup_changed AS c ON c.station_id = {table_station} "
+                f"WHERE t.{_quote(date_column)} >= c.from_day GROUP BY {table_station}, {day}"
+            )
+            daily_source: str = (
+                f"SELECT date, {_aggregate_rollup(value_columns)} FROM {station_daily} "
+                f"WHERE date BETWEEN :first_day AND :last_day GROUP BY date"
+            )
+        else:
+            daily_source = (
+                f"SELECT {day}, {_aggregate_raw(value_columns)} FROM {_quote(table_name)} "
+                f"WHERE {_quote(date_column)} >= :first_day AND {day} <= :last_day GROUP BY {day}"
+            )
+
+        # Days and months touched by the changed stations
+        daily: str = _quote(table_name + "_daily")
+        monthly: str = _quote(table_name + "_monthly")
+        params: dict = {"first_day": first_day, "last_day": last_day,
+                        "first_month": first_day[:7] + "-01", "last_month": last_day[:7] + "-01"}
+        connection.execute(sqlalchemy.text(f"DELETE FROM {daily} WHERE date BETWEEN :first_day AND :last_day"), params)
+        connection.execute(sqlalchemy.text(f"INSERT INTO {daily} (date, {stat_list}) {daily_source}"), params)
+
+        month: str = "substr(date, 1, 7) || '-01'"
+        connection.execute(sqlalchemy.text(f"DELETE FROM {monthly} WHERE date BETWEEN :first_month AND :last_month"), params)
+        connection.execute(sqlalchemy.text(
+            f"INSERT INTO {monthly} (date, {stat_list}) SELECT {month}, {_aggregate_rollup(value_columns)} "
+            f"FROM {daily} WHERE {month} BETWEEN :first_month AND :last_month GROUP BY {month}"
+        ), params)
+
+        # Remember what the table looked like for the next run
+        connection.exec_driver_sql("DELETE FROM rollup_state WHERE table_name = ?", (table_name,))
+        if current:
+            connection.exec_driver_sql(
+                "INSERT INTO rollup_state (table_name, station_id, row_count, first_date, last_date, checksum) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(table_name, station_id, *signature) for station_id, signature in current.items()],
+            )
+        connection.exec_driver_sql("DROP TABLE temp.rollup_changed")
+
+        for suffix in ("_station_daily", "_daily", "_monthly") if station_column is not None else ("_daily", "_monthly"):
+            cache.record_stats(connection, table_name + suffix)
+
+    return len(changed)
+
+
+def _aggregate_zone(value_columns: list[str]) -> str:
+    # Weighted over the stations that have a value on that day
+    expressions: list[str] = []
+    for column in value_columns:
+        count, mean = _quote(f"{column}_count"), _quote(f"{column}_mean")
+        expressions.append(
+            f"SUM({count}), SUM({mean} * s.weight) / NULLIF(SUM(CASE WHEN {mean} IS NOT NULL THEN s.weight END), 0), "
+            f"MIN({_quote(f'{column}_min')}), MAX({_quote(f'{column}_max')})"
+        )
+    return ", ".join(expressions)
+
+
+def update_zone_rollups(engine: sqlalchemy.Engine, table_name: str, value_columns: list[str],
+                        stations_table: str = "stations") -> bool:
+    # Returns whether <table_name>_zone_daily was rebuilt, needs the station rollups of update_rollups()
+    stat_defs: str = ", ".join(f"{_quote(column)} {'INTEGER' if column.endswith('_count') else 'REAL'}"
+                               for column in _stat_columns(value_columns))
+    stat_list: str = ", ".join(_quote(column) for column in _stat_columns(value_columns))
+    zone_daily: str = _quote(table_name + "_zone_daily")
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE IF NOT EXISTS zone_rollup_state (table_name TEXT PRIMARY KEY, signature TEXT)")
+
+        # The zone rollups depend on the station rollups (their state) and the zones and weights of the stations
+        checksum = hashlib.sha256()
+        for row in connection.exec_driver_sql(
+            "SELECT station_id, row_count, first_date, last_date, checksum FROM rollup_state WHERE table_name = ? "
+            "ORDER BY station_id",
+            (table_name,)
+        ):
+            checksum.update(repr(tuple(row)).encode())
+        for row in connection.exec_driver_sql(f"SELECT station_id, zone, weight FROM {_quote(stations_table)} ORDER BY station_id"):
+            checksum.update(repr(tuple(row)).encode())
+        signature: str = checksum.hexdigest()
+
+        previous = connection.exec_driver_sql("SELECT signature FROM zone_rollup_state WHERE table_name = ?",
+                                              (table_name,)).scalar()
+        if previous == signature:
+            return False
+
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {zone_daily}")
+        connection.exec_driver_sql(f"CREATE TABLE {zone_daily} (zone TEXT, date TEXT, {stat_defs}, PRIMARY KEY (zone, date)) WITHOUT ROWID")
+        connection.exec_driver_sql(
+            f"INSERT INTO {zone_daily} (zone, date, {stat_list}) "
+            f"SELECT s.zone, r.date, {_aggregate_zone(value_columns)} "
+            f"FROM {_quote(table_name + '_station_daily')} AS r JOIN {_quote(stations_table)} AS s USING (station_id) "
+            f"GROUP BY s.zone, r.date"
+        )
+        connection.exec_driver_sql("INSERT OR REPLACE INTO zone_rollup_state VALUES (?, ?)", (table_name, signature))
+        cache.record_stats(connection, table_name + "_zone_daily")
+    return True
@@ -0,0 +1,168 @@
+# column dtypes shared by pull-data.py and transform-data.py
+# every column gets the narrowest dtype that holds its values, the DWD marker for missing values (-999) becomes <NA>
+
+import numpy
+import pandas
+
+missing_value: int = -999
+
+# Raw DWD columns as they are extracted from the archives (names padded like in the files)
+raw_weather_dtypes: dict[str, dict[str, str]] = {
+    "rain_data": {
+        "STATIONS_ID": "int32",
+        "MESS_DATUM":  "int32",     # YYYYMMDD
+        "  RS":        "Float32",   # mm
+        " RSF":        "Int8",      # 0-9
+        "SH_TAG":      "Int16",     # cm
+        "NSH_TAG":     "Int16",     # cm
+    },
+    "cloud_data": {
+        "STATIONS_ID": "int32",
+        "MESS_DATUM":  "int32",     # YYYYMMDDHH
+        "N_TER":       "Int8",      # 1/8
+        "CD_TER":      "Int8",
+    },
+    "temperature_data": {
+        "STATIONS_ID": "int32",
+        "MESS_DATUM":  "int32",
+        "TT_TER":      "Float32",   # Degrees Celsius
+        "RF_TER":      "Float32",   # Percent
+    },
+    "wind_data": {
+        "STATIONS_ID": "int32",
+        "MESS_DATUM":  "int32",
+        "DK_TER":      "Int16",     # Degrees (0-360)
+        "FK_TER":      "Int8",      # Bft (0-12)
+    },
+}
+
+# Transformed weather tables
+weather_dtypes: dict[str, dict[str, str]] = {
+    "rain_data": {
+        "station_id":      "int32",
+        "date":            "datetime64[ns]",
+        "rain":            "Float32",
+        "rain_form":       "Int8",
+        "snow_height":     "Int16",
+        "new_snow_height": "Int16",
+    },
+    "cloud_data": {
+        "station_id":       "int32",
+        "date":             "datetime64[ns]",
+        "cloud_cover":      "Int8",
+        "cloud_cover_form": "Int8",
+    },
+    "temperature_data": {
+        "station_id":  "int32",
+        "date":        "datetime64[ns]",
+        "temperature": "Float32",
+        "humidity":    "Float32",
+    },
+    "wind_data": {
+        "station_id": "int32",
+        "date":       "datetime64[ns]",
+        "direction":  "Int16",
+        "speed":      "Int8",
+    },
+}
+
+power_timestamp_columns: list[str] = ["utc_timestamp", "cet_cest_timestamp"]
+
+# SQL expressions parsing the OPSD timestamps ("2015-01-01T00:00:00Z", "2015-01-01T01:00:00+0100") into the DATETIME
+# text SQLAlchemy reads back as datetime64 ("2015-01-01 01:00:00.000000"), cet_cest_timestamp keeps the local time
+power_timestamp_sql: dict[str, str] = {
+    "utc_timestamp": "datetime(\"utc_timestamp\") || '.000000'",
+    "cet_cest_timestamp": "datetime(substr(\"cet_cest_timestamp\", 1, 19)) || '.000000'",
+}
+
+
+def power_dtypes(columns: list[str]) -> dict[str, str]:
+    # All OPSD measurements (MW, capacities, profiles, prices) fit into float32
+    return {column: "float32" for column in columns if column not in power_timestamp_columns}
+
+
+def parse_dtypes(dtypes: dict[str, str]) -> dict[str, str]:
+    # Parse with a wide enough type first, the -999 marker would silently wrap around in int8
+    parse_types: dict[str, str] = {}
+    for column, dtype in dtypes.items():
+        if dtype in ("Int8", "Int16", "Int32"):
+            parse_types[column] = "Int32"
+        elif dtype in ("Float32", "float32"):
+            parse_types[column] = "float32"
+        else:
+            parse_types[column] = dtype
+    return parse_types
+
+
+def apply(data_frame: pandas.DataFrame, dtypes: dict[str, str]) -> pandas.DataFrame:
+    # Convert the columns of a frame in place, columns that are not part of the schema are left untouched
+    for column, dtype in dtypes.items():
+        if column not in data_frame.columns:
+            continue
+
+        series = data_frame[column]
+        if dtype[0].isupper() and pandas.api.types.is_numeric_dtype(series):
+            # Nullable column, replace the missing value marker
+            series = series.mask(series == missing_value)
+
+        if str(series.dtype) != dtype:
+            check_range(column, series, dtype)
+            series = series.astype(dtype)
+        data_frame[column] = series
+    return data_frame
+
+
+def check_range(column: str, series: pandas.Series, dtype: str):
+    # Casting between integer types wraps around silently (300 becomes 44 in int8), fail loudly instead
+    if not pandas.api.types.is_integer_dtype(pandas.api.types.pandas_dtype(dtype)):
+        return
+    values = series.dropna()
+    if len(values) == 0 or not pandas.api.types.is_numeric_dtype(values):
+        return
+
+    info = numpy.iinfo(dtype.lower())
+    if values.min() < info.min or values.max() > info.max:
+        raise ValueError(f"Values of {column} ({values.min()} to {values.max()}) don't fit into {dtype}")
+
+
+def _round_significant(values: numpy.ndarray, magnitude: numpy.ndarray, digits: int) -> numpy.ndarray:
+    # Powers of ten up to 1e22 are exact, so m / 10^e is the double closest to the decimal, like parsing it
+    exponent = digits - 1 - magnitude
+    scale = 10.0 ** numpy.abs(exponent)
+    return numpy.where(exponent >= 0, numpy.round(values * scale) / scale, numpy.round(values / scale) * scale)
+
+
+def shortest_float64(values: numpy.ndarray) -> numpy.ndarray:
+    # The float64 of the shortest decimal that reads back as the same float32, e.g. 1.3 and not 1.2999999523162842
+    # A float32 is within 6e-8 (relative) of its shortest decimal, decimals of 6 significant digits are 1e-6 apart, so
+    # rounding to 6 digits finds every shortest decimal of up to 6 digits, the values it doesn't give back need 7, 8 or
+    # 9 digits (9 always do). Measurements have few digits, most values are done after the first round. Outside of
+    # 1e-13 to 1e27 the powers of ten of 6 to 9 digits aren't exact any more, those values go through their string
+    values = numpy.asarray(values, dtype="float32")
+    result = values.astype("float64")
+    size = numpy.abs(result)
+    outside = numpy.flatnonzero(numpy.isfinite(result) & (result != 0) & ((size < 1e-13) | (size >= 1e27)))
+    result[outside] = values[outside].astype(str).astype("float64")
+    pending = numpy.flatnonzero((size >= 1e-13) & (size < 1e27))
+    magnitude = numpy.floor(numpy.log10(size[pending]))
+    for digits in range(6, 10):
+        rounded = _round_significant(result[pending], magnitude, digits)
+        exact = rounded.astype("float32") == values[pending]
+        result[pending[exact]] = rounded[exact]
+        pending, magnitude = pending[~exact], magnitude[~exact]
+        if len(pending) == 0:
+            break
+    return result
+
+
+def for_sqlite(data_frame: pandas.DataFrame) -> pandas.DataFrame:
+    # SQLite only knows 8 byte floats, widen float32 columns through their shortest decimal representation
+    # so 1.3 is stored as 1.3 and not as 1.2999999523162842
+    widened: dict[str, numpy.ndarray] = {}
+    for column, dtype in data_frame.dtypes.items():
+        if str(dtype) in ("float32", "Float32"):
+            widened[column] = shortest_float64(data_frame[column].to_numpy(dtype="float32", na_value=numpy.nan))
+
+    if not widened:
+        return data_frame
+    return data_frame.assign(**widened)
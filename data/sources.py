@@ -0,0 +1,69 @@
+# declarative description of the DWD sources shared by pull-data.py and transform-data.py
+# the time window and columns are applied while downloading and extracting, so discarded data never reaches the database
+
+import re
+
+from schema import raw_weather_dtypes
+
+ftp_uri: str = "opendata.dwd.de"
+
+weather_sources: list[dict] = [
+    {
+        "name": "rain_data",
+        "path": "climate_environment/CDC/observations_germany/climate/daily/more_precip/historical/",
+        "hourly": False,  # MESS_DATUM is YYYYMMDD
+        "window": ("2010-01-01", None),
+        "columns": raw_weather_dtypes["rain_data"],
+    },
+    {
+        "name": "cloud_data",
+        "path": "climate_environment/CDC/observations_germany/climate/subdaily/cloudiness/historical/",
+        "hourly": True,  # MESS_DATUM is YYYYMMDDHH
+        "window": ("2010-01-01", None),
+        "columns": raw_weather_dtypes["cloud_data"],
+    },
+    {
+        "name": "temperature_data",
+        "path": "climate_environment/CDC/observations_germany/climate/subdaily/air_temperature/historical/",
+        "hourly": True,
+        "window": ("2000-01-01", None),
+        "columns": raw_weather_dtypes["temperature_data"],
+    },
+    {
+        "name": "wind_data",
+        "path": "climate_environment/CDC/observations_germany/climate/subdaily/wind/historical/",
+        "hourly": True,
+        "window": ("2010-01-01", None),
+        "columns": raw_weather_dtypes["wind_data"],
+    },
+]
+
+weather_sources_by_name: dict[str, dict] = {data_src["name"]: data_src for data_src in weather_sources}
+
+# DWD archives carry the covered time span in their name, e.g. terminwerte_N_00044_19710101_20221231_hist.zip
+file_range_pattern: str = r"_(\d{8})_(\d{8})_"
+
+
+def mess_datum_range(data_src: dict) -> tuple[int | None, int | None]:
+    # Translate the window into the integer MESS_DATUM representation of the source (end is inclusive)
+    start, end = data_src["window"]
+    hour_factor: int = 100 if data_src["hourly"] else 1
+
+    min_date: int | None = int(start.replace("-", "")) * hour_factor if start is not None else None
+    max_date: int | None = int(end.replace("-", "")) * hour_factor + (hour_factor - 1) if end is not None else None
+    return min_date, max_date
+
+
+def in_window(data_src: dict, file_name: str) -> bool:
+    # Files without a time span in their name (descriptions, station lists) are always kept
+    match = re.search(file_range_pattern, file_name)
+    if not match:
+        return True
+
+    file_start, file_end = match.group(1), match.group(2)
+    start, end = data_src["window"]
+    if start is not None and file_end < start.replace("-", ""):
+        return False
+    if end is not None and file_start > end.replace("-", ""):
+        return False
+    return True
@@ -0,0 +1,114 @@
+# DWD station metadata and the transmission system operator (TSO) zone of every station
+# every source directory on the DWD server has a fixed-width station list (e.g. FK_Terminwerte_Beschreibung_Stationen.txt),
+# the stations are mapped to the control areas of 50Hertz, Amprion, TenneT and TransnetBW, so weather aggregates can be
+# joined to the DE_<zone>_* columns of the power data instead of averaging all of Germany into one value
+#
+# the control areas don't follow the state borders exactly, they are approximated by reference towns per zone and a
+# station belongs to the zone of the nearest town, looked up in a precomputed raster over Germany
+
+import numpy
+import pandas
+
+# Station lists downloaded with the archives of every source
+station_list_pattern: str = "Beschreibung_Stationen"
+
+# Fixed-width layout of the station lists, newer lists have an additional column after the state which is ignored
+column_widths: list[tuple[int, int | None]] = [(0, 5), (6, 14), (15, 23), (24, 38), (39, 50), (51, 60), (61, 101), (102, None)]
+column_names: list[str] = ["station_id", "von_datum", "bis_datum", "station_height", "latitude", "longitude",
+                           "station_name", "state"]
+
+# Zones as they are named in the power columns (DE_50hertz_load_actual_entsoe_transparency, ...)
+zones: list[str] = ["50hertz", "amprion", "tennet", "transnetbw"]
+
+# (latitude, longitude) of towns inside each control area
+zone_towns: dict[str, list[tuple[float, float]]] = {
+    "50hertz": [
+        (52.52, 13.40), (54.09, 12.10), (53.63, 11.41), (53.55, 10.00), (52.13, 11.62), (51.48, 11.97),
+        (51.34, 12.37), (51.05, 13.74), (50.83, 12.92), (50.98, 11.03), (51.76, 14.33), (53.56, 13.26),
+        (54.31, 13.09), (50.93, 11.59), (50.61, 10.69), (52.41, 12.56), (53.08, 14.00), (51.84, 12.24),
+    ],
+    "amprion": [
+        (50.94, 6.96), (51.23, 6.78), (51.51, 7.47), (51.46, 7.01), (51.96, 7.63), (52.02, 8.53),
+        (50.78, 6.08), (50.36, 7.59), (50.00, 8.27), (49.75, 6.64), (49.24, 6.99), (49.44, 7.77),
+        (50.87, 8.02), (52.28, 8.05), (50.11, 8.68), (49.87, 8.65), (49.48, 8.44), (48.37, 10.90),
+        (47.73, 10.31), (51.76, 8.75),
+    ],
+    "tennet": [
+        (54.32, 10.14), (54.78, 9.44), (52.37, 9.73), (53.08, 8.80), (53.14, 8.21), (51.54, 9.93),
+        (51.31, 9.48), (50.55, 9.68), (48.14, 11.58), (49.45, 11.08), (49.79, 9.95), (49.01, 12.10),
+        (48.57, 13.43), (49.95, 11.58), (48.77, 11.42), (53.25, 10.41), (52.27, 10.52), (53.37, 7.21),
+        (47.86, 12.12), (50.32, 11.92),
+    ],
+    "transnetbw": [
+        (48.78, 9.18), (49.01, 8.40), (47.99, 7.85), (48.40, 9.99), (49.14, 9.22), (47.66, 9.18),
+        (49.49, 8.47), (48.52, 9.06), (49.11, 9.74), (48.06, 8.46), (48.89, 8.70), (47.81, 9.61),
+    ],
+}
+
+# Stations in the same cell share their weight, so dense clusters (cities) don't dominate the zone aggregates
+weight_cell_degrees: float = 0.5
+
+
+def read_station_list(path: str) -> pandas.DataFrame:
+    # The first two lines are the header and a line of dashes, the files are latin-1 encoded
+    data_frame = pandas.read_fwf(path, colspecs=column_widths, names=column_names, skiprows=2, encoding="latin-1",
+                                 dtype={"station_id": "int32", "von_datum": "int32", "bis_datum": "int32"})
+    data_frame["state"] = data_frame["state"].str.split(r"\s{2,}").str[0]
+    return data_frame.dropna(subset=["latitude", "longitude"])
+
+
+def merge_station_lists(data_frames: list[pandas.DataFrame]) -> pandas.DataFrame:
+    # A station appears in the list of every source it measures, keep one row with the longest period
+    data_frame = pandas.concat(data_frames, ignore_index=True)
+    data_frame = data_frame.groupby("station_id", as_index=False).agg({
+        **{column: "last" for column in column_names if column not in ("station_id", "von_datum", "bis_datum")},
+        "von_datum": "min",
+        "bis_datum": "max",
+    })
+    return data_frame[column_names]
+
+
+class ZoneIndex:
+    # Nearest reference town for every cell of a raster over Germany, computed once, a lookup is an array index
+    def __init__(self, towns: dict[str, list[tuple[float, float]]] = zone_towns, resolution: float = 0.05,
+                 bounds: tuple[float, float, float, float] = (47.0, 55.2, 5.5, 15.5)):
+        self.resolution: float = resolution
+        self.min_latitude, max_latitude, self.min_longitude, max_longitude = bounds
+        self.names: list[str] = list(towns)
+
+        town_zones = numpy.concatenate([numpy.full(len(points), zone) for zone, points in enumerate(towns.values())])
+        town_points = numpy.radians(numpy.concatenate([numpy.array(points) for points in towns.values()]))
+
+        latitudes = numpy.radians(numpy.arange(self.min_latitude, max_latitude + resolution, resolution))
+        longitudes = numpy.radians(numpy.arange(self.min_longitude, max_longitude + resolution, resolution))
+        self.shape: tuple[int, int] = (len(latitudes), len(longitudes))
+
+        # Equirectangular distances are exact enough at this scale, one row of the raster at a time keeps memory small
+        self.raster = numpy.empty(self.shape, dtype=numpy.int8)
+        for row, latitude in enumerate(latitudes):
+            dx = (longitudes[:, None] - town_points[None, :, 1]) * numpy.cos((latitude + town_points[None, :, 0]) / 2)
+            dy = latitude - town_points[None, :, 0]
+            self.raster[row] = town_zones[numpy.argmin(dx ** 2 + dy ** 2, axis=1)]
+
+    def lookup(self, latitude, longitude) -> numpy.ndarray:
+        # Points outside the raster get the zone of the nearest edge cell
+        rows = numpy.clip(numpy.round((numpy.asarray(latitude) - self.min_latitude) / self.resolution).astype(int),
+                          0, self.shape[0] - 1)
+        columns = numpy.clip(numpy.round((numpy.asarray(longitude) - self.min_longitude) / self.resolution).astype(int),
+                             0, self.shape[1] - 1)
+        return numpy.array(self.names, dtype=object)[self.raster[rows, columns]]
+
+
+def assign_zones(stations: pandas.DataFrame, index: ZoneIndex | None = None) -> pandas.DataFrame:
+    # Adds the zone and the weight of every station within its zone (the weights of a zone sum up to 1)
+    index = index or ZoneIndex()
+    stations = stations.copy()
+    stations["zone"] = index.lookup(stations["latitude"].to_numpy(), stations["longitude"].to_numpy())
+
+    cells = pandas.Series(list(zip(
+        numpy.floor(stations["latitude"] / weight_cell_degrees), numpy.floor(stations["longitude"] / weight_cell_degrees)
+    )), index=stations.index)
+    per_cell = stations.groupby([stations["zone"], cells])["station_id"].transform("size")
+    cells_per_zone = cells.groupby(stations["zone"]).transform("nunique")
+    stations["weight"] = 1 / (per_cell * cells_per_zone)
+    return stations
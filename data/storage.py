@@ -0,0 +1,195 @@
+# storage backends for the transformed tables
+# sqlite keeps working as before, parquet writes the same tables partitioned by year for fast columnar reads
+
+import os
+import shutil
+import uuid
+
+import pandas
+import sqlalchemy
+
+import cache
+import schema
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # parquet support is optional
+    pyarrow = None
+
+
+def _driver_rows(data_frame: pandas.DataFrame):
+    # The values SQLAlchemy would bind, datetimes as its DATETIME text ("2015-01-01 06:00:00.000000")
+    converted: dict[str, pandas.Series] = {}
+    for column, dtype in data_frame.dtypes.items():
+        if pandas.api.types.is_datetime64_any_dtype(dtype):
+            converted[column] = data_frame[column].dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+    data_frame = data_frame.assign(**converted)
+    return data_frame.astype(object).where(data_frame.notna(), None).itertuples(index=False, name=None)
+
+
+class SQLiteStorage:
+    name: str = "sqlite"
+
+    def __init__(self, engine: sqlalchemy.Engine):
+        self.engine = engine
+        self._keys: dict[str, tuple[str, ...]] = {}
+
+    def begin(self, table_name: str, key: tuple[str, ...] = ()):
+        # Build the new table next to the old one and swap it in at the end, so readers never see a half-written table
+        # Tables with a key are stored in key order (WITHOUT ROWID), e.g. the rows of a station are on neighbouring pages
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{table_name}_tmp"')
+        self._keys[table_name] = tuple(key)
+
+    def write(self, table_name: str, data_frame: pandas.DataFrame, date_column: str | None = "date", dtype: dict | None = None):
+        data_frame = schema.for_sqlite(data_frame)
+        key: tuple[str, ...] = self._keys.get(table_name, ())
+        if not key:
+            data_frame.to_sql(f"{table_name}_tmp", self.engine, if_exists="append", index=False, dtype=dtype)
+            return
+
+        # Rows inserted in key order are appended to the b-tree instead of splitting pages all over it
+        data_frame = data_frame.sort_values(list(key), ignore_index=True)
+
+        # The same column types to_sql would use, the first write creates the table
+        dtype = {column: column_type for column, column_type in (dtype or {}).items() if column in data_frame.columns}
+        create: str = pandas.io.sql.get_schema(data_frame, f"{table_name}_tmp", keys=list(key), con=self.engine, dtype=dtype)
+
+        # The rows go to the driver directly, SQLAlchemy's processing of every parameter costs more than the insert. A
+        # row that is already there (e.g. twice in a raw table of an older run) is replaced by the later one
+        column_list: str = ", ".join(f'"{column}"' for column in data_frame.columns)
+        placeholders: str = ", ".join("?" for _ in data_frame.columns)
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(create.strip().replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1) + " WITHOUT ROWID")
+            if len(data_frame) > 0:
+                connection.exec_driver_sql(f'INSERT OR REPLACE INTO "{table_name}_tmp" ({column_list}) VALUES ({placeholders})',
+                                           list(_driver_rows(data_frame)))
+
+    def commit(self, table_name: str, indexes: list[tuple[str, ...]] = (), date_column: str | None = "date"):
+        key: tuple[str, ...] = self._keys.pop(table_name, ())
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{table_name}"')
+            connection.exec_driver_sql(f'ALTER TABLE "{table_name}_tmp" RENAME TO "{table_name}"')
+
+            # Indexes are built once after the bulk insert, which is a lot cheaper than maintaining them while inserting
+            # The key already orders the table, indexes on its leading columns would only duplicate it
+            for columns in indexes:
+                if tuple(columns) == key[:len(columns)]:
+                    continue
+                index_name: str = f"{table_name}_{'_'.join(columns)}_idx"
+                column_list: str = ", ".join(f'"{column}"' for column in columns)
+                connection.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({column_list})')
+
+            # A new version of the table, cached results derived from the old one are invalid
+            cache.record_stats(connection, table_name, date_column)
+
+    def copy(self, table_name: str, source_path: str, expressions: dict[str, str] | None = None,
+             types: dict[str, str] | None = None) -> int:
+        # Copy a table of another sqlite database with INSERT ... SELECT, the rows never pass through pandas
+        # expressions and types replace the select expression and declared type of single columns
+        expressions, types = expressions or {}, types or {}
+        with self.engine.connect() as connection:
+            connection.exec_driver_sql("ATTACH DATABASE ? AS source", (source_path,))
+            try:
+                columns = connection.exec_driver_sql(f'PRAGMA source.table_info("{table_name}")').fetchall()
+                column_defs: str = ", ".join(f'"{column[1]}" {types.get(column[1], column[2])}' for column in columns)
+                selected: str = ", ".join(expressions.get(column[1], f'"{column[1]}"') for column in columns)
+
+                # ATTACH is not allowed inside a transaction, the driver only opens one with the first write
+                connection.commit()
+                with connection.begin():
+                    connection.exec_driver_sql(f'CREATE TABLE "{table_name}_tmp" ({column_defs})')
+                    result = connection.exec_driver_sql(
+                        f'INSERT INTO "{table_name}_tmp" SELECT {selected} FROM source."{table_name}"'
+                    )
+            finally:
+                connection.exec_driver_sql("DETACH DATABASE source")
+        return result.rowcount
+
+    def read(self, table_name: str, columns: list[str] | None = None, start=None, end=None,
+             date_column: str = "date") -> pandas.DataFrame:
+        selected: str = ", ".join(f'"{column}"' for column in columns) if columns else "*"
+        conditions: list[str] = []
+        params: dict = {}
+        if start is not None:
+            conditions.append(f'"{date_column}" >= :start')
+            params["start"] = str(pandas.Timestamp(start))
+        if end is not None:
+            conditions.append(f'"{date_column}" < :end')
+            params["end"] = str(pandas.Timestamp(end))
+        where: str = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        query = sqlalchemy.text(f'SELECT {selected} FROM "{table_name}"{where}')
+        with self.engine.connect() as connection:
+            parse_dates = [date_column] if columns is None or date_column in columns else None
+            return pandas.read_sql_query(query, connection, params=params, parse_dates=parse_dates)
+
+
+class ParquetStorage:
+    name: str = "parquet"
+
+    def __init__(self, root: str):
+        if pyarrow is None:
+            raise RuntimeError("The parquet storage backend requires pyarrow (pip install pyarrow)")
+        self.root: str = root
+
+    def _path(self, table_name: str) -> str:
+        return os.path.join(self.root, table_name)
+
+    def begin(self, table_name: str, key: tuple[str, ...] = ()):
+        shutil.rmtree(self._path(table_name) + ".tmp", ignore_errors=True)
+
+    def write(self, table_name: str, data_frame: pandas.DataFrame, date_column: str | None = "date", dtype: dict | None = None):
+        # One file per chunk and year, hive style (table/year=2015/part-*.parquet) so readers can skip whole years,
+        # tables without dates (e.g. stations) one file per chunk
+        if date_column is None:
+            os.makedirs(self._path(table_name) + ".tmp", exist_ok=True)
+            table = pyarrow.Table.from_pandas(data_frame, preserve_index=False)
+            pyarrow.parquet.write_table(table, os.path.join(self._path(table_name) + ".tmp", f"part-{uuid.uuid4().hex}.parquet"))
+            return
+
+        years = pandas.to_datetime(data_frame[date_column], utc=True).dt.year
+        for year, year_frame in data_frame.groupby(years.values, sort=False):
+            partition_dir: str = os.path.join(self._path(table_name) + ".tmp", f"year={year}")
+            os.makedirs(partition_dir, exist_ok=True)
+            table = pyarrow.Table.from_pandas(year_frame, preserve_index=False)
+            pyarrow.parquet.write_table(table, os.path.join(partition_dir, f"part-{uuid.uuid4().hex}.parquet"))
+
+    def commit(self, table_name: str, indexes: list[tuple[str, ...]] = (), date_column: str | None = "date"):
+        # Parquet files are sorted by nothing and have no indexes, readers rely on partition and row group pruning
+        path: str = self._path(table_name)
+        os.makedirs(path + ".tmp", exist_ok=True)
+        shutil.rmtree(path + ".old", ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, path + ".old")
+        os.replace(path + ".tmp", path)
+        shutil.rmtree(path + ".old", ignore_errors=True)
+
+    def read(self, table_name: str, columns: list[str] | None = None, start=None, end=None,
+             date_column: str = "date") -> pandas.DataFrame:
+        # Filters on the year partition let pyarrow skip files, the ones on the date column the row groups within
+        filters: list[tuple] = []
+        if start is not None:
+            start = pandas.Timestamp(start)
+            filters += [("year", ">=", start.year), (date_column, ">=", start)]
+        if end is not None:
+            end = pandas.Timestamp(end)
+            filters += [("year", "<=", end.year), (date_column, "<", end)]
+
+        table = pyarrow.parquet.read_table(self._path(table_name), columns=columns, filters=filters or None,
+                                           memory_map=True, partitioning="hive")
+        data_frame = table.to_pandas()
+        return data_frame.drop(columns="year") if "year" in data_frame.columns and (columns is None or "year" not in columns) else data_frame
+
+
+def create_storages(backends: list[str], engine: sqlalchemy.Engine, parquet_root: str) -> list:
+    storages: list = []
+    for backend in backends:
+        if backend == SQLiteStorage.name:
+            storages.append(SQLiteStorage(engine))
+        elif backend == ParquetStorage.name:
+            storages.append(ParquetStorage(parquet_root))
+        else:
+            raise ValueError(f"Unknown storage backend: {backend}")
+    return storages
@@ -0,0 +1,211 @@
+# surplus, deficit and storage potential of the renewable generation in power_data
+# the balance is the hourly wind and solar generation minus the load, on a gapless hourly grid. Surplus runs and
+# dunkelflaute streaks (a rolling capacity factor below a threshold) are run lengths of boolean masks, and the state
+# of charge of a storage is a cumulative sum clamped to [0, capacity] at every hour
+#
+# a clamped cumulative sum can't be written with cumsum, but clamping after a shift, x -> clamp(x + a, lo, hi), stays
+# a function of that form when two of them are composed. The state of charge after every hour is the composition of
+# all hours before it applied to the initial charge, computed as a prefix scan in log2(hours) vectorized steps over
+# (parameter sets, hours) arrays, so many storage sizes and efficiencies are simulated in one pass without a loop
+# over the hours. Results are cached per parameter set (see cache.py) and recomputed when power_data is rewritten
+#
+# example:
+#   engine = database.create_engine("../data/processed_data/transformed_data.sqlite")
+#   storage_potential.sweep(engine, capacities=[1e3, 1e4, 1e5], efficiencies=[0.7, 0.8, 0.9], renewable_scales=[2, 3])
+#   storage_potential.streaks(engine)                      surplus runs and dunkelflaute streaks
+
+import inspect
+import itertools
+import sys
+from dataclasses import asdict, dataclass
+
+import numpy
+import pandas
+import sqlalchemy
+
+import cache
+
+renewable_columns: list[str] = ["DE_wind_generation_actual", "DE_solar_generation_actual"]
+capacity_columns: list[str] = ["DE_wind_capacity", "DE_solar_capacity"]
+load_column: str = "DE_load_actual_entsoe_transparency"
+
+# Dunkelflaute: the mean capacity factor of wind and solar over the window stays below the threshold
+dunkelflaute_threshold: float = 0.1
+dunkelflaute_window: int = 24  # hours
+
+# Parameter sets simulated at once, bounds the (parameter sets, hours) arrays of the scan (64 x 50k hours ~ 25 MB each)
+parameter_block: int = 64
+
+
+@dataclass(frozen=True)
+class StorageParameters:
+    capacity: float                   # MWh
+    power: float | None = None        # MW charged or discharged per hour at most, None is unlimited
+    efficiency: float = 0.8           # round trip, split evenly between charging and discharging
+    renewable_scale: float = 1.0      # generation multiplied by this, e.g. 2 for twice the installed capacity
+    initial: float = 0.0              # state of charge at the start, fraction of the capacity
+
+
+@cache.memoize(["power_data"])
+def load_balance(engine: sqlalchemy.Engine) -> pandas.DataFrame:
+    # Renewable generation, load and capacity factor on a gapless hourly utc grid, missing hours are NaN
+    columns: str = ", ".join(f'"{column}"' for column in ["utc_timestamp", *renewable_columns, *capacity_columns, load_column])
+    data_frame = pandas.read_sql_query(f'SELECT {columns} FROM power_data ORDER BY utc_timestamp', engine,
+                                       parse_dates=["utc_timestamp"])
+    data_frame = data_frame.drop_duplicates("utc_timestamp").set_index("utc_timestamp")
+    data_frame = data_frame.reindex(pandas.date_range(data_frame.index.min(), data_frame.index.max(), freq="H"))
+
+    # The capacities are only updated every now and then, in between the last value holds
+    capacity = data_frame[capacity_columns].ffill().sum(axis=1, min_count=len(capacity_columns))
+    renewable = data_frame[renewable_columns].sum(axis=1, min_count=len(renewable_columns))
+    return pandas.DataFrame({
+        "renewable": renewable.to_numpy(dtype="float64"),
+        "load": data_frame[load_column].to_numpy(dtype="float64"),
+        "capacity_factor": (renewable / capacity.where(capacity > 0)).to_numpy(dtype="float64"),
+    }, index=data_frame.index.rename("utc_timestamp"))
+
+
+def runs(mask: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # Start index and length of every run of True values
+    edges = numpy.diff(numpy.concatenate(([0], mask.astype(numpy.int8), [0])))
+    starts = numpy.flatnonzero(edges == 1)
+    return starts, numpy.flatnonzero(edges == -1) - starts
+
+
+def rolling_mean(values: numpy.ndarray, window: int) -> numpy.ndarray:
+    # Trailing mean over window values, NaN if any of them is missing or the window isn't full yet
+    present = ~numpy.isnan(values)
+    sums = numpy.concatenate(([0.0], numpy.cumsum(numpy.where(present, values, 0.0))))
+    counts = numpy.concatenate(([0], numpy.cumsum(present)))
+    result = numpy.full(len(values), numpy.nan)
+    if len(values) >= window:
+        full = counts[window:] - counts[:-window] == window
+        result[window - 1:] = numpy.where(full, (sums[window:] - sums[:-window]) / window, numpy.nan)
+    return result
+
+
+def clamped_cumsum(steps: numpy.ndarray, upper: numpy.ndarray, initial: numpy.ndarray) -> numpy.ndarray:
+    # x[t] = clamp(x[t - 1] + steps[t], 0, upper) for (parameter sets, hours) steps, upper and initial per parameter set
+    # Every hour is the function clamp(x + a, lo, hi), the scan composes each one with the 1, 2, 4, ... hours before it
+    shift = steps.astype("float64", copy=True)
+    low = numpy.zeros_like(shift)
+    high = numpy.broadcast_to(numpy.asarray(upper, dtype="float64")[:, None], shift.shape).copy()
+
+    offset: int = 1
+    while offset < shift.shape[1]:
+        # Hours t >= offset: first the prefix ending at t - offset, then the one ending at t
+        later_shift, later_low, later_high = shift[:, offset:], low[:, offset:], high[:, offset:]
+        composed_low = numpy.clip(low[:, :-offset] + later_shift, later_low, later_high)
+        composed_high = numpy.clip(high[:, :-offset] + later_shift, later_low, later_high)
+        shift[:, offset:] = shift[:, :-offset] + later_shift
+        low[:, offset:], high[:, offset:] = composed_low, composed_high
+        offset *= 2
+
+    return numpy.clip(numpy.asarray(initial, dtype="float64")[:, None] + shift, low, high)
+
+
+def _charge(renewable: numpy.ndarray, load: numpy.ndarray, parameters: list[StorageParameters]) -> dict[str, numpy.ndarray]:
+    # Surplus, deficit and state of charge as (parameter sets, hours), hours without generation or load leave the
+    # storage untouched
+    capacity = numpy.array([p.capacity for p in parameters], dtype="float64")
+    power = numpy.array([numpy.inf if p.power is None else p.power for p in parameters], dtype="float64")[:, None]
+    one_way = numpy.sqrt(numpy.array([p.efficiency for p in parameters], dtype="float64"))[:, None]
+    scale = numpy.array([p.renewable_scale for p in parameters], dtype="float64")[:, None]
+
+    balance = numpy.nan_to_num(scale * renewable[None, :] - load[None, :], nan=0.0)
+    surplus, deficit = numpy.maximum(balance, 0.0), numpy.maximum(-balance, 0.0)
+
+    # Stored energy per hour before the storage is full or empty, losses when charging and discharging
+    steps = numpy.minimum(surplus, power) * one_way - numpy.minimum(deficit, power) / one_way
+    initial = capacity * numpy.array([p.initial for p in parameters], dtype="float64")
+    return {"capacity": capacity, "one_way": one_way, "initial": initial, "surplus": surplus, "deficit": deficit,
+            "charge": clamped_cumsum(steps, capacity, initial)}
+
+
+def simulate(renewable: numpy.ndarray, load: numpy.ndarray, parameters: list[StorageParameters]) -> pandas.DataFrame:
+    # One row of results per parameter set
+    arrays: dict[str, numpy.ndarray] = _charge(renewable, load, parameters)
+    capacity, one_way, initial = arrays["capacity"], arrays["one_way"], arrays["initial"]
+    surplus, deficit, charge = arrays["surplus"], arrays["deficit"], arrays["charge"]
+
+    change = numpy.diff(charge, axis=1, prepend=initial[:, None])
+    stored, released = numpy.maximum(change, 0.0), numpy.maximum(-change, 0.0)
+    delivered = released * one_way
+    deficit_total = deficit.sum(axis=1)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        return pandas.DataFrame({
+            **{field: [getattr(p, field) for p in parameters] for field in StorageParameters.__dataclass_fields__},
+            "surplus": surplus.sum(axis=1),                          # MWh
+            "deficit": deficit_total,                                # MWh
+            "delivered": delivered.sum(axis=1),                      # MWh of the deficit covered by the storage
+            "curtailed": surplus.sum(axis=1) - (stored / one_way).sum(axis=1),  # surplus that didn't fit
+            "coverage": delivered.sum(axis=1) / deficit_total,
+            "covered_hours": ((deficit > 0) & (delivered >= deficit * (1 - 1e-9))).sum(axis=1),
+            "deficit_hours": (deficit > 0).sum(axis=1),
+            "full_hours": (charge >= capacity[:, None] * (1 - 1e-9)).sum(axis=1),
+            "empty_hours": (charge <= capacity[:, None] * 1e-9).sum(axis=1),
+            "cycles": released.sum(axis=1) / capacity,
+        })
+
+
+def state_of_charge(engine: sqlalchemy.Engine, parameters: list[StorageParameters]) -> pandas.DataFrame:
+    # Hourly state of charge (MWh) per parameter set, for plots of single parameter sets
+    balance = load_balance(engine)
+    charge = _charge(balance["renewable"].to_numpy(), balance["load"].to_numpy(), parameters)["charge"]
+    return pandas.DataFrame(charge.T, index=balance.index, columns=[str(p) for p in parameters])
+
+
+def sweep(engine: sqlalchemy.Engine, capacities, efficiencies=(0.8,), powers=(None,), renewable_scales=(1.0,),
+          initial: float = 0.0) -> pandas.DataFrame:
+    # Every combination of the parameters, simulated in blocks of parameter_block, parameter sets computed before for
+    # the same power_data are read from the cache
+    parameters: list[StorageParameters] = [
+        StorageParameters(float(capacity), None if power is None else float(power), float(efficiency), float(scale), initial)
+        for capacity, efficiency, power, scale in itertools.product(capacities, efficiencies, powers, renewable_scales)
+    ]
+    directory: str | None = cache.cache_dir(engine)
+    store = cache.Cache(directory) if directory is not None else None
+    prefix: tuple = (__name__, inspect.getsource(sys.modules[__name__]), str(engine.url),
+                     cache.fingerprint(engine, ["power_data"])) if store is not None else ()
+
+    results: dict[StorageParameters, dict] = {}
+    for p in parameters:
+        if store is not None:
+            hit, value = store.get(cache.make_key(*prefix, asdict(p)), ["power_data"])
+            if hit:
+                results[p] = value
+
+    missing: list[StorageParameters] = list(dict.fromkeys(p for p in parameters if p not in results))
+    if missing:
+        balance = load_balance(engine)
+        renewable, load = balance["renewable"].to_numpy(), balance["load"].to_numpy()
+        for start in range(0, len(missing), parameter_block):
+            block: list[StorageParameters] = missing[start:start + parameter_block]
+            for p, row in zip(block, simulate(renewable, load, block).to_dict("records")):
+                results[p] = row
+                if store is not None:
+                    store.put(cache.make_key(*prefix, asdict(p)), ["power_data"], row)
+
+    return pandas.DataFrame([results[p] for p in parameters])
+
+
+@cache.memoize(["power_data"])
+def streaks(engine: sqlalchemy.Engine, threshold: float = dunkelflaute_threshold,
+            window: int = dunkelflaute_window) -> pandas.DataFrame:
+    # Every surplus run (generation above the load) and dunkelflaute streak with its start, hours and energy (MWh)
+    balance = load_balance(engine)
+    net = (balance["renewable"] - balance["load"]).to_numpy()
+    capacity_factor = rolling_mean(balance["capacity_factor"].to_numpy(), window)
+
+    data_frames: list[pandas.DataFrame] = []
+    for kind, mask in (("surplus", net > 0), ("dunkelflaute", capacity_factor < threshold)):
+        starts, lengths = runs(mask)
+        # Energy per run from the cumulative sum at its ends, without a loop over the runs
+        energy = numpy.concatenate(([0.0], numpy.cumsum(numpy.nan_to_num(net))))
+        data_frames.append(pandas.DataFrame({
+            "kind": kind,
+            "start": balance.index[starts],
+            "hours": lengths,
+            "energy": energy[starts + lengths] - energy[starts],  # surplus, negative for dunkelflaute deficits
+        }))
+    return pandas.concat(data_frames, ignore_index=True)
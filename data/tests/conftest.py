@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pipeline modules live next to the scripts in data/, make them importable for the tests
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,53 @@
+import numpy
+import pandas
+import sqlalchemy
+
+import align
+
+hours = numpy.int64(3600 * 10 ** 9)
+
+
+def test_interpolate_and_asof():
+    times = numpy.array([6, 13, 20, 30 + 24]) * hours
+    values = numpy.array([1.0, 8.0, 1.0, 5.0])
+    grid = numpy.arange(5, 56) * hours
+
+    interpolated = align.interpolate(times, values, grid, 12 * hours)
+    assert numpy.isnan(interpolated[0])  # before the first value
+    assert interpolated[1:4].tolist() == [1.0, 2.0, 3.0]
+    assert interpolated[15] == 1.0
+    assert numpy.isnan(interpolated[16:49]).all()  # the gap between 20 and 54 is too long
+    assert interpolated[49] == 5.0 and numpy.isnan(interpolated[50])
+
+    carried = align.asof(times, values, grid, 12 * hours)
+    assert numpy.isnan(carried[0])
+    assert carried[1:9].tolist() == [1.0] * 7 + [8.0]
+    assert carried[15:27].tolist() == [1.0] * 12 and numpy.isnan(carried[27])
+    assert carried[49:].tolist() == [5.0, 5.0]
+
+
+def test_timezones():
+    # Naive local time is converted explicitly, 01:00 CET is midnight UTC
+    local = align.to_utc(pandas.to_datetime(["2015-01-01 01:00", "2015-07-01 02:00"]), "Europe/Berlin")
+    assert local.tolist() == pandas.to_datetime(["2015-01-01 00:00", "2015-07-01 00:00"]).asi8.tolist()
+
+
+def test_align_table(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    pandas.DataFrame({
+        "station_id": [1, 1, 2, 2],
+        "date": pandas.to_datetime(["2015-01-01 06:00", "2015-01-01 13:00", "2015-01-01 06:00", "2015-01-01 13:00"]),
+        "direction": [90, 180, 270, 360],
+        "speed": [1, 8, 3, 3],
+    }).to_sql("wind_data", engine, index=False)
+    zones = pandas.DataFrame({"station_id": [1, 2], "zone": ["tennet", "amprion"], "weight": [1.0, 1.0]})
+
+    grid = align.to_utc(pandas.date_range("2015-01-01 05:00", "2015-01-01 08:00", freq="H"), "UTC")
+    data_frame = align.align_table(engine, "wind_data", grid, hourly=True, zones=zones)
+
+    assert data_frame.columns.tolist() == ["direction", "speed", "DE_amprion_direction", "DE_amprion_speed",
+                                           "DE_tennet_direction", "DE_tennet_speed"]
+    assert numpy.isnan(data_frame["speed"][0])
+    assert data_frame["speed"][1:].tolist() == [2.0, 2.5, 3.0]
+    assert data_frame["DE_tennet_speed"][1:].tolist() == [1.0, 2.0, 3.0]
+    assert data_frame["DE_amprion_direction"][1:].tolist() == [270.0] * 3
@@ -0,0 +1,72 @@
+import numpy
+import pandas
+import pytest
+import sqlalchemy
+
+import analysis
+
+
+@pytest.fixture
+def aligned(tmp_path):
+    rng = numpy.random.default_rng(0)
+    hours = pandas.date_range("2015-01-01", periods=2000, freq="H")
+    speed = rng.gamma(2, 2, len(hours))
+    temperature = rng.normal(9, 8, len(hours))
+    data_frame = pandas.DataFrame({
+        "utc_timestamp": hours,
+        "speed": speed,
+        "DE_tennet_temperature": temperature,
+        # wind generation follows the wind speed three hours later
+        "DE_wind_generation_actual": 100 * numpy.roll(speed, 3) ** 2 + rng.normal(0, 10, len(hours)) + 20_000,
+        "DE_solar_generation_actual": 50 * temperature + rng.normal(0, 5, len(hours)),
+        "DE_load_actual_entsoe_transparency": rng.normal(50_000, 100, len(hours)),
+    })
+    data_frame.loc[rng.random(len(hours)) < 0.05, "speed"] = numpy.nan
+    data_frame.loc[rng.random(len(hours)) < 0.05, "DE_solar_generation_actual"] = numpy.nan
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    data_frame.sample(frac=1, random_state=0).to_sql("aligned_data", engine, index=False)  # stored out of order
+    return engine, data_frame
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_analyze(aligned, monkeypatch, workers):
+    engine, data_frame = aligned
+    monkeypatch.setattr(analysis, "chunk_size", 300)
+
+    moments, lagged = analysis.analyze(engine, lags=range(-4, 5), degree=2, workers=workers)
+    x_columns, y_columns = ["speed", "DE_tennet_temperature"], ["DE_wind_generation_actual", "DE_solar_generation_actual"]
+    assert moments.x_columns == x_columns and moments.y_columns == y_columns
+
+    expected = data_frame[x_columns + y_columns].corr().loc[x_columns, y_columns]
+    assert numpy.allclose(moments.correlation(), expected)
+    assert moments.counts().loc["speed", "DE_solar_generation_actual"] == data_frame[["speed", "DE_solar_generation_actual"]].notna().all(axis=1).sum()
+
+    present = data_frame[["DE_tennet_temperature", "DE_solar_generation_actual"]].dropna()
+    coefficients, r_squared = moments.fit("DE_tennet_temperature", "DE_solar_generation_actual", degree=1)
+    assert numpy.allclose(coefficients, numpy.polyfit(present.iloc[:, 0], present.iloc[:, 1], 1))
+    assert r_squared == pytest.approx(expected.loc["DE_tennet_temperature", "DE_solar_generation_actual"] ** 2)
+
+    # Pairs across chunk borders are counted, the peak is at the lag of the generation
+    cross = lagged.cross_correlation("speed", "DE_wind_generation_actual")
+    assert cross.idxmax() == 3
+    shifted = data_frame["speed"].corr(data_frame["DE_wind_generation_actual"].shift(-3))
+    assert cross[3] == pytest.approx(shifted)
+
+
+def test_time_ranges_can_be_added():
+    rng = numpy.random.default_rng(1)
+    x, y = rng.normal(size=(100, 2)), rng.normal(size=(100, 1))
+
+    whole = analysis.LaggedMoments(["a", "b"], ["c"], range(-2, 3))
+    whole.update(x, y)
+
+    first, second = analysis.LaggedMoments(["a", "b"], ["c"], range(-2, 3)), analysis.LaggedMoments(["a", "b"], ["c"], range(-2, 3))
+    first.update(x[:60], y[:60])
+    second.update(x[58:60], y[58:60], history=True)
+    second.update(x[60:], y[60:])
+
+    merged = first + second
+    for lag in range(-2, 3):
+        assert numpy.allclose(merged.moments[lag].x_powers, whole.moments[lag].x_powers)
+        assert numpy.allclose(merged.moments[lag].xy_powers, whole.moments[lag].xy_powers)
@@ -0,0 +1,43 @@
+import os
+import sqlite3
+import sys
+
+import profiling
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import bench_pipeline  # noqa: E402
+from synthetic import power_measurements, power_zones, write_power_data  # noqa: E402
+
+
+def test_power_data_fixture(tmp_path):
+    path = str(tmp_path / "power_data.sqlite")
+    assert write_power_data(path, days=2) == 48
+
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute("SELECT * FROM time_series_60min_singleindex").fetchall()
+        columns = [column[1] for column in connection.execute("PRAGMA table_info(time_series_60min_singleindex)")]
+    connection.close()
+    assert len(columns) == 2 + len(power_zones) * len(power_measurements)
+    assert rows[0][:2] == ("2015-01-01T00:00:00Z", "2015-01-01T01:00:00+0100")
+
+
+def test_suite(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_spans", [])
+    cwd = os.getcwd()
+
+    results = bench_pipeline.run_suite(str(tmp_path / "work"), stations=2, days=30, power_days=3, isolated=False)
+    assert os.getcwd() == cwd
+
+    rows = {result["step"]: result["rows"] for result in results}
+    assert list(rows) == list(bench_pipeline.steps)
+    assert rows["extract rain_data"] == rows["transform rain_data"] == 2 * 30
+    assert rows["extract wind_data"] == rows["transform wind_data"] == 2 * 30 * 3
+    assert rows["extract power_data"] == rows["transform power_data"] == 3 * 24
+
+    # Stored per commit and read back by any prefix of it
+    path = bench_pipeline.save_results(results, {"stations": 2}, directory=str(tmp_path / "results"))
+    commit = os.path.basename(path).removesuffix(".json")
+    stored = bench_pipeline.load_results(commit[:7], directory=str(tmp_path / "results"))
+    assert stored["steps"] == results and stored["scale"] == {"stations": 2}
+    assert bench_pipeline.results_table(results, stored).row_count == len(results)
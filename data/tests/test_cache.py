@@ -0,0 +1,139 @@
+import importlib
+import os
+import sys
+
+import pandas
+import sqlalchemy
+
+import cache
+import report_data
+from rollups import update_rollups
+from storage import SQLiteStorage
+
+calls: list[str] = []
+
+
+@cache.memoize(lambda engine, table_name: [table_name])
+def station_means(engine: sqlalchemy.Engine, table_name: str) -> pandas.DataFrame:
+    calls.append(table_name)
+    return pandas.read_sql_query(f'SELECT station_id, AVG(speed) AS speed FROM "{table_name}" GROUP BY station_id', engine)
+
+
+def write_wind_data(engine: sqlalchemy.Engine, speeds: list[int]):
+    storage = SQLiteStorage(engine)
+    storage.begin("wind_data")
+    storage.write("wind_data", pandas.DataFrame({
+        "station_id": 1, "date": pandas.date_range("2020-01-01", periods=len(speeds), freq="6H"), "speed": speeds,
+    }))
+    storage.commit("wind_data")
+
+
+def test_memoize_until_the_table_is_rewritten(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    write_wind_data(engine, [1, 2, 3])
+    calls.clear()
+
+    assert station_means(engine, "wind_data")["speed"].tolist() == [2.0]
+    assert station_means(engine, "wind_data")["speed"].tolist() == [2.0]
+    assert calls == ["wind_data"]
+    assert len(os.listdir(tmp_path / "cache")) == 1
+
+    # Rewriting the table drops its entries, the next call sees the new rows
+    write_wind_data(engine, [3, 4, 5])
+    assert os.listdir(tmp_path / "cache") == []
+    assert station_means(engine, "wind_data")["speed"].tolist() == [4.0]
+    assert calls == ["wind_data", "wind_data"]
+
+
+def test_module_changes_invalidate_entries(tmp_path, monkeypatch):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    write_wind_data(engine, [1, 2, 3])
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    # The function is the same, the module level columns it reads are not
+    template = (
+        "import pandas\nimport cache\ncolumns = {columns!r}\n\n\n"
+        "@cache.memoize([\"wind_data\"])\ndef speeds(engine):\n"
+        "    return pandas.read_sql_query(f\"SELECT {{', '.join(columns)}} FROM wind_data\", engine)\n"
+    )
+    results: list[list[str]] = []
+    for columns in (["speed"], ["station_id", "speed"]):
+        (tmp_path / "report_module.py").write_text(template.format(columns=columns))
+        sys.modules.pop("report_module", None)
+        importlib.invalidate_caches()
+        results.append(list(importlib.import_module("report_module").speeds(engine).columns))
+    sys.modules.pop("report_module", None)
+    assert results == [["speed"], ["station_id", "speed"]]
+
+
+def test_fingerprint_changes_with_the_table(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    write_wind_data(engine, [1, 2, 3])
+    first = cache.fingerprint(engine, ["wind_data"])
+    assert cache.fingerprint(engine, ["wind_data"]) == first
+
+    # Same rows and dates, but a new version written by the transform stage
+    write_wind_data(engine, [1, 2, 3])
+    assert cache.fingerprint(engine, ["wind_data"]) != first
+    assert cache.fingerprint(engine, ["missing_table"]) != cache.fingerprint(engine, ["wind_data"])
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    directory = str(tmp_path / "cache")
+    entries = cache.Cache(directory, max_bytes=3 * 1100)
+    for key in "abc":
+        entries.put(key, ["power_data"], b"x" * 1000)
+        os.utime(os.path.join(directory, f"power_data.{key}.pickle"), (0, {"a": 1, "b": 2, "c": 3}[key]))
+
+    # Reading a touches it, d pushes out the oldest entry left (b)
+    assert entries.get("a", ["power_data"]) == (True, b"x" * 1000)
+    entries.put("d", ["power_data"], b"x" * 1000)
+    assert [entries.get(key, ["power_data"])[0] for key in "abcd"] == [True, False, True, True]
+
+    entries.invalidate(["wind_data"])
+    assert len(os.listdir(directory)) == 3
+    entries.invalidate(["power_data"])
+    assert os.listdir(directory) == []
+
+
+def test_report_data(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    storage = SQLiteStorage(engine)
+    storage.begin("rain_data")
+    storage.write("rain_data", pandas.DataFrame({
+        "station_id": [1, 2, 3, 1, 2, 3],
+        "date": pandas.to_datetime(["2020-01-01", "2020-01-01", "2020-01-01", "2020-01-02", "2020-01-03", "2020-01-03"]),
+        "rain": [1.0, 2.0, 3.0, 0.0, 1.0, 1.0],
+        "rain_form": pandas.array([0, 6, 6, None, 8, 7], dtype="Int8"),
+        "snow_height": [0, 0, 0, 0, 0, 0],
+        "new_snow_height": [0, 0, 0, 0, 0, 0],
+    }))
+    storage.commit("rain_data")
+    update_rollups(engine, "rain_data", report_data.weather_columns["rain_data"])
+
+    daily = report_data.daily_weather(engine, "rain_data")
+    assert daily["date"].astype(str).tolist() == ["2020-01-01", "2020-01-02", "2020-01-03"]
+    assert daily["rain"].tolist() == [2.0, 0.0, 1.0]
+    # Ties go to the smaller form, like Series.mode()
+    assert daily["rain_form"].iloc[0] == 6 and pandas.isna(daily["rain_form"].iloc[1]) and daily["rain_form"].iloc[2] == 7
+
+    hours = pandas.date_range("2020-01-01", periods=72, freq="H", tz="Europe/Berlin")
+    power = pandas.DataFrame({
+        "utc_timestamp": hours.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "cet_cest_timestamp": hours.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "DE_load_actual_entsoe_transparency": [float(hour) for hour in range(72)],
+        "DE_wind_generation_actual": [None if hour % 5 == 0 else float(hour % 7) for hour in range(72)],
+    })
+    power.to_sql("power_data", engine, index=False)
+    update_rollups(engine, "power_data", ["DE_load_actual_entsoe_transparency", "DE_wind_generation_actual"],
+                   date_column="cet_cest_timestamp", station_column=None)
+
+    # The same means as grouping the hours per local day or month
+    hourly = report_data.hourly_power(engine, ["DE_wind_generation_actual"])
+    assert hourly.columns.tolist() == ["utc_timestamp", "cet_cest_timestamp", "DE_wind_generation_actual"]
+    raw = power.drop(columns="utc_timestamp").assign(cet_cest_timestamp=hours.tz_localize(None))
+    expected = raw.groupby(raw["cet_cest_timestamp"].dt.date).mean(numeric_only=True)
+    daily = report_data.daily_power(engine)
+    assert daily["cet_cest_timestamp"].tolist() == expected.index.tolist()
+    pandas.testing.assert_frame_equal(daily.set_index("cet_cest_timestamp")[expected.columns], expected, check_names=False)
+    assert report_data.monthly_power(engine)["DE_load_actual_entsoe_transparency"].tolist() == [35.5]
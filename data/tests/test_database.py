@@ -0,0 +1,42 @@
+import os
+
+import pytest
+import sqlalchemy
+
+import database
+
+
+def test_profiles(tmp_path):
+    path = str(tmp_path / "data.sqlite")
+    bulk = database.create_engine(path, "bulk")
+    with bulk.connect() as connection:
+        connection.exec_driver_sql("CREATE TABLE t (station_id INTEGER, date TEXT, PRIMARY KEY (station_id, date)) WITHOUT ROWID")
+        connection.exec_driver_sql("INSERT INTO t VALUES (1, '2020-01-01'), (1, '2020-01-02')")
+        connection.commit()
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 0
+        assert connection.exec_driver_sql("PRAGMA page_size").scalar() == 8192
+    database.optimize(bulk, vacuum=True)
+
+    read = database.create_engine(path)
+    with read.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA mmap_size").scalar() == 1 << 30
+        assert connection.exec_driver_sql("SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl = 't'").scalar() == 1
+
+        # Read-only, also while a loader holds the write lock
+        with bulk.connect() as writer:
+            writer.exec_driver_sql("INSERT INTO t VALUES (2, '2020-01-01')")
+            assert connection.exec_driver_sql("SELECT COUNT(*) FROM t").scalar() == 2
+            writer.commit()
+        with pytest.raises(sqlalchemy.exc.OperationalError):
+            connection.exec_driver_sql("DELETE FROM t")
+
+    connection = database.connect(path, "read")
+    assert connection.execute("PRAGMA temp_store").fetchone()[0] == 2
+    connection.close()
+
+    # A wrong path fails instead of creating a database
+    with pytest.raises(sqlalchemy.exc.OperationalError):
+        database.create_engine(str(tmp_path / "missing.sqlite")).connect()
+    assert not os.path.exists(tmp_path / "missing.sqlite")
+    assert database.create_engine("sqlite://").url == sqlalchemy.make_url("sqlite://")
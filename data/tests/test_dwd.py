@@ -0,0 +1,57 @@
+import zipfile
+
+import pandas
+import pytest
+
+import dwd
+from benchmarks.synthetic import write_dwd_corpus
+from sources import weather_sources_by_name
+
+rain_columns: dict[str, str] = weather_sources_by_name["rain_data"]["columns"]
+
+
+@pytest.fixture(params=["pyarrow", "pandas"])
+def parser(request, monkeypatch):
+    if request.param == "pandas":
+        monkeypatch.setattr(dwd, "pyarrow", None)
+    elif dwd.pyarrow is None:
+        pytest.skip("pyarrow is not installed")
+    return request.param
+
+
+def write_archive(path, text: str) -> str:
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        zip_ref.writestr("Metadaten_Geographie_00044.txt", "Stations_id;Stationshoehe\n")
+        zip_ref.writestr("produkt_nieder_tag_19310101_20221231_00044.txt", text.encode("latin-1"))
+    return str(path)
+
+
+def test_read_archive_padded_columns(tmp_path, parser):
+    # Padded header and values like in the real files, SH_TAG is missing in this one
+    zip_path = write_archive(tmp_path / "tageswerte_RR_00044_19310101_20221231_hist.zip",
+                             "STATIONS_ID;MESS_DATUM;QN_6;  RS; RSF;NSH_TAG;eor\n"
+                             "         44;20091231;    1;   1.0;    1;   0;eor\n"
+                             "         44;20100101;    1;   2.3; -999;   3;eor\n"
+                             "         44;20100102;    1;  -999;    6;   0;eor\n")
+
+    data_frame = dwd.read_archive(zip_path, rain_columns, date_range=(20100101, None))
+
+    assert list(data_frame.columns) == list(rain_columns)
+    assert data_frame.dtypes.astype(str).tolist() == list(rain_columns.values())
+    assert data_frame["MESS_DATUM"].tolist() == [20100101, 20100102]
+    assert data_frame["  RS"].tolist() == [pytest.approx(2.3), pandas.NA]
+    assert data_frame[" RSF"].tolist() == [pandas.NA, 6]
+    assert data_frame["SH_TAG"].isna().all()
+
+
+def test_parsers_agree(tmp_path, monkeypatch):
+    if dwd.pyarrow is None:
+        pytest.skip("pyarrow is not installed")
+    zip_path = write_dwd_corpus(str(tmp_path), "rain_data", stations=1, days=400)[0]
+
+    with_arrow = dwd.read_archive(zip_path, rain_columns, date_range=(19900301, 19901231))
+    monkeypatch.setattr(dwd, "pyarrow", None)
+    without_arrow = dwd.read_archive(zip_path, rain_columns, date_range=(19900301, 19901231))
+
+    assert len(with_arrow) == 306
+    pandas.testing.assert_frame_equal(with_arrow.reset_index(drop=True), without_arrow.reset_index(drop=True))
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+
+import pytest
+
+import extract
+from benchmarks.synthetic import write_dwd_corpus
+from extract import checkpoints, extract_zips, is_extracted
+from sources import in_window, mess_datum_range, weather_sources_by_name
+
+columns: dict[str, str] = weather_sources_by_name["cloud_data"]["columns"]
+
+
+def test_extract_zips(tmp_path):
+    zip_paths = write_dwd_corpus(str(tmp_path / "cloud_data"), "cloud_data", stations=4, days=30)
+    db_path = str(tmp_path / "data.sqlite")
+
+    committed: list[str] = []
+    rows = extract_zips(zip_paths, db_path, "cloud_data", columns, workers=2, on_committed=committed.extend)
+
+    assert rows == 4 * 30 * 3
+    assert sorted(committed) == sorted(os.path.basename(path) for path in zip_paths)
+
+    connection = sqlite3.connect(db_path)
+    table_columns = [column[1] for column in connection.execute("PRAGMA table_info(cloud_data)")]
+    assert table_columns == list(columns)
+    assert connection.execute("SELECT COUNT(*) FROM cloud_data").fetchone()[0] == rows
+    connection.close()
+
+
+def test_extract_zips_replaces_rows_of_changed_files(tmp_path):
+    zip_paths = write_dwd_corpus(str(tmp_path / "cloud_data"), "cloud_data", stations=3, days=10)
+    db_path = str(tmp_path / "data.sqlite")
+    extract_zips(zip_paths, db_path, "cloud_data", columns, workers=1)
+
+    # Station 2 got a longer history on the server
+    os.remove(zip_paths[1])
+    new_path = write_dwd_corpus(str(tmp_path / "update"), "cloud_data", stations=2, days=20)[1]
+    extract_zips([new_path], db_path, "cloud_data", columns, workers=1, replaces_rows={os.path.basename(new_path)})
+
+    connection = sqlite3.connect(db_path)
+    counts = dict(connection.execute("SELECT STATIONS_ID, COUNT(*) FROM cloud_data GROUP BY STATIONS_ID"))
+    connection.close()
+    assert counts == {1: 30, 2: 60, 3: 30}
+
+
+def test_extract_zips_applies_time_window(tmp_path):
+    zip_paths = write_dwd_corpus(str(tmp_path / "cloud_data"), "cloud_data", stations=2, days=365, start_year=2009)
+    db_path = str(tmp_path / "data.sqlite")
+
+    data_src = dict(weather_sources_by_name["cloud_data"], window=("2009-07-01", "2009-07-31"))
+    rows = extract_zips(zip_paths, db_path, "cloud_data", columns, mess_datum_range(data_src), workers=1)
+    assert rows == 2 * 31 * 3
+
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("SELECT MIN(MESS_DATUM), MAX(MESS_DATUM) FROM cloud_data").fetchone() == (2009070106, 2009073120)
+    connection.close()
+
+
+def test_extract_zips_is_idempotent(tmp_path):
+    zip_paths = write_dwd_corpus(str(tmp_path / "cloud_data"), "cloud_data", stations=2, days=10)
+    db_path = str(tmp_path / "data.sqlite")
+
+    extract_zips(zip_paths, db_path, "cloud_data", columns, workers=1)
+    extract_zips(zip_paths, db_path, "cloud_data", columns, workers=1)
+
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("SELECT COUNT(*) FROM cloud_data").fetchone()[0] == 2 * 10 * 3
+    connection.close()
+
+    extracted = checkpoints(db_path, "cloud_data")
+    assert all(is_extracted(path, extracted[os.path.basename(path)]) for path in zip_paths)
+    assert [checkpoint["rows"] for checkpoint in extracted.values()] == [30, 30]
+
+
+def test_extract_zips_resumes_after_the_last_checkpoint(tmp_path, monkeypatch):
+    zip_paths = write_dwd_corpus(str(tmp_path / "cloud_data"), "cloud_data", stations=4, days=10)
+    db_path = str(tmp_path / "data.sqlite")
+    monkeypatch.setattr(extract, "batch_rows", 1)
+
+    def crash(committed: list[str]):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        extract_zips(zip_paths, db_path, "cloud_data", columns, workers=1, on_committed=crash)
+
+    # Only the first zip was committed, the next run picks up the others
+    extracted = checkpoints(db_path, "cloud_data")
+    pending = [path for path in zip_paths if not is_extracted(path, extracted.get(os.path.basename(path)))]
+    assert len(pending) == 3
+    extract_zips(pending, db_path, "cloud_data", columns, workers=1)
+
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("SELECT COUNT(*) FROM cloud_data").fetchone()[0] == 4 * 10 * 3
+    connection.close()
+
+
+def test_extract_zips_removes_duplicates_of_older_runs(tmp_path):
+    zip_paths = write_dwd_corpus(str(tmp_path / "cloud_data"), "cloud_data", stations=1, days=10)
+    db_path = str(tmp_path / "data.sqlite")
+    extract_zips(zip_paths, db_path, "cloud_data", columns, workers=1)
+
+    # New tables are clustered on the key
+    connection = sqlite3.connect(db_path)
+    assert "WITHOUT ROWID" in connection.execute("SELECT sql FROM sqlite_master WHERE name = 'cloud_data'").fetchone()[0]
+
+    # A table of an older run has no key and the rows twice, like an interrupted run that was repeated
+    connection.execute("ALTER TABLE cloud_data RENAME TO clustered")
+    connection.execute("CREATE TABLE cloud_data AS SELECT * FROM clustered")
+    connection.execute("INSERT INTO cloud_data SELECT * FROM clustered")
+    connection.execute("DROP TABLE clustered")
+    connection.commit()
+    connection.close()
+
+    extract_zips(zip_paths, db_path, "cloud_data", columns, workers=1)
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("SELECT COUNT(*) FROM cloud_data").fetchone()[0] == 10 * 3
+    connection.close()
+
+
+def test_in_window():
+    data_src = dict(weather_sources_by_name["wind_data"], window=("2010-01-01", "2019-12-31"))
+
+    assert in_window(data_src, "terminwerte_FK_00003_19370101_20110331_hist.zip")
+    assert in_window(data_src, "terminwerte_FK_00044_20150101_20221231_hist.zip")
+    assert not in_window(data_src, "terminwerte_FK_00001_19370101_20091231_hist.zip")
+    assert not in_window(data_src, "terminwerte_FK_00001_20200101_20221231_hist.zip")
+    assert in_window(data_src, "FK_Terminwerte_Beschreibung_Stationen.txt")
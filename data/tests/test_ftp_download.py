@@ -0,0 +1,70 @@
+import os
+import threading
+
+import pytest
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+from ftp_download import FTPPool, download_files
+
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    remote_dir = tmp_path / "remote" / "historical"
+    remote_dir.mkdir(parents=True)
+    for i in range(20):
+        (remote_dir / f"terminwerte_N_{i:05d}_19500101_20221231_hist.zip").write_bytes(os.urandom(1024 * (i + 1)))
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_anonymous(str(tmp_path / "remote"))
+    handler = type("Handler", (FTPHandler,), {"authorizer": authorizer})
+
+    # The threaded server changes the working directory of the whole process, so only use absolute paths
+    server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"timeout": 0.1}, daemon=True)
+    thread.start()
+    yield server.address[1], remote_dir
+    server.close_all()
+
+
+def test_download_files(ftp_server, tmp_path):
+    port, remote_dir = ftp_server
+    target_dir = tmp_path / "local"
+
+    pool = FTPPool("127.0.0.1", "/historical", size=4, port=port)
+    files = pool.nlst()
+    stats = download_files(pool, files, str(target_dir))
+    pool.close()
+
+    assert stats.failed == []
+    assert stats.files == 20
+    assert sorted(os.listdir(target_dir)) == sorted(os.listdir(remote_dir))
+    for file in files:
+        assert (target_dir / file).read_bytes() == (remote_dir / file).read_bytes()
+    assert stats.bytes == sum(os.path.getsize(remote_dir / file) for file in files)
+
+
+def test_failed_download_leaves_no_partial_file(ftp_server, tmp_path):
+    port, _ = ftp_server
+    target_dir = tmp_path / "local"
+
+    pool = FTPPool("127.0.0.1", "/historical", size=2, port=port)
+    stats = download_files(pool, ["missing.zip"], str(target_dir), retries=1, backoff=0)
+    pool.close()
+
+    assert stats.failed == ["missing.zip"]
+    assert os.listdir(target_dir) == []
+
+
+def test_listing_reports_size_and_modification_time(ftp_server):
+    port, remote_dir = ftp_server
+
+    pool = FTPPool("127.0.0.1", "/historical", size=1, port=port)
+    listing = pool.listing()
+    pool.close()
+
+    assert len(listing) == 20
+    for name, remote_file in listing.items():
+        assert remote_file.size == os.path.getsize(remote_dir / name)
+        assert len(remote_file.modified) == 14
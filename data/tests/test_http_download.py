@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_download
+
+payload: bytes = os.urandom(3 * 1024 * 1024 + 123)
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Serves `payload` with ETag and Range support, like the OPSD server, and can drop the first connection halfway
+    etag: str = '"v1"'
+    drop_after: int | None = None
+    requests: list[dict] = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send_headers(self, status: int, start: int, length: int):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", self.etag)
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{start + length - 1}/{len(payload)}")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._send_headers(200, 0, len(payload))
+
+    def do_GET(self):
+        type(self).requests.append(dict(self.headers))
+        start: int = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", self.etag) == self.etag:
+            start = int(range_header.removeprefix("bytes=").split("-")[0])
+            if start >= len(payload):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        body: bytes = payload[start:]
+        self._send_headers(206 if start else 200, start, len(body))
+
+        if type(self).drop_after is not None:
+            body, type(self).drop_after = body[:type(self).drop_after], None
+            self.wfile.write(body)
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def http_server():
+    handler = type("TestHandler", (Handler,), {"requests": [], "drop_after": None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/time_series.sqlite", handler
+    server.shutdown()
+    server.server_close()
+
+
+def test_download(http_server, tmp_path):
+    url, _ = http_server
+    target = str(tmp_path / "power_data.sqlite")
+
+    remote = http_download.head(url)
+    assert remote.size == len(payload) and remote.etag == '"v1"' and remote.accept_ranges
+
+    size, checksum = http_download.download(url, target, remote=remote, sha256=hashlib.sha256(payload).hexdigest())
+    assert size == len(payload)
+    assert checksum == hashlib.sha256(payload).hexdigest()
+    assert open(target, "rb").read() == payload
+    assert os.listdir(tmp_path) == ["power_data.sqlite"]
+
+
+def test_interrupted_download_is_resumed(http_server, tmp_path):
+    url, handler = http_server
+    handler.drop_after = 1024 * 1024
+    target = str(tmp_path / "power_data.sqlite")
+
+    size, checksum = http_download.download(url, target, remote=http_download.head(url), backoff=0)
+
+    assert open(target, "rb").read() == payload
+    assert checksum == hashlib.sha256(payload).hexdigest()
+    assert [request.get("Range") for request in handler.requests] == [None, f"bytes={1024 * 1024}-"]
+    assert handler.requests[1]["If-Range"] == '"v1"'
+
+
+def test_changed_file_is_downloaded_again(http_server, tmp_path):
+    url, handler = http_server
+    target = str(tmp_path / "power_data.sqlite")
+
+    # A leftover partial file of an older version, the server ignores the range and sends everything
+    with open(target + http_download.part_suffix, "wb") as f:
+        f.write(b"old version")
+    stale = http_download.RemoteResource(url, etag='"v0"')
+    http_download.download(url, target, remote=stale)
+
+    assert open(target, "rb").read() == payload
+    assert handler.requests[0]["If-Range"] == '"v0"'
+
+
+def test_checksum_mismatch(http_server, tmp_path):
+    url, _ = http_server
+    target = str(tmp_path / "power_data.sqlite")
+
+    with pytest.raises(http_download.IntegrityError):
+        http_download.download(url, target, sha256="0" * 64, retries=1, backoff=0)
+    assert os.listdir(tmp_path) == []
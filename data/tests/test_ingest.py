@@ -0,0 +1,96 @@
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "exercises"))
+
+import ingest  # noqa: E402
+from ingest import Source, load  # noqa: E402
+
+
+def test_header_footer_and_filters(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "chunk_size", 2)
+    path = tmp_path / "46251-0021_00.csv"
+    lines = ["GENESIS-Tabelle: 46251-0021", "Stichtag", ""] + [
+        f"2023-01-01;{cin};Ort {cin};{petrol};x" for cin, petrol in
+        [("01001", "12"), ("01002", "-"), ("DG", "7"), ("01003", "5"), ("01004", "0"), ("01005", "9")]
+    ] + ["__________", "(C)opyright", "Statistisches Bundesamt", "Stand: 2023"]
+    path.write_bytes(("\n".join(lines) + "\n").encode("latin-1"))
+
+    source = Source(url=str(path), encoding="ISO-8859-1", delimiter=";", skip_header=3, skip_footer=4, header=False,
+                    columns={1: "CIN", 3: "petrol"}, types={"CIN": "str", "petrol": "int"},
+                    filters=[lambda df: df["CIN"].str.match("^[0-9]{5}$"), lambda df: df["petrol"] > 0])
+    db_path = tmp_path / "cars.sqlite"
+    assert load(source, f"sqlite:///{db_path}", "cars") == 3
+
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute("SELECT CIN, petrol FROM cars").fetchall() == [("01001", 12), ("01003", 5), ("01005", 9)]
+    connection.close()
+
+
+def test_filter_over_columns_with_missing_counts(tmp_path):
+    # Like the filter of exercise3.py, a row with "-" or "." in any of the columns is dropped
+    path = tmp_path / "counts.csv"
+    path.write_text("a;b\n1;2\n-;5\n3;.\n4;6\n")
+
+    source = Source(url=str(path), delimiter=";", types={"a": "int", "b": "int"},
+                    filters=[lambda df: (df[["a", "b"]] > 0).fillna(False).all(axis=1)])
+    db_path = tmp_path / "counts.sqlite"
+    assert load(source, f"sqlite:///{db_path}", "counts") == 2
+
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute("SELECT a, b FROM counts").fetchall() == [(1, 2), (4, 6)]
+    connection.close()
+
+
+def test_zip_member(tmp_path):
+    path = tmp_path / "GTFS.zip"
+    stops = pandas.DataFrame({
+        "stop_id": [1, 2, 3, None],
+        "stop_name": ["Fulda", "Gersfeld", "Hünfeld", "Nowhere"],
+        "stop_lat": [50.55, 50.45, 95.0, 50.0],
+        "stop_lon": [9.68, 9.91, 9.77, 9.0],
+        "zone_id": [2001, 2002, 2001, 2001],
+    })
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        zip_ref.writestr("agency.txt", "agency_id\n1\n")
+        zip_ref.writestr("stops.txt", stops.to_csv(index=False))
+
+    source = Source(url=str(path), member="stops.txt", columns=["stop_id", "stop_name", "stop_lat", "zone_id"],
+                    types={"stop_id": "int", "stop_lat": "float", "zone_id": "int"}, dropna=True,
+                    filters=[lambda df: df["zone_id"] == 2001, lambda df: df["stop_lat"].between(-90, 90)])
+    db_path = tmp_path / "gtfs.sqlite"
+    assert load(source, f"sqlite:///{db_path}", "stops") == 1
+
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute("SELECT * FROM stops").fetchall() == [(1, "Fulda", 50.55, 2001)]
+    connection.close()
+    assert sorted(os.listdir(tmp_path)) == ["GTFS.zip", "gtfs.sqlite"]
+
+
+def test_fetch_over_http(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    with zipfile.ZipFile(served / "GTFS.zip", "w") as zip_ref:
+        zip_ref.writestr("stops.txt", "stop_id,zone_id\n1,2001\n")
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=str(served)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        # Streamed through http_download into a temporary directory
+        source = Source(url=f"http://127.0.0.1:{server.server_port}/GTFS.zip", member="stops.txt")
+        assert ingest.fetch(source) == b"stop_id,zone_id\n1,2001\n"
+    finally:
+        server.shutdown()
+        server.server_close()
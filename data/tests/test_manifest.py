@@ -0,0 +1,26 @@
+from manifest import DOWNLOADED, INGESTED, Manifest
+
+
+def test_manifest_round_trip(tmp_path):
+    manifest = Manifest.for_source(str(tmp_path), "wind_data")
+    assert not manifest.exists()
+
+    manifest.update("a.zip", size=10, modified="20230101000000", status=DOWNLOADED)
+    manifest.update("b.zip", size=20, modified="20230101000000", status=INGESTED)
+    manifest.save()
+
+    manifest = Manifest.for_source(str(tmp_path), "wind_data")
+    assert manifest.exists()
+    assert manifest.with_status(DOWNLOADED) == ["a.zip"]
+    assert manifest.with_status(INGESTED) == ["b.zip"]
+
+
+def test_manifest_detects_changed_files(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.update("a.zip", size=10, modified="20230101000000")
+
+    assert manifest.is_current("a.zip", 10, "20230101000000")
+    assert manifest.is_current("a.zip")  # nothing known about the remote side
+    assert not manifest.is_current("a.zip", 11, "20230101000000")
+    assert not manifest.is_current("a.zip", 10, "20230102000000")
+    assert not manifest.is_current("b.zip", 10, "20230101000000")
@@ -0,0 +1,118 @@
+import os
+import threading
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def test_independent_stages_run_concurrently(tmp_path):
+    # Both downloads have to be running at the same time to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    order: list[str] = []
+    stages = [
+        Stage("a:download", barrier.wait),
+        Stage("b:download", barrier.wait),
+        Stage("a:extract", lambda: order.append("a:extract"), deps=["a:download"]),
+        Stage("report", lambda: order.append("report"), deps=["a:extract", "b:download"]),
+    ]
+
+    failed = Pipeline(stages, cache_path=str(tmp_path / "cache.json")).run(workers=4)
+
+    assert failed == set()
+    assert order == ["a:extract", "report"]
+
+
+def test_unchanged_stages_are_skipped(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("1")
+    runs: list[str] = []
+
+    def pipeline() -> Pipeline:
+        return Pipeline([
+            Stage("extract", lambda: runs.append("extract"), inputs=lambda: [str(source)]),
+            Stage("transform", lambda: runs.append("transform"), deps=["extract"], inputs=lambda: []),
+        ], cache_path=str(tmp_path / "cache.json"))
+
+    pipeline().run()
+    pipeline().run()
+    assert runs == ["extract", "transform"]
+
+    # A changed input invalidates the stage and everything after it
+    source.write_text("2")
+    pipeline().run()
+    assert runs == ["extract", "transform"] * 2
+
+    pipeline().run(["transform"], force={"transform"})
+    assert runs == ["extract", "transform"] * 2 + ["transform"]
+
+
+
+def test_input_directories_are_fingerprinted_by_stat(tmp_path):
+    archives = tmp_path / "archives"
+    archives.mkdir()
+    archive, manifest = archives / "a.zip", tmp_path / "manifest.json"
+    archive.write_text("1")
+    manifest.write_text("1")
+    runs: list[str] = []
+
+    def pipeline() -> Pipeline:
+        return Pipeline([Stage("extract", lambda: runs.append("extract"), inputs=lambda: [str(manifest), str(archives)])],
+                        cache_path=str(tmp_path / "cache.json"))
+
+    def rewrite(path, text: str):
+        # Same size and modification time, only the content differs
+        stat = os.stat(path)
+        path.write_text(text)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    pipeline().run()
+    rewrite(archive, "2")
+    pipeline().run()
+    assert runs == ["extract"]
+
+    rewrite(manifest, "2")
+    pipeline().run()
+    assert runs == ["extract"] * 2
+
+def test_failed_stage_skips_dependents(tmp_path):
+    runs: list[str] = []
+
+    def fail():
+        raise RuntimeError("server unreachable")
+
+    stages = [
+        Stage("a:download", fail),
+        Stage("a:extract", lambda: runs.append("a:extract"), deps=["a:download"]),
+        Stage("b:extract", lambda: runs.append("b:extract")),
+    ]
+    failed = Pipeline(stages, cache_path=str(tmp_path / "cache.json")).run()
+
+    assert failed == {"a:download", "a:extract"}
+    assert runs == ["b:extract"]
+
+
+def test_shared_resources_run_one_at_a_time(tmp_path):
+    active: list[int] = [0, 0]
+    lock = threading.Lock()
+
+    def extract():
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        threading.Event().wait(0.05)
+        with lock:
+            active[0] -= 1
+
+    stages = [Stage(f"{name}:extract", extract, resources={"data.sqlite"}) for name in "abcd"]
+    Pipeline(stages, cache_path=str(tmp_path / "cache.json")).run(workers=4)
+
+    assert active[1] == 1
+
+
+def test_unknown_stage(tmp_path):
+    pipeline = Pipeline([Stage("a", lambda: None)], cache_path=str(tmp_path / "cache.json"))
+    with pytest.raises(ValueError):
+        pipeline.run(["b"])
+    with pytest.raises(ValueError):
+        Pipeline([Stage("a", lambda: None, deps=["b"])])
@@ -0,0 +1,66 @@
+import json
+import threading
+import time
+
+import pytest
+
+import profiling
+from profiling import current_span, span, timed
+
+
+def test_spans_are_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_spans", [])
+
+    @timed("transform")
+    def transform(table_name: str) -> int:
+        current_span().add(rows=1000, source=table_name)
+        return 1000
+
+    with span("stage", stage="wind_data:transform") as stage:
+        transform("wind_data")
+        stage.add(bytes=2_000_000)
+
+    # Spans in other threads are recorded as well
+    thread = threading.Thread(target=transform, args=("rain_data",))
+    thread.start()
+    thread.join()
+
+    report_path = tmp_path / "run_report.jsonl"
+    profiling.finish_run(path=str(report_path))
+    profiling.finish_run(path=str(report_path))
+
+    records = [json.loads(line) for line in report_path.read_text().splitlines()]
+    assert len(records) == 6
+    assert {record["run"] for record in records} == {profiling.run_id}
+
+    transform_record = records[0]
+    assert transform_record["name"] == "transform"
+    assert transform_record["parent"] == "stage"
+    assert transform_record["fields"] == {"source": "wind_data"}
+    assert transform_record["rows"] == 1000
+    assert transform_record["rows_per_second"] > 0
+    assert records[1]["name"] == "stage" and records[1]["bytes"] == 2_000_000
+    assert records[2]["parent"] is None
+
+    if profiling.proc_available:
+        assert transform_record["peak_rss_mb"] > 0
+
+
+@pytest.mark.skipif(not profiling.proc_available, reason="memory is sampled from /proc")
+def test_peak_memory_per_span(monkeypatch):
+    monkeypatch.setattr(profiling, "_spans", [])
+
+    # The allocation is freed before the next span, which doesn't report it
+    with span("heavy") as heavy:
+        buffer = bytearray(300 * 1024 * 1024)
+        time.sleep(0.2)
+        del buffer
+    with span("light") as light:
+        time.sleep(0.2)
+
+    assert heavy.peak_rss_mb - light.peak_rss_mb > 200
+
+
+def test_current_span_outside_of_spans():
+    # Instrumented code called directly doesn't fail
+    current_span().add(rows=5)
@@ -0,0 +1,47 @@
+import pandas
+import pytest
+import sqlalchemy
+
+import query
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    hours = pandas.date_range("2015-01-01", "2015-01-03 23:00", freq="H")
+    pandas.DataFrame({
+        "utc_timestamp": hours.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "cet_cest_timestamp": hours.strftime("%Y-%m-%dT%H:%M:%S+0100"),
+        "DE_wind_generation_actual": [float(i) for i in range(len(hours))],
+    }).to_sql("power_data", engine, index=False)
+
+    terms = pandas.to_datetime(["2015-01-01 06:00", "2015-01-01 13:00", "2015-01-02 06:00", "2015-01-05 06:00"])
+    pandas.DataFrame({
+        "station_id": [1, 2, 1, 1],
+        "date": terms,
+        "speed": [2, 4, 6, 8],
+    }).to_sql("wind_data", engine, index=False)
+    return engine
+
+
+def test_daily_aggregates(engine):
+    data_frame = query.weather(engine, "wind_data", {"speed": "max"})
+    assert data_frame["date"].dt.strftime("%Y-%m-%d").tolist() == ["2015-01-01", "2015-01-02", "2015-01-05"]
+    assert data_frame["speed"].tolist() == [4, 6, 8]
+
+    data_frame = query.weather(engine, "wind_data", ["speed"], stations=[1], end="2015-01-03")
+    assert data_frame["speed"].tolist() == [2, 6]
+
+
+def test_power_weather_join(engine):
+    data_frame = query.power_weather(engine, ["DE_wind_generation_actual"], {"wind_data": ["speed"]})
+
+    # Only days with both power and wind data remain
+    assert data_frame["date"].dt.strftime("%Y-%m-%d").tolist() == ["2015-01-01", "2015-01-02"]
+    assert data_frame["DE_wind_generation_actual"].tolist() == [11.5, 35.5]
+    assert data_frame["speed"].tolist() == [3, 6]
+
+
+def test_unknown_frequency(engine):
+    with pytest.raises(ValueError):
+        query.power(engine, ["DE_wind_generation_actual"], freq="weekly")
@@ -0,0 +1,95 @@
+import pandas
+import pytest
+import sqlalchemy
+
+import query
+from rollups import update_rollups
+
+
+def write_wind(engine, rows: list[tuple], if_exists: str = "replace"):
+    pandas.DataFrame(rows, columns=["station_id", "date", "speed"]).assign(
+        date=lambda data_frame: pandas.to_datetime(data_frame["date"])
+    ).to_sql("wind_data", engine, index=False, if_exists=if_exists)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    write_wind(engine, [
+        (1, "2015-01-01 06:00", 2), (1, "2015-01-01 13:00", 4), (2, "2015-01-01 06:00", None),
+        (2, "2015-01-02 06:00", 6), (1, "2015-02-01 06:00", 8),
+    ])
+    return engine
+
+
+def direct_daily(engine) -> pandas.DataFrame:
+    return query.weather(engine, "wind_data", {"speed": "avg"})
+
+
+def test_rollups_match_direct_aggregates(engine):
+    assert update_rollups(engine, "wind_data", ["speed"]) == 2
+
+    daily = query.rollup(engine, "wind_data", ["speed"])
+    assert daily["date"].dt.strftime("%Y-%m-%d").tolist() == ["2015-01-01", "2015-01-02", "2015-02-01"]
+    assert daily["speed_mean"].tolist() == direct_daily(engine)["speed"].tolist()
+    assert daily["speed_count"].tolist() == [2, 1, 1]
+
+    monthly = query.rollup(engine, "wind_data", ["speed"], freq="monthly")
+    assert monthly["speed_mean"].tolist() == [4.0, 8.0]
+    assert monthly["speed_max"].tolist() == [6, 8]
+
+    # Nothing changed, nothing to do
+    assert update_rollups(engine, "wind_data", ["speed"]) == 0
+
+
+def test_rollups_update_incrementally(engine):
+    update_rollups(engine, "wind_data", ["speed"])
+
+    # Station 1 gets new data at the end, station 2 is untouched
+    write_wind(engine, [(1, "2015-02-01 13:00", 10), (1, "2015-02-02 06:00", 12)], if_exists="append")
+    assert update_rollups(engine, "wind_data", ["speed"]) == 1
+    daily = query.rollup(engine, "wind_data", ["speed"])
+    assert daily["speed_mean"].tolist() == direct_daily(engine)["speed"].tolist() == [3.0, 6.0, 9.0, 12.0]
+
+    # Rewritten history (rows removed in the middle) recomputes the station completely
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM wind_data WHERE station_id = 1 AND date LIKE '2015-01-01 13%'")
+    assert update_rollups(engine, "wind_data", ["speed"]) == 1
+    daily = query.rollup(engine, "wind_data", ["speed"])
+    assert daily["speed_mean"].tolist() == direct_daily(engine)["speed"].tolist() == [2.0, 6.0, 9.0, 12.0]
+    assert query.rollup(engine, "wind_data", ["speed"], freq="monthly")["speed_count"].tolist() == [2, 3]
+
+
+def test_rollups_see_corrected_values(engine):
+    update_rollups(engine, "wind_data", ["speed"])
+
+    # A changed zip upserted with the same keys, the row count and the dates stay the same
+    with engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE wind_data SET speed = speed + 1 WHERE station_id = 2")
+    assert update_rollups(engine, "wind_data", ["speed"]) == 1
+    assert query.rollup(engine, "wind_data", ["speed"])["speed_mean"].tolist() \
+        == direct_daily(engine)["speed"].tolist() == [3.0, 7.0, 8.0]
+
+    # A correction of an old row together with new rows isn't mistaken for an append
+    write_wind(engine, [(1, "2015-02-02 06:00", 12)], if_exists="append")
+    with engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE wind_data SET speed = 0 WHERE station_id = 1 AND date LIKE '2015-01-01 06%'")
+    assert update_rollups(engine, "wind_data", ["speed"]) == 1
+    assert query.rollup(engine, "wind_data", ["speed"])["speed_mean"].tolist() \
+        == direct_daily(engine)["speed"].tolist() == [2.0, 7.0, 8.0, 12.0]
+
+
+def test_rollups_without_stations_update_incrementally(engine):
+    def write_power(rows: list[tuple], if_exists: str):
+        pandas.DataFrame(rows, columns=["cet_cest_timestamp", "load"]).to_sql("power_data", engine, index=False,
+                                                                               if_exists=if_exists)
+
+    write_power([("2015-01-01 00:00:00", 10.0), ("2015-01-01 12:00:00", 20.0)], "replace")
+    assert update_rollups(engine, "power_data", ["load"], date_column="cet_cest_timestamp", station_column=None) == 1
+
+    # More rows at the end, the whole table is station 0
+    write_power([("2015-01-01 18:00:00", 30.0), ("2015-01-02 00:00:00", 40.0)], "append")
+    assert update_rollups(engine, "power_data", ["load"], date_column="cet_cest_timestamp", station_column=None) == 1
+    daily = query.rollup(engine, "power_data", ["load"])
+    assert daily["load_mean"].tolist() == [20.0, 40.0]
+    assert daily["load_count"].tolist() == [3, 1]
@@ -0,0 +1,45 @@
+import numpy
+import pandas
+import pytest
+
+import schema
+
+
+def test_apply_narrows_columns_and_replaces_missing_values():
+    data_frame = pandas.DataFrame({
+        "station_id": [44, 73, 91],
+        "direction": [360, -999, 90],
+        "speed": [3.0, 12.0, -999.0],
+        "note": ["a", "b", "c"],
+    })
+
+    schema.apply(data_frame, {"station_id": "int32", "direction": "Int16", "speed": "Int8"})
+
+    assert data_frame.dtypes.astype(str).to_dict() == {"station_id": "int32", "direction": "Int16", "speed": "Int8", "note": "object"}
+    assert data_frame["direction"].isna().tolist() == [False, True, False]
+    assert data_frame["speed"].isna().tolist() == [False, False, True]
+
+
+def test_apply_refuses_values_that_do_not_fit():
+    with pytest.raises(ValueError):
+        schema.apply(pandas.DataFrame({"speed": pandas.Series([1, 300], dtype="Int32")}), {"speed": "Int8"})
+
+
+def test_for_sqlite_keeps_decimal_values():
+    data_frame = schema.apply(pandas.DataFrame({"rain": [1.3, -999.0, 0.1]}), {"rain": "Float32"})
+
+    values = schema.for_sqlite(data_frame)["rain"].tolist()
+    assert values[0] == 1.3 and values[2] == 0.1
+    assert pandas.isna(values[1])
+
+
+def test_shortest_float64_matches_the_decimal_strings():
+    generator = numpy.random.default_rng(0)
+    values = numpy.concatenate([
+        generator.normal(10, 8, 100_000).round(1), generator.uniform(-100, 100, 100_000),
+        generator.lognormal(0, 20, 100_000), [0.0, -0.0, numpy.nan, numpy.inf, -numpy.inf, 1e-45, 3.4e38, 16777217.0],
+    ]).astype("float32")
+
+    widened = schema.shortest_float64(values)
+    numpy.testing.assert_array_equal(widened, values.astype(str).astype("float64"))
+    assert numpy.signbit(widened).tolist() == numpy.signbit(values).tolist()
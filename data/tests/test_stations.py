@@ -0,0 +1,96 @@
+import os
+
+import pandas
+import pytest
+import sqlalchemy
+
+import query
+import stations
+from benchmarks.synthetic import write_station_list
+from pipeline import load_script
+from rollups import update_rollups, update_zone_rollups
+
+
+def test_read_station_list(tmp_path):
+    path = write_station_list(str(tmp_path / "FK_Terminwerte_Beschreibung_Stationen.txt"), 3)
+    data_frame = stations.read_station_list(path)
+
+    assert data_frame["station_id"].tolist() == [1, 2, 3]
+    assert data_frame["station_name"].tolist() == ["Station 1", "Station 2", "Station 3"]
+    assert data_frame["state"].unique().tolist() == ["Niedersachsen"]
+    assert data_frame["latitude"].between(47, 55).all() and data_frame["longitude"].between(5, 15).all()
+
+    # Stations measured by several sources keep the longest period
+    other = data_frame.assign(von_datum=19500101, bis_datum=20000101)
+    merged = stations.merge_station_lists([data_frame, other])
+    assert merged["von_datum"].tolist() == [19500101] * 3 and merged["bis_datum"].tolist() == [20221231] * 3
+
+
+def test_zones():
+    towns = {"Berlin": (52.52, 13.40), "Köln": (50.94, 6.96), "München": (48.14, 11.58), "Stuttgart": (48.78, 9.18),
+             "Kiel": (54.32, 10.14), "Leipzig": (51.34, 12.37), "Saarbrücken": (49.24, 6.99), "Brussels": (50.85, 4.35)}
+    index = stations.ZoneIndex()
+    latitudes, longitudes = zip(*towns.values())
+    assert index.lookup(latitudes, longitudes).tolist() == [
+        "50hertz", "amprion", "tennet", "transnetbw", "tennet", "50hertz", "amprion", "amprion"
+    ]
+
+    # Two stations in the same cell share the weight of one, the weights of a zone sum up to 1
+    data_frame = stations.assign_zones(pandas.DataFrame({
+        "station_id": [1, 2, 3, 4],
+        "latitude": [52.51, 52.52, 54.09, 51.34],
+        "longitude": [13.40, 13.41, 12.10, 12.37],
+    }))
+    assert data_frame["zone"].unique().tolist() == ["50hertz"]
+    assert data_frame["weight"].tolist() == pytest.approx([1 / 6, 1 / 6, 1 / 3, 1 / 3])
+
+
+def test_zone_rollups(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    pandas.DataFrame({
+        "station_id": [1, 1, 2, 3],
+        "date": pandas.to_datetime(["2015-01-01 06:00", "2015-01-01 13:00", "2015-01-01 06:00", "2015-01-01 06:00"]),
+        "speed": [2.0, 4.0, 9.0, 5.0],
+    }).to_sql("wind_data", engine, index=False)
+    pandas.DataFrame({
+        "station_id": [1, 2, 3],
+        "zone": ["tennet", "tennet", "amprion"],
+        "weight": [0.75, 0.25, 1.0],
+    }).to_sql("stations", engine, index=False)
+
+    update_rollups(engine, "wind_data", ["speed"])
+    assert update_zone_rollups(engine, "wind_data", ["speed"])
+    assert not update_zone_rollups(engine, "wind_data", ["speed"])
+
+    data_frame = query.zones(engine, "wind_data", ["speed"])
+    assert data_frame.columns.tolist() == ["date", "DE_amprion_speed", "DE_tennet_speed"]
+    assert data_frame.iloc[0].tolist()[1:] == [5.0, 0.75 * 3 + 0.25 * 9]
+
+    # New weights invalidate the zone rollups
+    with engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE stations SET weight = 0.5")
+    assert update_zone_rollups(engine, "wind_data", ["speed"])
+    assert query.zones(engine, "wind_data", ["speed"])["DE_tennet_speed"].tolist() == [6.0]
+
+    # A corrected value keeps the row count and the dates of the station
+    with engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE wind_data SET speed = 10.0 WHERE station_id = 2")
+    update_rollups(engine, "wind_data", ["speed"])
+    assert update_zone_rollups(engine, "wind_data", ["speed"])
+    assert query.zones(engine, "wind_data", ["speed"])["DE_tennet_speed"].tolist() == [0.5 * 3 + 0.5 * 10]
+
+
+def test_parquet_only_transform_writes_no_sqlite(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("STORAGE_BACKENDS", "parquet")
+    os.makedirs("processed_data")
+    station_list = stations.read_station_list(write_station_list("FK_Terminwerte_Beschreibung_Stationen.txt", 3))
+    station_list.to_sql("station_data", sqlalchemy.create_engine("sqlite:///processed_data/data.sqlite"), index=False)
+
+    transform_data = load_script("transform-data.py")
+    transform_data.transform_station_data()
+
+    assert not os.path.exists(os.path.join("processed_data", "transformed_data.sqlite"))
+    written = transform_data.storages[0].read("stations")
+    assert sorted(written["station_id"]) == [1, 2, 3] and written["weight"].notna().all()
@@ -0,0 +1,113 @@
+import pandas
+import pytest
+import sqlalchemy
+
+import schema
+from storage import ParquetStorage, SQLiteStorage
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def wind_frame() -> pandas.DataFrame:
+    dates = pandas.date_range("2014-12-01 06:00", "2016-01-31 20:00", freq="7H")
+    return pandas.DataFrame({
+        "station_id": 44,
+        "date": dates,
+        "direction": (pandas.RangeIndex(len(dates)) * 10 % 360).values,
+        "speed": (pandas.RangeIndex(len(dates)) % 13).values,
+    })
+
+
+@pytest.fixture(params=["sqlite", "parquet"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStorage(sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'data.sqlite'}"))
+    return ParquetStorage(str(tmp_path / "parquet"))
+
+
+def test_round_trip(storage, wind_frame):
+    storage.begin("wind_data")
+    storage.write("wind_data", wind_frame.iloc[:500])
+    storage.write("wind_data", wind_frame.iloc[500:])
+    storage.commit("wind_data")
+
+    data_frame = storage.read("wind_data").sort_values("date").reset_index(drop=True)
+    pandas.testing.assert_frame_equal(data_frame, wind_frame, check_dtype=False)
+
+
+def test_read_columns_and_date_range(storage, wind_frame):
+    storage.begin("wind_data")
+    storage.write("wind_data", wind_frame)
+    storage.commit("wind_data")
+
+    data_frame = storage.read("wind_data", ["date", "speed"], start="2015-03-01", end="2015-04-01")
+    expected = wind_frame[(wind_frame["date"] >= "2015-03-01") & (wind_frame["date"] < "2015-04-01")]
+
+    assert list(data_frame.columns) == ["date", "speed"]
+    assert sorted(data_frame["date"]) == list(expected["date"])
+
+
+def test_rewrite_replaces_table(storage, wind_frame):
+    for data_frame in (wind_frame, wind_frame.iloc[:10]):
+        storage.begin("wind_data")
+        storage.write("wind_data", data_frame)
+        storage.commit("wind_data")
+
+    assert len(storage.read("wind_data")) == 10
+
+
+def test_table_without_dates(storage):
+    stations = pandas.DataFrame({"station_id": [44, 73], "zone": ["tennet", "amprion"], "weight": [1.0, 0.5]})
+    storage.begin("stations")
+    storage.write("stations", stations, date_column=None)
+    storage.commit("stations", date_column=None)
+
+    data_frame = storage.read("stations").sort_values("station_id").reset_index(drop=True)
+    pandas.testing.assert_frame_equal(data_frame, stations, check_dtype=False)
+
+
+def test_sqlite_copy_parses_power_timestamps(tmp_path):
+    source = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'data.sqlite'}")
+    pandas.DataFrame({
+        "utc_timestamp": ["2015-03-29T00:00:00Z", "2015-03-29T01:00:00Z"],
+        "cet_cest_timestamp": ["2015-03-29T01:00:00+0100", "2015-03-29T03:00:00+0200"],
+        "DE_wind_generation_actual": [1.5, None],
+    }).to_sql("power_data", source, index=False)
+
+    storage = SQLiteStorage(sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}"))
+    storage.begin("power_data")
+    storage.copy("power_data", str(tmp_path / "data.sqlite"), expressions=schema.power_timestamp_sql,
+                 types={column: "DATETIME" for column in schema.power_timestamp_columns})
+    storage.commit("power_data")
+
+    data_frame = pandas.read_sql_table("power_data", storage.engine)
+    assert data_frame["cet_cest_timestamp"].tolist() == [pandas.Timestamp("2015-03-29 01:00"), pandas.Timestamp("2015-03-29 03:00")]
+    assert data_frame["utc_timestamp"].dt.hour.tolist() == [0, 1]
+    assert data_frame["DE_wind_generation_actual"].isna().tolist() == [False, True]
+
+
+def test_sqlite_clustered_table(tmp_path, wind_frame):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'data.sqlite'}")
+    storage = SQLiteStorage(engine)
+    storage.begin("wind_data")
+    storage.write("wind_data", wind_frame)
+    storage.commit("wind_data")
+
+    # The second copy of a row replaces the first, the rows are stored as to_sql writes them
+    storage.begin("clustered", key=("station_id", "date"))
+    storage.write("clustered", wind_frame.iloc[::-1])
+    storage.write("clustered", wind_frame.iloc[:10].assign(speed=0))
+    storage.commit("clustered", indexes=[("station_id", "date"), ("date",)])
+
+    with engine.connect() as connection:
+        assert "WITHOUT ROWID" in connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'clustered'").scalar()
+        indexes = connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'clustered'")
+        assert [row[0] for row in indexes] == ["clustered_date_idx"]
+        assert connection.exec_driver_sql("SELECT * FROM clustered WHERE date > '2015-01-01 00:00:00'").fetchall() == \
+            connection.exec_driver_sql("SELECT * FROM wind_data WHERE date > '2015-01-01 00:00:00'").fetchall()
+
+    data_frame = storage.read("clustered")
+    assert len(data_frame) == len(wind_frame) and (data_frame["speed"].iloc[:10] == 0).all()
+    pandas.testing.assert_frame_equal(data_frame.iloc[10:].reset_index(drop=True),
+                                      wind_frame.iloc[10:].reset_index(drop=True), check_dtype=False)
@@ -0,0 +1,74 @@
+import os
+
+import numpy
+import pandas
+import sqlalchemy
+
+import storage_potential
+from storage import SQLiteStorage
+from storage_potential import StorageParameters
+
+
+def test_clamped_cumsum_matches_a_loop():
+    generator = numpy.random.default_rng(0)
+    steps = generator.normal(0, 3, size=(3, 1000))
+    upper = numpy.array([5.0, 20.0, 1e9])
+    initial = numpy.array([0.0, 10.0, 0.0])
+
+    expected = numpy.empty_like(steps)
+    for row in range(len(steps)):
+        charge = initial[row]
+        for hour in range(steps.shape[1]):
+            charge = min(max(charge + steps[row, hour], 0.0), upper[row])
+            expected[row, hour] = charge
+
+    numpy.testing.assert_allclose(storage_potential.clamped_cumsum(steps, upper, initial), expected, atol=1e-9)
+
+
+def test_runs():
+    starts, lengths = storage_potential.runs(numpy.array([True, True, False, True, False, False, True]))
+    assert starts.tolist() == [0, 3, 6] and lengths.tolist() == [2, 1, 1]
+    assert storage_potential.runs(numpy.array([], dtype=bool))[0].tolist() == []
+
+
+def test_simulate():
+    # 10 MWh surplus, then 4 hours of 5 MWh deficit, a lossless storage of 8 MWh covers the first 8 MWh of it, limited
+    # to 2 MW it only takes 2 MWh of the surplus
+    renewable = numpy.array([20.0, 0.0, 0.0, 0.0, 0.0])
+    load = numpy.array([10.0, 5.0, 5.0, 5.0, 5.0])
+    result = storage_potential.simulate(renewable, load, [StorageParameters(8, efficiency=1.0),
+                                                          StorageParameters(8, power=2, efficiency=1.0)])
+    assert result["delivered"].tolist() == [8.0, 2.0]
+    assert result["curtailed"].tolist() == [2.0, 8.0]
+    assert result["covered_hours"].tolist() == [1, 0]
+    assert result["coverage"].tolist() == [0.4, 0.1]
+
+
+def test_sweep_is_cached_per_parameter_set(tmp_path, monkeypatch):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'transformed_data.sqlite'}")
+    hours = pandas.date_range("2020-01-01", periods=96, freq="H")
+    solar = numpy.clip(numpy.sin(numpy.arange(96) / 24 * 2 * numpy.pi), 0, None) * 100
+    storage = SQLiteStorage(engine)
+    storage.begin("power_data")
+    storage.write("power_data", pandas.DataFrame({
+        "utc_timestamp": hours, "DE_wind_generation_actual": 20.0, "DE_solar_generation_actual": solar,
+        "DE_wind_capacity": 100.0, "DE_solar_capacity": 200.0, "DE_load_actual_entsoe_transparency": 50.0,
+    }))
+    storage.commit("power_data", date_column="utc_timestamp")
+
+    simulated: list[int] = []
+    simulate = storage_potential.simulate
+    monkeypatch.setattr(storage_potential, "simulate",
+                        lambda renewable, load, parameters: simulated.append(len(parameters)) or simulate(renewable, load, parameters))
+
+    first = storage_potential.sweep(engine, capacities=[10, 100], efficiencies=[0.8, 1.0])
+    second = storage_potential.sweep(engine, capacities=[10, 100, 1000], efficiencies=[0.8, 1.0])
+    assert simulated == [4, 2]
+    pandas.testing.assert_frame_equal(second[second["capacity"] < 1000].reset_index(drop=True), first)
+    assert (second.groupby("efficiency")["coverage"].apply(lambda coverage: coverage.is_monotonic_increasing)).all()
+
+    # Nights without wind cover the load, so there is no dunkelflaute, but a surplus run every day
+    streaks = storage_potential.streaks(engine)
+    assert (streaks["kind"] == "surplus").sum() == 4
+    assert (streaks["kind"] == "dunkelflaute").sum() == 0
+    assert len(os.listdir(tmp_path / "cache")) > 0
@@ -0,0 +1,118 @@
+import os
+import sqlite3
+
+import numpy
+import pandas
+import pytest
+
+import validation
+from benchmarks.synthetic import write_dwd_corpus, write_station_list
+from extract import extract_zips
+from ftp_download import DownloadStats
+from manifest import DOWNLOADED, Manifest
+from pipeline import load_script
+from sources import weather_sources_by_name
+
+
+def test_rules():
+    data_frame = pandas.DataFrame({
+        "station_id": pandas.array([1, 2, 3, 4, None], dtype="Int32"),
+        "rain_form": pandas.array([0, 4, 6, 12, 9], dtype="Int8"),
+        "rain": pandas.array([0.5, -1.0, None, 3.0, 1.0], dtype="Float32"),
+        "von_datum": [19900101, 19901301, 20000101, 20000101, 20000101],
+    })
+    rules = [
+        validation.NotNull("station_id"),
+        validation.Reference("station_id", "stations"),
+        validation.Range("rain", 0, 500),
+        validation.Sentinel("rain_form", (4, 9)),
+        validation.Range("rain_form", 0, 9),
+        validation.Regex("von_datum", r"(19|20)\d\d(0[1-9]|1[0-2])\d\d"),
+    ]
+    validator = validation.Validator("rain_data", rules, references={"stations": numpy.array([1, 2, 4])})
+    valid, rejected = validator.check(data_frame)
+
+    # Station 3 is unknown, station 2 has negative rain (and an invalid date), 4 an invalid code, the last one no id
+    assert valid["station_id"].tolist() == [1]
+    assert rejected["rule"].tolist() == ["rain:range", "station_id:reference", "rain_form:range", "station_id:not_null"]
+    assert validator.counts == {"station_id:not_null": 1, "station_id:reference": 1, "rain:range": 1,
+                                "rain_form:sentinel": 2, "rain_form:range": 1, "von_datum:regex": 1}
+    assert validator.rows == 5 and validator.rejected == 4
+
+    # Sentinels only remove the value, the rows stay
+    assert rejected["rain_form"].isna().tolist() == [True, False, False, True]
+
+
+def test_rules_have_to_implement_violations():
+    class Unfinished(validation.Rule):
+        kind = "unfinished"
+
+    with pytest.raises(TypeError):
+        Unfinished("speed")
+
+
+def test_reference_rules_are_skipped_without_references():
+    validator = validation.Validator("wind_data")
+    assert [rule.name for rule in validator.skipped] == ["station_id:reference"]
+
+    data_frame = pandas.DataFrame({"station_id": [7], "date": [pandas.Timestamp("2020-01-01")], "direction": [90], "speed": [3]})
+    valid, rejected = validator.check(data_frame)
+    assert len(valid) == 1 and len(rejected) == 0 and validator.counts == {}
+
+
+def test_extract_zips_quarantines_rows(tmp_path):
+    zip_paths = write_dwd_corpus(str(tmp_path / "wind_data"), "wind_data", stations=3, days=10)
+    db_path = str(tmp_path / "data.sqlite")
+
+    # The raw columns are checked under their transformed names, station 3 is not in the station lists
+    rules = [validation.Reference("station_id", "stations"), validation.Range("speed", 0, 5)]
+    validator = validation.Validator("wind_data", rules, references={"stations": numpy.array([1, 2])},
+                                     columns=validation.raw_columns("wind_data"))
+    rows = extract_zips(zip_paths, db_path, "wind_data", weather_sources_by_name["wind_data"]["columns"], workers=1,
+                        validator=validator)
+
+    connection = sqlite3.connect(db_path)
+    kept = connection.execute("SELECT COUNT(*) FROM wind_data").fetchone()[0]
+    quarantined = dict(connection.execute("SELECT rule, COUNT(*) FROM wind_data_quarantine GROUP BY rule"))
+    assert connection.execute("SELECT COUNT(*) FROM wind_data WHERE STATIONS_ID = 3 OR FK_TER > 5").fetchone()[0] == 0
+    connection.close()
+
+    assert kept + sum(quarantined.values()) == rows == 3 * 10 * 3
+    assert quarantined["station_id:reference"] == 30
+    assert sum(quarantined.values()) == validator.rejected
+
+    # A new version of station 1 replaces its quarantined rows as well
+    new_path = write_dwd_corpus(str(tmp_path / "update"), "wind_data", stations=1, days=5, seed=1)[0]
+    validator = validation.Validator("wind_data", rules, references={"stations": numpy.array([1, 2])},
+                                     columns=validation.raw_columns("wind_data"))
+    extract_zips([new_path], db_path, "wind_data", weather_sources_by_name["wind_data"]["columns"], workers=1,
+                 replaces_rows={os.path.basename(new_path)}, validator=validator)
+
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("SELECT COUNT(*) FROM wind_data_quarantine WHERE STATIONS_ID = 1").fetchone()[0] \
+        == validator.rejected
+    connection.close()
+
+
+def test_stations_added_on_the_server_are_not_quarantined(tmp_path, monkeypatch):
+    # pull-data.py after the downloads, the second run downloaded the archive and station list of a new station
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("processed_data")
+    pull_data = load_script("pull-data.py")
+    monkeypatch.setattr(pull_data, "weather_sources", [weather_sources_by_name["wind_data"]])
+    monkeypatch.setattr(pull_data, "download", lambda *args, **kwargs: DownloadStats())
+    monkeypatch.setattr(pull_data, "pull_power_data", lambda: None)
+
+    for stations in (2, 3):
+        manifest = Manifest.for_source("raw_data", "wind_data")
+        for path in write_dwd_corpus(os.path.join("raw_data", "wind_data"), "wind_data", stations, days=10, start_year=2010):
+            if manifest.get(os.path.basename(path)) is None:
+                manifest.update(os.path.basename(path), size=os.path.getsize(path), status=DOWNLOADED)
+        manifest.save()
+        write_station_list(os.path.join("raw_data", "wind_data", "FK_Terminwerte_Beschreibung_Stationen.txt"), stations)
+        pull_data.main()
+
+    connection = sqlite3.connect(os.path.join("processed_data", "data.sqlite"))
+    assert connection.execute("SELECT COUNT(*) FROM wind_data WHERE STATIONS_ID = 3").fetchone()[0] == 10 * 3
+    assert connection.execute("SELECT COUNT(*) FROM wind_data").fetchone()[0] == 3 * 10 * 3
+    connection.close()
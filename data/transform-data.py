@@ -1,30 +1,125 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas
 import sqlalchemy
 
+import align
+import database
+import schema
+import stations
+import validation
 from logger import log
+from profiling import current_span, finish_run, timed
+from query import power_indexes, weather_indexes, weather_key
+from rollups import update_rollups, update_zone_rollups
+from sources import mess_datum_range, weather_sources_by_name
+from storage import create_storages
 
 old_db_connection_uri: str = "sqlite:///processed_data/data.sqlite"
 new_db_connection_uri: str = "sqlite:///processed_data/transformed_data.sqlite"
-old_engine = sqlalchemy.create_engine(old_db_connection_uri)
-new_engine = sqlalchemy.create_engine(new_db_connection_uri)
+old_engine = database.create_engine(old_db_connection_uri, "read")
+# The weather tables are written concurrently, wait for the other writers instead of failing on a locked database
+new_engine = database.create_engine(new_db_connection_uri, "bulk", connect_args={"timeout": 300})
+
+# Where the transformed tables are written to, "sqlite" and/or "parquet" (e.g. STORAGE_BACKENDS=sqlite,parquet)
+storage_backends: list[str] = os.environ.get("STORAGE_BACKENDS", "sqlite").split(",")
+parquet_dir: str = "processed_data/parquet"
+storages = create_storages(storage_backends, new_engine, parquet_dir)
+
+# Rows read, transformed and written at once, this caps the memory used per table
+chunk_size: int = 250_000
+
+# Weather tables transformed at the same time
+transform_workers: int = 4
 
 
 def main():
     log("Starting data transformation", "info")
-    transform_cloud_data()
-    transform_rain_data()
-    transform_temperature_data()
-    transform_wind_data()
+    prepare()
+
+    transforms = [transform_cloud_data, transform_rain_data, transform_temperature_data, transform_wind_data]
+    with ThreadPoolExecutor(max_workers=transform_workers) as executor:
+        for future in [executor.submit(transform) for transform in transforms]:
+            future.result()
+
     insert_power_data()
+    transform_station_data()
+
+    if "sqlite" in storage_backends:
+        align_data()
+        update_all_rollups()
+        optimize()
     log("Finished data transformation", "info")
+    finish_run("Data transformation")
+
+
+def prepare():
+    # The first connection switches the database to WAL (see database.py), before the concurrent transforms start
+    with new_engine.connect():
+        pass
+
+
+@timed("transform")
+def transform_table(table_name: str, new_column_names: dict[str, str], dtype: dict) -> int:
+    data_src: dict = weather_sources_by_name[table_name]
+    date_format: str = "%Y%m%d%H" if data_src["hourly"] else "%Y%m%d"
+
+    # Only read the columns we keep and let sqlite drop entries outside the time window before they reach pandas
+    # (the extraction already skips them, this keeps databases from older runs working)
+    min_date, max_date = mess_datum_range(data_src)
+    columns: str = ", ".join(f'"{column}"' for column in new_column_names)
+    query = sqlalchemy.text(f'SELECT {columns} FROM "{table_name}" WHERE "MESS_DATUM" BETWEEN :min_date AND :max_date')
+
+    # The transformed tables are clustered on (station_id, date)
+    for storage in storages:
+        storage.begin(table_name, key=weather_key)
+
+    # Rows breaking a rule are collected in <table>_quarantine of the transformed database, rebuilt with the table
+    validator = validation.Validator(table_name, references=validation.station_references(old_engine))
+    validation.drop_quarantine(new_engine, table_name)
+
+    rows: int = 0
+    with old_engine.connect() as connection:
+        chunks = pandas.read_sql_query(query, connection, params={
+            "min_date": min_date if min_date is not None else 0,
+            "max_date": max_date if max_date is not None else 9999999999,
+        }, chunksize=chunk_size)
+        for data_frame in chunks:
+            data_frame = data_frame.rename(columns=new_column_names)
+
+            # Convert date column to datetime, impossible dates are quarantined by the not_null rule
+            data_frame["date"] = pandas.to_datetime(data_frame["date"], format=date_format, errors="coerce")
+
+            # Narrow the columns and replace the -999 marker of raw tables from older runs
+            data_frame = schema.apply(data_frame, schema.weather_dtypes[table_name])
+
+            data_frame, rejected = validator.check(data_frame)
+            validation.write_quarantine(new_engine, table_name, rejected)
+
+            for storage in storages:
+                storage.write(table_name, data_frame, dtype=dtype)
+            rows += len(data_frame)
+
+    if rows == 0:
+        empty_frame = pandas.DataFrame({column: [] for column in new_column_names.values()})
+        for storage in storages:
+            storage.write(table_name, empty_frame, dtype=dtype)
+
+    # Swap the new tables in
+    for storage in storages:
+        storage.commit(table_name, indexes=weather_indexes)
+
+    current_span().add(rows=rows, source=table_name)
+    current_span().count(validator.counts)
+    if validator.counts:
+        log(f"Validated {table_name} ({validator.summary()})", "info")
+
+    return rows
 
 
 def transform_cloud_data():
     table_name: str = "cloud_data"
-    data_frame = pandas.read_sql_table(table_name, old_engine)
-
-    # Remove unnecessary entries (MESS_DATUM < 2010)
-    data_frame = data_frame[data_frame["MESS_DATUM"] >= 2010010100]  # with hour
 
     new_column_names = {
         "STATIONS_ID": "station_id",
@@ -33,26 +128,17 @@ def transform_cloud_data():
         "CD_TER":      "cloud_cover_form",
     }
 
-    data_frame = data_frame.rename(columns=new_column_names)
-
-    # Convert date column to datetime
-    data_frame["date"] = pandas.to_datetime(data_frame["date"], format="%Y%m%d%H")  # with hour
-
-    data_frame.to_sql(table_name, new_engine, if_exists="replace", index=False, dtype={
+    rows: int = transform_table(table_name, new_column_names, dtype={
         "station_id":   sqlalchemy.types.INTEGER,
         "date":         sqlalchemy.types.DATETIME,
         "cloud_cover":  sqlalchemy.types.INTEGER,    # Percent
         "cloud_density": sqlalchemy.types.INTEGER,   # ???
     })
-    log("Transformed cloud_data", "info")
+    log(f"Transformed cloud_data ({rows} rows)", "info")
 
 
 def transform_rain_data():
     table_name: str = "rain_data"
-    data_frame = pandas.read_sql_table(table_name, old_engine)
-
-    # Remove unnecessary entries (MESS_DATUM < 2010)
-    data_frame = data_frame[data_frame["MESS_DATUM"] >= 20100101]  # no hour
 
     new_column_names = {
         "STATIONS_ID": "station_id",
@@ -63,12 +149,7 @@ def transform_rain_data():
         "NSH_TAG":     "new_snow_height",
     }
 
-    data_frame = data_frame.rename(columns=new_column_names)
-
-    # Convert date column to datetime
-    data_frame["date"] = pandas.to_datetime(data_frame["date"], format="%Y%m%d")  # no hour
-
-    data_frame.to_sql(table_name, new_engine, if_exists="replace", index=False, dtype={
+    rows: int = transform_table(table_name, new_column_names, dtype={
         "station_id":      sqlalchemy.types.INTEGER,
         "date":            sqlalchemy.types.DATETIME,
         "rain":            sqlalchemy.types.FLOAT,       # mm
@@ -76,18 +157,11 @@ def transform_rain_data():
         "snow_height":     sqlalchemy.types.INTEGER,     # cm
         "new_snow_height": sqlalchemy.types.INTEGER      # cm
     })
-    log("Transformed rain_data", "info")
+    log(f"Transformed rain_data ({rows} rows)", "info")
 
 
 def transform_temperature_data():
     table_name: str = "temperature_data"
-    data_frame = pandas.read_sql_table(table_name, old_engine)
-
-    # Remove unnecessary entries (MESS_DATUM < 2010)
-    data_frame = data_frame[data_frame["MESS_DATUM"] >= 2000000000]  # with hour
-
-    # print amount of rows
-    print(len(data_frame))
 
     new_column_names = {
         "STATIONS_ID": "station_id",
@@ -96,26 +170,17 @@ def transform_temperature_data():
         "RF_TER":      "humidity",
     }
 
-    data_frame = data_frame.rename(columns=new_column_names)
-
-    # Convert date column to datetime
-    data_frame["date"] = pandas.to_datetime(data_frame["date"], format="%Y%m%d%H")  # with hour
-
-    data_frame.to_sql(table_name, new_engine, if_exists="replace", index=False, dtype={
+    rows: int = transform_table(table_name, new_column_names, dtype={
         "station_id":  sqlalchemy.types.INTEGER,
         "date":        sqlalchemy.types.DATETIME,
         "temperature": sqlalchemy.types.FLOAT,      # Degrees Celsius
         "humidity":    sqlalchemy.types.FLOAT,      # Percent
     })
-    log("Transformed temperature_data", "info")
+    log(f"Transformed temperature_data ({rows} rows)", "info")
 
 
 def transform_wind_data():
     table_name: str = "wind_data"
-    data_frame = pandas.read_sql_table(table_name, old_engine)
-
-    # Remove unnecessary entries (MESS_DATUM < 2010)
-    data_frame = data_frame[data_frame["MESS_DATUM"] >= 2010010100]  # with hour
 
     new_column_names = {
         "STATIONS_ID": "station_id",
@@ -124,25 +189,121 @@ def transform_wind_data():
         "FK_TER":      "speed",
     }
 
-    data_frame = data_frame.rename(columns=new_column_names)
-
-    # Convert date column to datetime
-    data_frame["date"] = pandas.to_datetime(data_frame["date"], format="%Y%m%d%H")  # with hour
-
-    data_frame.to_sql(table_name, new_engine, if_exists="replace", index=False, dtype={
+    rows: int = transform_table(table_name, new_column_names, dtype={
         "station_id": sqlalchemy.types.INTEGER,
         "date":       sqlalchemy.types.DATETIME,
         "direction":  sqlalchemy.types.INTEGER,    # Degrees (0-360)
         "speed":      sqlalchemy.types.INTEGER,    # Bft (0-12)
     })
-    log("Transformed wind_data", "info")
+    log(f"Transformed wind_data ({rows} rows)", "info")
 
 
+@timed("transform", source="power_data")
 def insert_power_data():
     table_name: str = "power_data"
-    data_frame = pandas.read_sql_table(table_name, old_engine)
-    data_frame.to_sql(table_name, new_engine, if_exists="replace", index=False)
-    log("Inserted power_data", "info")
+    columns: list[str] = [column["name"] for column in sqlalchemy.inspect(old_engine).get_columns(table_name)]
+
+    # Timestamps of databases from older runs are still ISO strings with offsets, parse them like pull-data.py does
+    timestamp_types: dict[str, str] = {column: "DATETIME" for column in schema.power_timestamp_columns}
+    rows: int = 0
+    for storage in storages:
+        storage.begin(table_name)
+        if storage.name == "sqlite":
+            rows = storage.copy(table_name, old_engine.url.database, expressions=schema.power_timestamp_sql,
+                                     types=timestamp_types)
+        else:
+            expressions: list[str] = [schema.power_timestamp_sql.get(column, f'"{column}"') for column in columns]
+            selected: str = ", ".join(f'{expression} AS "{column}"' for expression, column in zip(expressions, columns))
+            with old_engine.connect() as connection:
+                chunks = pandas.read_sql_query(f'SELECT {selected} FROM "{table_name}"', connection, chunksize=chunk_size,
+                                               parse_dates=[column for column in schema.power_timestamp_columns if column in columns])
+                rows = 0
+                for data_frame in chunks:
+                    data_frame = schema.apply(data_frame, schema.power_dtypes(columns))
+                    storage.write(table_name, data_frame, date_column="utc_timestamp")
+                    rows += len(data_frame)
+        storage.commit(table_name, indexes=power_indexes, date_column="utc_timestamp")
+    current_span().add(rows=rows)
+    log(f"Inserted power_data ({rows} rows)", "info")
+
+
+@timed("transform", source="station_data")
+def transform_station_data():
+    # The zone of every station is computed once here, the zone rollups and analyses read it from the stations table
+    if not sqlalchemy.inspect(old_engine).has_table("station_data"):
+        log("Found no station_data (skipping zones)", "failure")
+        return
+
+    with old_engine.connect() as connection:
+        data_frame = pandas.read_sql_table("station_data", connection)
+    data_frame = stations.assign_zones(data_frame)
+    for storage in storages:
+        storage.begin("stations")
+        storage.write("stations", data_frame, date_column=None, dtype={
+            "station_id":     sqlalchemy.types.INTEGER,
+            "latitude":       sqlalchemy.types.FLOAT,
+            "longitude":      sqlalchemy.types.FLOAT,
+            "station_height": sqlalchemy.types.FLOAT,    # m
+            "weight":         sqlalchemy.types.FLOAT,
+        })
+        storage.commit("stations", date_column=None)
+    current_span().add(rows=len(data_frame))
+    counts: str = ", ".join(f"{zone} {count}" for zone, count in data_frame["zone"].value_counts().sort_index().items())
+    log(f"Transformed station_data ({counts})", "info")
+
+
+@timed("transform", source="aligned_data")
+def align_data():
+    # The power data with every weather column on its utc_timestamp grid, reads the transformed sqlite tables
+    table_name: str = "aligned_data"
+    with new_engine.connect() as connection:
+        power_frame = pandas.read_sql_table("power_data", connection, parse_dates=schema.power_timestamp_columns)
+    power_frame = power_frame.sort_values("utc_timestamp", ignore_index=True)
+    grid = align.to_utc(power_frame["utc_timestamp"], "UTC")
+
+    zones: pandas.DataFrame | None = None
+    if sqlalchemy.inspect(new_engine).has_table("stations"):
+        zones = pandas.read_sql_query("SELECT station_id, zone, weight FROM stations", new_engine)
+
+    data_frames: list[pandas.DataFrame] = [power_frame]
+    for name in align.methods:
+        data_frames.append(align.align_table(new_engine, name, grid, weather_sources_by_name[name]["hourly"], zones))
+    data_frame = pandas.concat(data_frames, axis=1)
+
+    # The table is wide, written in slices so the rows converted for the driver stay small
+    rows_per_write: int = max(chunk_size // len(data_frame.columns), 1)
+    for storage in storages:
+        storage.begin(table_name)
+        for start in range(0, len(data_frame), rows_per_write):
+            storage.write(table_name, data_frame.iloc[start:start + rows_per_write], date_column="utc_timestamp")
+        storage.commit(table_name, indexes=power_indexes, date_column="utc_timestamp")
+
+    current_span().add(rows=len(data_frame))
+    log(f"Aligned weather onto power_data ({len(data_frame)} rows, {len(data_frame.columns)} columns)", "info")
+
+
+@timed("rollups")
+def update_all_rollups():
+    has_stations: bool = sqlalchemy.inspect(new_engine).has_table("stations")
+    for table_name, dtypes in schema.weather_dtypes.items():
+        value_columns: list[str] = [column for column in dtypes if column not in ("station_id", "date")]
+        changed: int = update_rollups(new_engine, table_name, value_columns)
+        log(f"Updated rollups of {table_name} ({changed} stations changed)", "info")
+        if has_stations and update_zone_rollups(new_engine, table_name, value_columns):
+            log(f"Updated zone rollups of {table_name}", "info")
+
+    # Days of the power data are local days, like the report uses them
+    columns: list[str] = [column["name"] for column in sqlalchemy.inspect(new_engine).get_columns("power_data")]
+    power_columns: list[str] = list(schema.power_dtypes(columns))
+    update_rollups(new_engine, "power_data", power_columns, date_column="cet_cest_timestamp", station_column=None)
+    log("Updated rollups of power_data", "info")
+
+
+@timed("optimize")
+def optimize():
+    # Planner statistics for the new tables and indexes, VACUUM with SQLITE_VACUUM=1
+    database.optimize(new_engine)
+    log(f"Optimized transformed_data.sqlite{' (vacuumed)' if database.vacuum_after_load else ''}", "info")
 
 
 if __name__ == "__main__":
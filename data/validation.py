@@ -0,0 +1,227 @@
+# declarative data-quality rules for the extracted and transformed tables
+# the rules of a table are checked on every chunk while it passes through the extraction or transformation anyway, as
+# vectorized masks over the whole chunk, so validation never reads the data a second time. Rows breaking a rule are
+# moved to <table>_quarantine together with the name of the (first) rule they broke, sentinels (codes that mean
+# "unknown") only replace the value with <NA> and keep the row
+#
+# the rules use the names of the transformed columns, the extraction maps them to the raw DWD names (raw_columns)
+#
+# example:
+#   validator = Validator("wind_data", references={"stations": station_ids})
+#   valid, rejected = validator.check(data_frame)    # counts: validator.counts, {"speed:range": 3, ...}
+
+import abc
+from collections import Counter
+from dataclasses import dataclass
+from typing import ClassVar
+
+import numpy
+import pandas
+import sqlalchemy
+
+import schema
+from profiling import run_id
+
+# Columns added to the quarantined rows
+rule_column: str = "rule"
+run_column: str = "run"
+
+
+@dataclass(frozen=True)
+class Rule(abc.ABC):
+    column: str
+
+    kind: ClassVar[str] = ""
+    rejects: ClassVar[bool] = True  # False replaces the value with <NA> instead of quarantining the row
+
+    @property
+    def name(self) -> str:
+        return f"{self.column}:{self.kind}"
+
+    @abc.abstractmethod
+    def violations(self, values: pandas.Series, references: dict[str, numpy.ndarray]) -> numpy.ndarray:
+        # True for every value breaking the rule
+        ...
+
+
+@dataclass(frozen=True)
+class NotNull(Rule):
+    kind: ClassVar[str] = "not_null"
+
+    def violations(self, values: pandas.Series, references: dict[str, numpy.ndarray]) -> numpy.ndarray:
+        return values.isna().to_numpy()
+
+
+@dataclass(frozen=True)
+class Range(Rule):
+    # Inclusive bounds, missing values are left to NotNull
+    minimum: float | None = None
+    maximum: float | None = None
+
+    kind: ClassVar[str] = "range"
+
+    def violations(self, values: pandas.Series, references: dict[str, numpy.ndarray]) -> numpy.ndarray:
+        violated = numpy.zeros(len(values), dtype=bool)
+        if self.minimum is not None:
+            violated |= (values < self.minimum).to_numpy(dtype=bool, na_value=False)
+        if self.maximum is not None:
+            violated |= (values > self.maximum).to_numpy(dtype=bool, na_value=False)
+        return violated
+
+
+@dataclass(frozen=True)
+class Sentinel(Rule):
+    # Codes for "unknown", e.g. the precipitation form 4 (not known although precipitation was reported)
+    values: tuple = ()
+
+    kind: ClassVar[str] = "sentinel"
+    rejects: ClassVar[bool] = False
+
+    def violations(self, values: pandas.Series, references: dict[str, numpy.ndarray]) -> numpy.ndarray:
+        return values.isin(self.values).to_numpy(dtype=bool, na_value=False)
+
+
+@dataclass(frozen=True)
+class Regex(Rule):
+    # The whole value has to match, numbers are matched by their decimal representation
+    pattern: str = ""
+
+    kind: ClassVar[str] = "regex"
+
+    def violations(self, values: pandas.Series, references: dict[str, numpy.ndarray]) -> numpy.ndarray:
+        matches = values.astype("string").str.fullmatch(self.pattern)
+        return (~matches).to_numpy(dtype=bool, na_value=False)
+
+
+@dataclass(frozen=True)
+class Reference(Rule):
+    # The value has to exist in a reference table (e.g. the station ids of the station lists), the rule is skipped
+    # while the reference is not known
+    table: str = "stations"
+
+    kind: ClassVar[str] = "reference"
+
+    def violations(self, values: pandas.Series, references: dict[str, numpy.ndarray]) -> numpy.ndarray:
+        present = values.notna().to_numpy()
+        known = numpy.isin(values.to_numpy(dtype="float64", na_value=numpy.nan), references[self.table])
+        return present & ~known
+
+
+def weather_rules(*value_rules: Rule) -> list[Rule]:
+    return [NotNull("station_id"), NotNull("date"), Reference("station_id", "stations"), *value_rules]
+
+
+# Plausible values in Germany (records: -45.9 to 42.6 degrees, 312 mm rain in a day)
+rules: dict[str, list[Rule]] = {
+    "rain_data": weather_rules(
+        Range("rain", 0, 500),
+        Sentinel("rain_form", (4, 9)),  # not known although precipitation reported, not detectable automatically
+        Range("rain_form", 0, 9),
+        Range("snow_height", 0, 1500),
+        Range("new_snow_height", 0, 500),
+    ),
+    "cloud_data": weather_rules(
+        Sentinel("cloud_cover", (-1,)),  # sky not visible (fog)
+        Range("cloud_cover", 0, 8),      # eighths
+    ),
+    "temperature_data": weather_rules(
+        Range("temperature", -60, 50),
+        Range("humidity", 0, 100),
+    ),
+    "wind_data": weather_rules(
+        Range("direction", 0, 360),
+        Range("speed", 0, 12),
+    ),
+    "station_data": [
+        NotNull("station_id"),
+        Range("latitude", 47, 55.5),
+        Range("longitude", 5.5, 15.5),
+        Regex("von_datum", r"(18|19|20)\d\d(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])"),
+        Regex("bis_datum", r"(18|19|20)\d\d(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])"),
+    ],
+}
+
+
+def raw_columns(table_name: str) -> dict[str, str]:
+    # Transformed column name to the raw column name of the extracted DWD tables
+    if table_name not in schema.raw_weather_dtypes:
+        return {}
+    return dict(zip(schema.weather_dtypes[table_name], schema.raw_weather_dtypes[table_name]))
+
+
+def quarantine_table(table_name: str) -> str:
+    return f"{table_name}_quarantine"
+
+
+def station_references(engine: sqlalchemy.Engine, table_name: str = "station_data") -> dict[str, numpy.ndarray]:
+    # The ids of the extracted station lists, nothing before they are extracted (the reference rules are skipped then)
+    if not sqlalchemy.inspect(engine).has_table(table_name):
+        return {}
+    with engine.connect() as connection:
+        station_ids = [row[0] for row in connection.exec_driver_sql(f'SELECT DISTINCT station_id FROM "{table_name}"')]
+    return {"stations": numpy.array(station_ids, dtype="float64")}
+
+
+class Validator:
+    def __init__(self, table_name: str, table_rules: list[Rule] | None = None,
+                 references: dict[str, numpy.ndarray] | None = None, columns: dict[str, str] | None = None):
+        # columns maps the column names of the rules to the names in the checked frames
+        self.table_name: str = table_name
+        self.references: dict[str, numpy.ndarray] = references or {}
+        self.columns: dict[str, str] = columns or {}
+        table_rules = rules.get(table_name, []) if table_rules is None else table_rules
+
+        self.rules: list[Rule] = [rule for rule in table_rules
+                                  if not isinstance(rule, Reference) or rule.table in self.references]
+        self.skipped: list[Rule] = [rule for rule in table_rules if rule not in self.rules]
+        self.counts: Counter = Counter()
+        self.rows: int = 0
+        self.rejected: int = 0
+
+    def check(self, data_frame: pandas.DataFrame) -> tuple[pandas.DataFrame, pandas.DataFrame]:
+        # The valid rows (with sentinels replaced) and the rejected rows with the rule they broke
+        rejected = numpy.zeros(len(data_frame), dtype=bool)
+        broken = numpy.full(len(data_frame), None, dtype=object)
+        replaced: dict[str, pandas.Series] = {}
+
+        for rule in self.rules:
+            column: str = self.columns.get(rule.column, rule.column)
+            if column not in data_frame.columns:
+                continue
+            values: pandas.Series = replaced.get(column, data_frame[column])
+            violated: numpy.ndarray = rule.violations(values, self.references)
+            count: int = int(violated.sum())
+            if count == 0:
+                continue
+
+            self.counts[rule.name] += count
+            if rule.rejects:
+                broken[violated & ~rejected] = rule.name
+                rejected |= violated
+            else:
+                replaced[column] = values.mask(violated)
+
+        if replaced:
+            data_frame = data_frame.assign(**replaced)
+        self.rows += len(data_frame)
+        if not rejected.any():
+            return data_frame, data_frame.iloc[:0]
+
+        self.rejected += int(rejected.sum())
+        quarantined = data_frame[rejected].assign(**{rule_column: broken[rejected], run_column: run_id})
+        return data_frame[~rejected], quarantined
+
+    def summary(self) -> str:
+        # For the log, e.g. "3 of 1200 rows quarantined (speed:range 2, station_id:reference 1)"
+        counts: str = ", ".join(f"{name} {count}" for name, count in sorted(self.counts.items()))
+        return f"{self.rejected} of {self.rows} rows quarantined" + (f" ({counts})" if counts else "")
+
+
+def drop_quarantine(engine: sqlalchemy.Engine, table_name: str):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{quarantine_table(table_name)}"')
+
+
+def write_quarantine(engine: sqlalchemy.Engine, table_name: str, rejected: pandas.DataFrame):
+    if len(rejected) > 0:
+        schema.for_sqlite(rejected).to_sql(quarantine_table(table_name), engine, if_exists="append", index=False)
@@ -1,16 +1,12 @@
-import pandas
 import sqlalchemy
 
+from ingest import Source, load
+
 
 def main():
     airports_data_src: str = "https://opendata.rhein-kreis-neuss.de/api/v2/catalog/datasets/rhein-kreis-neuss-flughafen-weltweit/exports/csv"
 
-    data_frame = pandas.read_csv(airports_data_src, delimiter=";")
-
-    # print(data_frame)
-
-    engine = sqlalchemy.create_engine("sqlite:///airports.sqlite")
-    data_frame.to_sql("airports", engine, if_exists="replace", index=False, dtype={
+    source = Source(url=airports_data_src, delimiter=";", sql_types={
         "column_1": sqlalchemy.types.INTEGER,   # Lfd. Nummer
         "column_2": sqlalchemy.types.TEXT,      # Name des Flughafens
         "column_3": sqlalchemy.types.TEXT,      # Ort
@@ -26,6 +22,8 @@ def main():
         "geo_punkt": sqlalchemy.types.TEXT,     # geo_punkt
     })
 
+    load(source, "sqlite:///airports.sqlite", "airports")
+
 
 if __name__ == "__main__":
     main()
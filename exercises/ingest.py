@@ -0,0 +1,131 @@
+# shared loader for the exercises: fetch a csv (or a member of a zip archive), parse it in chunks and bulk insert the
+# rows into sqlite, described by a Source instead of writing the read_csv / filter / to_sql flow by hand every time
+#
+# http(s) downloads go through the streaming, resumable downloader of the pipeline (data/http_download.py) into a
+# temporary directory, only the file (or the member of the zip archive) is read into memory. Header and footer lines
+# are cut off the bytes before parsing so the fast C parser can be used (skipfooter only works with the python engine)
+#
+# example:
+#   source = Source(url="https://example.com/data.zip", member="stops.txt", columns=["stop_id", "zone_id"],
+#                   types={"stop_id": "int", "zone_id": "int"}, filters=[lambda df: df["zone_id"] == 2001])
+#   load(source, "sqlite:///gtfs.sqlite", "stops")
+
+import io
+import os
+import sys
+import tempfile
+import urllib.parse
+import zipfile
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+import pandas
+import sqlalchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+
+import http_download  # noqa: E402
+
+# Rows parsed and inserted at once
+chunk_size: int = 100_000
+
+
+@dataclass
+class Source:
+    url: str                                  # http(s) url or local path
+    member: str | None = None                 # file inside the zip archive at url
+    encoding: str = "utf-8"
+    delimiter: str = ","
+    skip_header: int = 0                      # lines before the header (or the data without header)
+    skip_footer: int = 0                      # lines after the data
+    header: bool = True                       # without header the columns are addressed by position
+    columns: list | dict | None = None        # columns to keep, a dict renames them (by name or position)
+    types: dict[str, str] = field(default_factory=dict)    # "str", "int" or "float" by (new) column name
+    filters: list[Callable[[pandas.DataFrame], pandas.Series]] = field(default_factory=list)  # rows to keep
+    dropna: bool = False                      # drop rows with missing values (after the type conversion)
+    sql_types: dict | None = None             # sqlalchemy types of the table columns
+
+
+def read_file(path: str, member: str | None = None) -> bytes:
+    # The raw bytes of the file, of a zip archive only the member is decompressed
+    if member is not None:
+        with zipfile.ZipFile(path, "r") as zip_ref:
+            return zip_ref.read(member)
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def fetch(source: Source) -> bytes:
+    url: str = source.url.strip()
+    if not url.startswith(("http://", "https://")):
+        return read_file(source.url, source.member)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path: str = os.path.join(tmp_dir, os.path.basename(urllib.parse.urlparse(url).path) or "download")
+        http_download.download(url, path)
+        return read_file(path, source.member)
+
+
+def trim_footer(data: bytes, lines: int) -> bytes:
+    # Cut the last lines (ignoring trailing line breaks) off the bytes, the same as skipfooter without the python engine
+    end: int = len(data.rstrip(b"\r\n"))
+    for _ in range(lines):
+        end = data.rfind(b"\n", 0, end)
+        if end < 0:
+            return b""
+    return data[:end + 1] if lines else data
+
+
+def read_chunks(source: Source, data: bytes) -> Iterator[pandas.DataFrame]:
+    columns = source.columns
+    usecols: list | None = list(columns) if columns is not None else None
+
+    # Columns that are converted are read as text first, a malformed value becomes NaN instead of failing the parser
+    renamed: dict = columns if isinstance(columns, dict) else {}
+    original: dict[str, object] = {renamed.get(column, column): column for column in (usecols or [])}
+    dtype: dict = {original.get(column, column): str for column in source.types}
+
+    chunks = pandas.read_csv(
+        io.BytesIO(trim_footer(data, source.skip_footer)),
+        sep=source.delimiter,
+        encoding=source.encoding,
+        skiprows=source.skip_header,
+        header=0 if source.header else None,
+        usecols=usecols,
+        dtype=dtype or None,
+        chunksize=chunk_size,
+    )
+    for data_frame in chunks:
+        if renamed:
+            data_frame = data_frame.rename(columns=renamed)[list(renamed.values())]
+        yield transform(source, data_frame)
+
+
+def transform(source: Source, data_frame: pandas.DataFrame) -> pandas.DataFrame:
+    for column, kind in source.types.items():
+        if kind == "str":
+            continue
+        values = pandas.to_numeric(data_frame[column], errors="coerce")
+        # Fractions in an integer column are invalid values like anything else that isn't a number
+        data_frame[column] = values.where(values % 1 == 0).astype("Int64") if kind == "int" else values.astype("float64")
+
+    if source.dropna:
+        data_frame = data_frame.dropna()
+    for predicate in source.filters:
+        data_frame = data_frame[predicate(data_frame).fillna(False).astype(bool)]
+    return data_frame
+
+
+def load(source: Source, db_uri: str, table_name: str) -> int:
+    # Replaces the table, all chunks are inserted in one transaction, returns the number of rows
+    engine = sqlalchemy.create_engine(db_uri)
+    rows: int = 0
+    try:
+        with engine.begin() as connection:
+            for index, data_frame in enumerate(read_chunks(source, fetch(source))):
+                data_frame.to_sql(table_name, connection, if_exists="replace" if index == 0 else "append", index=False,
+                                  dtype=source.sql_types)
+                rows += len(data_frame)
+    finally:
+        engine.dispose()
+    return rows